@@ -35,7 +35,9 @@ interface InterfaceUsage {
 }
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL;
-
+// The 24-hour chart asks for 5-minute buckets (288 points), not raw samples
+const HISTORY_WINDOW_SECONDS = 24 * 60 * 60;
+const HISTORY_STEP_SECONDS = 300;
 
 const socket = io(BACKEND_URL); 
 
@@ -73,7 +75,8 @@ export function BandwidthMonitor() {
   useEffect(() => {
     const fetchHistory = async () => {
       try {
-        const response = await fetch(`${BACKEND_URL}/api/bandwidth/history`);
+        const since = Math.floor(Date.now() / 1000) - HISTORY_WINDOW_SECONDS;
+        const response = await fetch(`${BACKEND_URL}/api/bandwidth/history?since=${since}&step=${HISTORY_STEP_SECONDS}`);
         if (!response.ok) return;
         const data = await response.json();
         setHistoryData(data);
@@ -122,9 +125,19 @@ export function BandwidthMonitor() {
       });
     };
     
+    // The backend only pushes updates to sockets subscribed to its bandwidth room.
+    const handleConnect = () => {
+      socket.emit('start_bandwidth_monitor');
+    };
+
+    socket.on('connect', handleConnect);
     socket.on('bandwidth_update', handleBandwidthUpdate);
+    if (isMonitoring && socket.connected) {
+      handleConnect();
+    }
 
     return () => {
+      socket.off('connect', handleConnect);
       socket.off('bandwidth_update', handleBandwidthUpdate);
       socket.disconnect();
     };
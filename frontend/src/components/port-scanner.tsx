@@ -45,7 +45,7 @@ interface PortResult {
 // Interface for general scan updates from backend
 // Backend emits different data based on 'status' field, so this is a union type
 interface ScanUpdateData {
-  status: 'info' | 'progress' | 'open_port' | 'port_status' | 'error' | 'stopped' | 'complete';
+  status: 'info' | 'progress' | 'open_port' | 'port_status' | 'host_up' | 'host_complete' | 'scan_diff' | 'error' | 'stopped' | 'complete';
   message?: string; // For info, error, stopped, complete
   progress?: number; // For progress updates
   port?: number; // For open_port, port_status
@@ -53,7 +53,26 @@ interface ScanUpdateData {
   service?: string; // For open_port
   ip?: string; // For open_port, port_status
   details?: string; // For open_port (e.g., service and version)
+  latency_ms?: number; // For host_up
+  opened?: number[]; // For scan_diff
+  closed?: number[]; // For scan_diff
+  first_scan?: boolean; // For scan_diff
 }
+
+// One line per host event or change since the previous scan of that host
+const describeScanDiff = (data: ScanUpdateData) => {
+  if (data.first_scan) {
+    return `${data.ip}: first scan, ${data.opened?.length ?? 0} open port(s) recorded`;
+  }
+  const changes: string[] = [];
+  if (data.opened?.length) {
+    changes.push(`newly open ${data.opened.join(', ')}`);
+  }
+  if (data.closed?.length) {
+    changes.push(`newly closed ${data.closed.join(', ')}`);
+  }
+  return `${data.ip}: ${changes.length ? changes.join('; ') : 'no changes'} since the previous scan`;
+};
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL;
 
 // 2. Connect to the server. This should be outside the component.
@@ -114,6 +133,7 @@ export function PortScanner() {
   const [totalPortsToScan, setTotalPortsToScan] = useState(0); // To store total ports
   const [openPortsCount, setOpenPortsCount] = useState(0);
   const [scanStartTime, setScanStartTime] = useState(''); // To store scan start time
+  const [scanNotes, setScanNotes] = useState<string[]>([]); // Host progress and changes since the last scan
 
 
   const [selectedCommonPorts, setSelectedCommonPorts] = useState<number[]>([]); // Default to empty
@@ -158,6 +178,7 @@ export function PortScanner() {
     setScanHost('');
     setTotalPortsToScan(0);
     setScanStartTime('');
+    setScanNotes([]);
 
     let portsToScanArray: number[] = [];
     
@@ -252,6 +273,16 @@ export function PortScanner() {
             });
           }
           break;
+        case 'host_up':
+          // Multi-host sweeps report discovery and per-host completion.
+          setScanNotes(prev => [...prev, `${data.ip} is up${data.latency_ms !== undefined ? ` (${data.latency_ms} ms)` : ''}`]);
+          break;
+        case 'host_complete':
+          setScanNotes(prev => [...prev, data.message || `Finished ${data.ip}`]);
+          break;
+        case 'scan_diff':
+          setScanNotes(prev => [...prev, describeScanDiff(data)]);
+          break;
         case 'complete':
           console.log('Scan complete:', data.message);
           setIsScanning(false);
@@ -529,6 +560,14 @@ export function PortScanner() {
                         </div>
                       </div>
 
+                      {scanNotes.length > 0 && (
+                        <ul className="rounded-lg border p-3 space-y-1 text-xs font-mono text-muted-foreground max-h-[120px] overflow-auto">
+                          {scanNotes.map((note, index) => (
+                            <li key={index}>{note}</li>
+                          ))}
+                        </ul>
+                      )}
+
                       <div className="rounded-lg border overflow-auto max-h-[500px]"> 
                         <Table>
                           <TableHeader className="sticky top-0 bg-card z-10">
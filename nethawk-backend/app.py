@@ -19,118 +19,48 @@ from flask_cors import CORS
 from flask_socketio import SocketIO, emit 
 from config import Config
 import time
-import psutil
-from threading import Thread, Event, Lock 
+from threading import Lock 
 import datetime
 
-from routes.port_scanner import run_port_scan, ip_add_pattern, parse_ports_string
+from routes.port_scanner import run_port_scan
+from core.scan_jobs import ScanJobManager
+from core.targets import discover_hosts, parse_targets
 
-from core.latency import latency_settings, measure_latency
 from metrics_store import metrics_store
+from routes.bandwidth import bandwidth_sampler, clear_bandwidth_session, register_bandwidth_socket_events
+from routes.schedules import scan_scheduler
 
 from routes.ftp import ftp_bp
-from routes.mail_checker import mail_bp, register_mail_socket_events
+from routes.mail_checker import mail_bp, register_mail_socket_events, clear_session_connection
 
 frontend_origin = os.getenv("FRONTEND_URL", "http://localhost:5173")
 socketio = SocketIO(cors_allowed_origins=[frontend_origin])
 
-bandwidth_thread = None
-bandwidth_stop_event = Event()      
-
 ftp_clients = {}
 ftp_clients_lock = Lock()
 
-scan_thread = None
-scan_stop_event = Event() 
+try:
+    SCAN_WORKERS = max(1, int(os.getenv("NETHAWK_SCAN_WORKERS", "2")))
+except ValueError:
+    SCAN_WORKERS = 2
+SCHEDULER_OWNER = "scheduler"
+# Interactive scans go ahead of scheduled ones in the job queue.
+SCHEDULED_PRIORITY = -10
+# Clients may only lower their own scans' priority, never jump ahead of
+# another client's default (0) or fall behind scheduled scans.
+CLIENT_PRIORITY_RANGE = (SCHEDULED_PRIORITY + 1, 0)
 
 mail_checker_clients = {} 
 mail_checker_clients_lock = Lock() 
 
-def bandwidth_monitor_task():
-    """
-    A background task that continuously emits bandwidth usage.
-    Runs in an Eventlet-patched Thread.
-    """
-    _last, _last_t = psutil.net_io_counters(), time.time()
-    _last_pernic = psutil.net_io_counters(pernic=True)
-
-    with app.app_context():
-        logger.info("Bandwidth monitor task started inside app context.")
-        while not bandwidth_stop_event.is_set():
-            try:
-                socketio.sleep(2)
-
-                now = time.time()
-                cur = psutil.net_io_counters()
-                elapsed = now - _last_t or 1
-
-                sent_bps = (cur.bytes_sent - _last.bytes_sent) / elapsed
-                recv_bps = (cur.bytes_recv - _last.bytes_recv) / elapsed
-
-                upload_mbps = round((sent_bps * 8) / (1024 * 1024), 2)
-                download_mbps = round((recv_bps * 8) / (1024 * 1024), 2)
-
-                settings = metrics_store.get_settings()
-                target, port = latency_settings(settings)
-                latency = measure_latency(target=target, port=port, timeout=0.75)
-                ping_ms = latency["latency_ms"] if latency["latency_ms"] is not None else -1
-
-                _last, _last_t = cur, now
-
-                timestamp = time.strftime("%H:%M:%S", time.localtime(now))
-
-                bandwidth_data = {
-                    "timestamp": timestamp,
-                    "ts": int(now),
-                    "upload": upload_mbps,
-                    "download": download_mbps,
-                    "ping": ping_ms,
-                    "latency": latency
-                }
-
-                socketio.emit('bandwidth_update', bandwidth_data)
-                metrics_store.add_bandwidth_point(bandwidth_data)
-
-                current_pernic = psutil.net_io_counters(pernic=True)
-                interface_usage = []
-                for name, cur_stats in current_pernic.items():
-                    prev_stats = _last_pernic.get(name)
-                    if not prev_stats:
-                        continue
-                    sent_bps = (cur_stats.bytes_sent - prev_stats.bytes_sent) / elapsed
-                    recv_bps = (cur_stats.bytes_recv - prev_stats.bytes_recv) / elapsed
-                    upload_mbps = round((sent_bps * 8) / (1024 * 1024), 2)
-                    download_mbps = round((recv_bps * 8) / (1024 * 1024), 2)
-                    total_mbps = round(upload_mbps + download_mbps, 2)
-                    interface_usage.append({
-                        "name": name,
-                        "upload": upload_mbps,
-                        "download": download_mbps,
-                        "total": total_mbps
-                    })
-                interface_usage.sort(key=lambda item: item["total"], reverse=True)
-                metrics_store.set_interface_snapshot(interface_usage)
-                _last_pernic = current_pernic
-
-            except Exception as e:
-                logger.error(f"Error in bandwidth_monitor_task: {e}", exc_info=True)
-                socketio.sleep(1)
-        logger.info("Bandwidth monitor task stopped.")
-
 @socketio.on('connect')
 def handle_connect():
-    global bandwidth_thread
     logger.info(f'--- DEBUG: handle_connect called for SID: {request.sid} ---')
 
     try:
-        if bandwidth_thread is None or not bandwidth_thread.is_alive():
-            bandwidth_stop_event.clear()
-            bandwidth_thread = Thread(target=bandwidth_monitor_task)
-            bandwidth_thread.start()
-        else:
-            logger.info("--- DEBUG: Bandwidth task already running for this server instance. ---")
+        bandwidth_sampler.start(socketio)
     except Exception as e:
-        logger.critical(f"--- CRITICAL ERROR: Failed to start bandwidth thread in handle_connect: {e}", exc_info=True)
+        logger.critical(f"--- CRITICAL ERROR: Failed to start bandwidth sampler in handle_connect: {e}", exc_info=True)
 
     emit('my_response', {'data': f'Connected to backend! Your SID: {request.sid}'}, room=request.sid)
     logger.info(f'--- DEBUG: handle_connect finished for SID: {request.sid} ---')
@@ -139,6 +69,11 @@ def handle_connect():
 def handle_disconnect():
     logger.info(f'Client {request.sid} disconnected')
     sid = request.sid
+    clear_bandwidth_session(sid)
+    clear_session_connection(sid)
+    cancelled = scan_jobs.cancel_owner(sid)
+    if cancelled:
+        logger.info(f"Cancelled {cancelled} scan job(s) for disconnected SID {sid}")
     with ftp_clients_lock:
         if sid in ftp_clients and ftp_clients[sid].get('ftp_instance'):
             try:
@@ -161,91 +96,203 @@ def handle_disconnect():
                     del mail_checker_clients[sid]
     logger.info(f"Client disconnected: {sid}")
 
-def port_scan_task_wrapper(host, ports_str, sid):
+def port_scan_task_wrapper(job):
     """
-    Wrapper for run_port_scan to integrate with SocketIO and stop event.
-    Runs in an Eventlet-patched Thread.
+    Runs one scan job from the job manager and streams its updates to the
+    owning client. Runs in an Eventlet-patched Thread.
+    Returns the job's final status.
     """
-    global scan_stop_event
+    host, ports_str, sid = job.host, job.ports, job.owner
+    status = "completed"
+    open_by_host = {}
+    scheduled = job.schedule is not None
 
     with app.app_context():
-        open_ports = []
         try:
-            logger.info(f"Port scan task started for {host}:{ports_str} (SID: {sid})") 
-            for update in run_port_scan(host, ports_str, scan_stop_event):
-                if scan_stop_event.is_set() and update['status'] not in ['complete', 'error', 'stopped']:
-                    logger.info(f"Scan for {host} (SID: {sid}) signaled to stop by event. Exiting wrapper loop.") 
+            logger.info(f"Port scan job {job.id} started for {host}:{ports_str} (SID: {sid})") 
+            hosts = parse_targets(host)
+            if len(hosts) > 1:
+                hosts = _discover_live_hosts(job, hosts)
+                if job.stop_event.is_set():
+                    socketio.emit('scan_update', {'status': 'stopped', 'message': 'Scan stopped during host discovery.', 'job_id': job.id}, room=sid)
+                    return "stopped"
+                if not hosts:
+                    if not scheduled:
+                        metrics_store.add_activity("scan", f"Port scan completed for {host}: no live hosts", "success", host=host, ports=ports_str, hosts_up=0, job_id=job.id)
+                    socketio.emit('scan_update', {'status': 'complete', 'message': 'No live hosts found.', 'job_id': job.id}, room=sid)
+                    return "completed"
+
+            for update in run_port_scan(hosts, ports_str, job.stop_event):
+                if job.stop_event.is_set() and update['status'] not in ['complete', 'error', 'stopped']:
+                    logger.info(f"Scan job {job.id} for {host} (SID: {sid}) signaled to stop. Exiting wrapper loop.") 
+                    status = "stopped"
                     break
 
                 if update.get("status") == "open_port":
-                    open_ports.append(update.get("port"))
+                    job.open_ports.append(update.get("port"))
+                    open_by_host.setdefault(update.get("ip") or host, []).append(update.get("port"))
+                elif update.get("status") == "stopped":
+                    status = "stopped"
+                elif update.get("status") == "scan_diff" and scheduled:
+                    _alert_scan_change(job, update)
                 elif update.get("status") == "complete":
-                    metrics_store.add_activity(
-                        "scan",
-                        f"Port scan completed for {host}: {len(open_ports)} open port(s)",
-                        "success",
-                        host=host,
-                        ports=ports_str,
-                        open_ports=open_ports,
-                    )
+                    if update.get("partial"):
+                        # The per-host deadline cut the scan short.
+                        status = "partial"
+                        job.message = update.get("message", "")
+                    if not scheduled and len(hosts) == 1:
+                        metrics_store.add_activity(
+                            "scan",
+                            f"Port scan {'timed out' if status == 'partial' else 'completed'} for {host}: {len(job.open_ports)} open port(s)",
+                            "warning" if status == "partial" else "success",
+                            host=host,
+                            ports=ports_str,
+                            open_ports=job.open_ports,
+                            job_id=job.id,
+                        )
+                    elif not scheduled:
+                        _record_multi_host_scan(job, hosts, open_by_host)
                 elif update.get("status") == "error":
+                    status = "failed"
+                    job.message = update.get('message', 'unknown error')
                     metrics_store.add_activity(
                         "scan",
                         f"Port scan failed for {host}: {update.get('message', 'unknown error')}",
                         "error",
                         host=host,
                         ports=ports_str,
+                        job_id=job.id,
                     )
 
-                socketio.emit('scan_update', update, room=sid)
+                socketio.emit('scan_update', {**update, 'job_id': job.id}, room=sid)
                 socketio.sleep(0.01)
 
         except Exception as e:
-            logger.error(f"Error in port scan task for SID {sid}: {e}", exc_info=True) 
+            logger.error(f"Error in port scan job {job.id} for SID {sid}: {e}", exc_info=True) 
+            status = "failed"
+            job.message = str(e)
             metrics_store.add_activity(
                 "scan",
                 f"Port scan failed for {host}: {str(e)}",
                 "error",
                 host=host,
                 ports=ports_str,
+                job_id=job.id,
             )
-            socketio.emit('scan_update', {'status': 'error', 'message': f"An internal server error occurred during scan: {str(e)}"}, room=sid)
+            socketio.emit('scan_update', {'status': 'error', 'message': f"An internal server error occurred during scan: {str(e)}", 'job_id': job.id}, room=sid)
         finally:
-            logger.info(f"Port scan task for SID {sid} finished/stopped. Clearing stop event.") 
-            scan_stop_event.clear()
-            global scan_thread
-            scan_thread = None
+            logger.info(f"Port scan job {job.id} for SID {sid} finished with status {status}.") 
+    return status
+
+
+def _discover_live_hosts(job, hosts):
+    """
+    Host discovery phase for multi-host jobs. Reports each live host as it
+    is found; the port scan starts once discovery has finished.
+    """
+    sid = job.owner
+    socketio.emit('scan_update', {'status': 'info', 'message': f'Discovering live hosts among {len(hosts)} address(es)...', 'job_id': job.id}, room=sid)
+    live = []
+    checked = 0
+    for result in discover_hosts(hosts):
+        checked += 1
+        if result["up"]:
+            live.append(result["host"])
+            socketio.emit('scan_update', {'status': 'host_up', 'ip': result["host"], 'latency_ms': result["latency_ms"], 'job_id': job.id}, room=sid)
+        if job.stop_event.is_set():
+            break
+        socketio.sleep(0)
+    socketio.emit('scan_update', {'status': 'info', 'message': f'Host discovery finished: {len(live)} of {checked} host(s) up.', 'hosts_up': len(live), 'job_id': job.id}, room=sid)
+    return live
+
+
+def _alert_scan_change(job, update):
+    """Scheduled scans only leave a trace when a host's open ports change."""
+    if update.get("first_scan") or not (update.get("opened") or update.get("closed")):
+        return
+    changes = []
+    if update["opened"]:
+        changes.append(f"opened {', '.join(str(port) for port in update['opened'])}")
+    if update["closed"]:
+        changes.append(f"closed {', '.join(str(port) for port in update['closed'])}")
+    message = f"Scheduled scan {job.schedule}: {update.get('ip')} {'; '.join(changes)}"
+    metrics_store.add_activity(
+        "alert",
+        message,
+        "warning",
+        alert_type="scan_change",
+        host=update.get("ip"),
+        opened=update["opened"],
+        closed=update["closed"],
+        schedule=job.schedule,
+        job_id=job.id,
+    )
+    socketio.emit('scan_change', {
+        'message': message,
+        'ip': update.get('ip'),
+        'opened': update['opened'],
+        'closed': update['closed'],
+        'schedule': job.schedule,
+        'job_id': job.id,
+    })
+
+
+def _submit_scheduled_scan(scan):
+    return scan_jobs.submit(SCHEDULER_OWNER, scan.target, scan.ports, priority=SCHEDULED_PRIORITY, schedule=scan.id)
+
+
+def _record_multi_host_scan(job, hosts, open_by_host):
+    # One activity per host with findings keeps "latest scan for a host"
+    # lookups (Network Doctor) meaningful, plus one sweep summary.
+    for ip, ports in open_by_host.items():
+        metrics_store.add_activity(
+            "scan",
+            f"Port scan completed for {ip}: {len(ports)} open port(s)",
+            "success",
+            host=ip,
+            ports=job.ports,
+            open_ports=sorted(ports),
+            job_id=job.id,
+        )
+    metrics_store.add_activity(
+        "scan",
+        f"Network sweep completed for {job.host}: {len(hosts)} live host(s), {len(open_by_host)} with open ports",
+        "success",
+        host=job.host,
+        ports=job.ports,
+        hosts_up=len(hosts),
+        job_id=job.id,
+    )
+
+
+scan_jobs = ScanJobManager(runner=port_scan_task_wrapper, max_workers=SCAN_WORKERS)
+
 
 @socketio.on('start_port_scan')
 def handle_start_port_scan(data):
-    global scan_thread
-    global scan_stop_event
-
-    host = data.get('host')
+    host = (data.get('host') or '').strip()
     ports_str = data.get('ports')
+    if not host:
+        # An empty target sweeps the configured local range.
+        host = str(metrics_store.get_settings().get("network", {}).get("default_range", "")).strip()
 
     if not host or not ports_str:
         metrics_store.add_activity("scan", "Port scan rejected: missing host or ports", "error")
         emit('scan_update', {'status': 'error', 'message': 'Host and ports are required.'}, room=request.sid)
         return
 
-    if not ip_add_pattern.search(host):
+    try:
+        parse_targets(host)
+    except ValueError as e:
         metrics_store.add_activity("scan", f"Port scan rejected: invalid host {host}", "error", host=host)
-        emit('scan_update', {'status': 'error', 'message': 'Invalid IP address format.'}, room=request.sid)
+        emit('scan_update', {'status': 'error', 'message': str(e)}, room=request.sid)
         return
 
-    if scan_thread and scan_thread.is_alive():
-        logger.info(f"Existing scan (for SID: {request.sid}) is running. Signalling it to stop before starting a new one.") 
-        scan_stop_event.set()
-        socketio.sleep(1)
-
-        if scan_thread.is_alive():
-            logger.warning(f"Previous scan thread did not terminate in time. Proceeding, but may cause issues.") 
-
-        scan_stop_event.clear()
-        logger.info("Previous scan stop event cleared, proceeding with new scan.") 
-    else:
-        scan_stop_event.clear()
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError, OverflowError):
+        priority = 0
+    priority = max(CLIENT_PRIORITY_RANGE[0], min(priority, CLIENT_PRIORITY_RANGE[1]))
 
     logger.info(f"Received new scan request from SID {request.sid} for {host} on ports: {ports_str}") 
     metrics_store.add_activity(
@@ -256,21 +303,44 @@ def handle_start_port_scan(data):
         ports=ports_str,
     )
 
-    scan_thread = Thread(target=port_scan_task_wrapper, args=(host, ports_str, request.sid))
-    scan_thread.start()
-    emit('scan_update', {'status': 'info', 'message': f'Scan initiated for {host} on ports: {ports_str}. Updates will follow.'}, room=request.sid)
+    job = scan_jobs.submit(request.sid, host, ports_str, priority=priority)
+    position = scan_jobs.queue_position(job.id)
+    if position:
+        message = f'Scan queued for {host} on ports: {ports_str} (position {position}).'
+    else:
+        message = f'Scan initiated for {host} on ports: {ports_str}. Updates will follow.'
+    emit('scan_update', {'status': 'info', 'message': message, 'job_id': job.id, 'queue_position': position}, room=request.sid)
 
 @socketio.on('stop_port_scan')
-def handle_stop_port_scan():
-    global scan_thread
-    global scan_stop_event
-
-    if scan_thread and scan_thread.is_alive():
-        logger.info(f"Stop request received from SID {request.sid}. Signalling scan to stop.") 
-        scan_stop_event.set()
-        emit('scan_update', {'status': 'info', 'message': 'Scan stop request received. Waiting for termination...'}, room=request.sid)
+def handle_stop_port_scan(data=None):
+    sid = request.sid
+    job_id = (data or {}).get('job_id') if isinstance(data, dict) else None
+
+    if job_id:
+        stopped = 1 if scan_jobs.cancel(job_id, owner=sid) else 0
+    else:
+        stopped = scan_jobs.cancel_owner(sid)
+
+    if stopped:
+        logger.info(f"Stop request received from SID {sid}. Signalled {stopped} scan job(s) to stop.") 
+        emit('scan_update', {'status': 'info', 'message': 'Scan stop request received. Waiting for termination...', 'job_id': job_id}, room=sid)
     else:
-        emit('scan_update', {'status': 'info', 'message': 'No active scan to stop.'}, room=request.sid)
+        emit('scan_update', {'status': 'info', 'message': 'No active scan to stop.', 'job_id': job_id}, room=sid)
+
+@socketio.on('scan_status')
+def handle_scan_status(data=None):
+    """Reports the caller's scan jobs (or one job) plus pool usage."""
+    sid = request.sid
+    job_id = (data or {}).get('job_id') if isinstance(data, dict) else None
+    jobs = scan_jobs.jobs(owner=sid)
+    if job_id:
+        jobs = [job for job in jobs if job.id == job_id]
+    payload = []
+    for job in jobs:
+        item = job.to_dict()
+        item['queue_position'] = scan_jobs.queue_position(job.id)
+        payload.append(item)
+    emit('scan_jobs', {'jobs': payload, **scan_jobs.counts()}, room=sid)
 
 @socketio.on('ftp_connect')
 def handle_ftp_connect(data):
@@ -474,12 +544,13 @@ def create_app():
     try:
         from routes.overview import ov_bp
         from routes.ftp import ftp_bp
-        from routes.mail_checker import mail_bp, register_mail_socket_events
+        from routes.mail_checker import mail_bp, register_mail_socket_events, clear_session_connection
         from routes.bandwidth_api import bandwidth_api_bp
         from routes.settings import settings_bp
         from routes.notifications import notifications_bp
         from routes.health import health_bp
         from routes.doctor import doctor_bp
+        from routes.schedules import schedules_bp
 
         app.register_blueprint(ov_bp, url_prefix="/api/overview")
         app.register_blueprint(ftp_bp, url_prefix="/ftp")
@@ -489,10 +560,14 @@ def create_app():
         app.register_blueprint(notifications_bp, url_prefix="/api/notifications")
         app.register_blueprint(health_bp, url_prefix="/api")
         app.register_blueprint(doctor_bp, url_prefix="/api")
+        app.register_blueprint(schedules_bp, url_prefix="/api/schedules")
         logger.info("Blueprints registered successfully.")
 
         register_mail_socket_events(socketio)
+        register_bandwidth_socket_events(socketio)
         metrics_store.add_activity("system", "NetHawk backend started", "success")
+        if os.getenv("NETHAWK_SCHEDULER", "1") != "0":
+            scan_scheduler.start(_submit_scheduled_scan)
 
     except ImportError as e:
         logger.error(f"Warning: Could not import one or more blueprints: {e}. API routes might not be available.")
@@ -0,0 +1,241 @@
+import asyncio
+import errno
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Iterator
+
+from core.fingerprint import grab_banner
+from core.port_scan import label_for_port, risk_for_port
+from core.portset import PortSet
+from core.rate_control import RateController
+
+
+INITIAL_CONNECT_TIMEOUT = 1.0
+MIN_CONNECT_TIMEOUT = 0.1
+POLL_SECONDS = 0.25
+BANNER_WORKERS = 32
+# Local resource exhaustion counts as congestion, like a reset.
+CONGESTION_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL, errno.EAGAIN}
+
+
+class RttEstimator:
+    """
+    Smoothed RTT / variance estimate (RFC 6298 style) used to shrink the
+    per-connect timeout once the target has answered a few connects. Until
+    then the initial timeout applies, and it never grows past it.
+    """
+
+    def __init__(self, initial: float = INITIAL_CONNECT_TIMEOUT, minimum: float = MIN_CONNECT_TIMEOUT) -> None:
+        self.initial = initial
+        self.minimum = min(minimum, initial)
+        self.srtt: float | None = None
+        self.rttvar = 0.0
+
+    def update(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+            return
+        self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+        self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            return self.initial
+        return max(self.minimum, min(self.initial, self.srtt + 4 * self.rttvar))
+
+
+async def _connect(address: str, port: int, timeout: float) -> tuple[str, float | None, bool]:
+    """Returns (state, rtt, congested); rtt is None when nothing answered."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except asyncio.TimeoutError:
+        return "filtered", None, False
+    except ConnectionRefusedError:
+        return "closed", loop.time() - started, False
+    except ConnectionResetError:
+        return "filtered", None, True
+    except OSError as exc:
+        return "filtered", None, exc.errno in CONGESTION_ERRNOS
+
+    rtt = loop.time() - started
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return "open", rtt, False
+
+
+async def _scan_port(
+    address: str,
+    port: int,
+    controller: RateController,
+    estimator: RttEstimator,
+    retries: int,
+) -> tuple[int, str]:
+    state = "filtered"
+    # Only silent ports are retried; a refusal is a definite answer.
+    for attempt in range(retries + 1):
+        ticket = await controller.acquire()
+        state, rtt, congested = await _connect(address, port, estimator.timeout())
+        answered = rtt is not None
+        if answered:
+            estimator.update(rtt)
+        # An answer to a retry means an earlier attempt was dropped.
+        await controller.release(ticket, answered, dropped=congested or (answered and attempt > 0))
+        if state != "filtered":
+            break
+    return port, state
+
+
+def _row(port: int, state: str, target: str, info: dict[str, str] | None = None) -> dict[str, Any]:
+    fingerprint = (info or {}).get("service", "")
+    row = {
+        "port": port,
+        "protocol": "TCP",
+        "state": state,
+        "service": label_for_port(port, fingerprint=fingerprint),
+        "risk": risk_for_port(port, fingerprint=fingerprint),
+        "target": target,
+    }
+    if info:
+        row.update({"fingerprint": fingerprint, "product": info.get("product", ""), "banner": info.get("banner", "")})
+    return row
+
+
+def iter_native_scan(
+    targets: str | list[str],
+    ports: PortSet | str,
+    threads: int = 10,
+    timeout: float = 30,
+    retries: int = 3,
+    stop_event: threading.Event | None = None,
+    banner_grab: bool = False,
+    max_pps: int = 0,
+    rate_stats: dict[str, Any] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    TCP connect scan without nmap. Yields one result row per port as it
+    finishes, in completion order. ``targets`` is one host or a list of
+    hosts; all of them share the same pool of connects.
+
+    ``threads`` caps the number of connects in flight; within that cap a
+    RateController adapts the actual concurrency to drops, and ``max_pps``
+    (0 for none) limits connect attempts per second. ``timeout`` is the
+    per-host budget in seconds (like nmap's --host-timeout) and
+    ``retries`` is how often a silent port is re-probed. Each host keeps
+    its own RTT estimate. ``rate_stats``, if given, is filled with the
+    controller's counters when the scan ends. The event loop is driven
+    from this generator in short steps, so callers can consume rows and
+    set ``stop_event`` between them without another thread.
+
+    With ``banner_grab`` each open port is handed to a second pool of
+    BANNER_WORKERS that identifies the service (core.fingerprint) while the
+    connect scan carries on; open rows are yielded once identified.
+
+    Raises OSError if a target does not resolve.
+    """
+    hosts = [targets] if isinstance(targets, str) else list(targets)
+    addresses = {
+        host: socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0][4][0]
+        for host in hosts
+    }
+    loop = asyncio.new_event_loop()
+    results: deque[tuple[str, int, str, dict[str, str] | None]] = deque()
+    try:
+        controller = RateController(threads, max_pps)
+        initial = min(INITIAL_CONNECT_TIMEOUT, timeout)
+        estimators = {host: RttEstimator(initial=initial) for host in hosts}
+        deadlines: dict[str, float] = {}
+        port_set = PortSet.coerce(ports)
+        work = ((host, port) for host in hosts for port in port_set)
+        banner_queue: asyncio.Queue = asyncio.Queue()
+
+        async def worker() -> None:
+            for host, port in work:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                # The host budget starts with its first probe; ports left
+                # when it runs out are skipped, not reported.
+                deadline = deadlines.setdefault(host, time.monotonic() + timeout)
+                if time.monotonic() >= deadline:
+                    continue
+                _, state = await _scan_port(addresses[host], port, controller, estimators[host], retries)
+                if state == "open" and banner_grab:
+                    banner_queue.put_nowait((host, port))
+                else:
+                    results.append((host, port, state, None))
+
+        async def identifier() -> None:
+            while (item := await banner_queue.get()) is not None:
+                host, port = item
+                results.append((host, port, "open", await grab_banner(addresses[host], port)))
+
+        async def pipeline() -> None:
+            identifiers = [asyncio.create_task(identifier()) for _ in range(BANNER_WORKERS if banner_grab else 0)]
+            try:
+                await asyncio.gather(*(worker() for _ in range(max(1, threads))))
+                for _ in identifiers:
+                    banner_queue.put_nowait(None)
+                await asyncio.gather(*identifiers)
+            finally:
+                for identifier_task in identifiers:
+                    identifier_task.cancel()
+                await asyncio.gather(*identifiers, return_exceptions=True)
+
+        task = loop.create_task(pipeline())
+        while True:
+            loop.run_until_complete(asyncio.wait([task], timeout=POLL_SECONDS))
+            while results:
+                host, port, state, info = results.popleft()
+                yield _row(port, state, host, info)
+            if task.done():
+                task.result()
+                break
+            if stop_event is not None and stop_event.is_set():
+                task.cancel()
+                loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+                break
+        if rate_stats is not None:
+            rate_stats.update(controller.stats())
+    finally:
+        # A stop, or a caller dropping the generator, can leave connects in
+        # flight (a cancel racing a finished connect is lost in wait_for);
+        # cancel and drain them like asyncio.run() does before closing.
+        pending = asyncio.all_tasks(loop)
+        for pending_task in pending:
+            pending_task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+
+def summarize_rows(rows: list[dict[str, Any]], target: str, threshold: int = 25) -> list[dict[str, Any]]:
+    """
+    Collapses large groups of closed/filtered rows into one summary row per
+    state, the same way nmap reports them as <extraports>, so a full-range
+    scan does not return 65k rows. Open ports are always listed.
+    """
+    by_state: dict[str, list[dict[str, Any]]] = {}
+    for row in rows:
+        if row["state"] != "open":
+            by_state.setdefault(row["state"], []).append(row)
+
+    output = [row for row in rows if row["state"] == "open"]
+    for state, group in by_state.items():
+        if len(group) > threshold:
+            output.append({
+                "port": f"{len(group)} ports",
+                "protocol": "TCP",
+                "state": state,
+                "service": "native summary",
+                "risk": "info",
+                "target": target,
+            })
+        else:
+            output.extend(group)
+    return sorted(output, key=lambda row: (isinstance(row["port"], str), row["port"]))
@@ -1,19 +1,20 @@
 from __future__ import annotations
 
+import threading
+from collections import deque
 from datetime import datetime, timezone
 from typing import Any
 
+from core.diagnosis_rules import (
+    RulePlan,
+    compile_plan,
+    registry_generation,
+    rule_thresholds,
+)
+from core.timeseries import TrendWindows
 
-DEFAULT_THRESHOLDS = {
-    "cpu_warning": 80,
-    "memory_warning": 85,
-    "latency_warning": 150,
-    "upload_warning": 25,
-    "network_warning": 40,
-    "low_network": 5,
-    "many_open_ports": 8,
-    "frequent_alerts": 3,
-}
+
+PROBLEM_STATUSES = {"warning", "critical", "error"}
 
 SEVERITY_RANK = {
     "healthy": 0,
@@ -22,6 +23,26 @@ SEVERITY_RANK = {
     "critical": 3,
 }
 
+# Doctor thresholds that follow the general settings.thresholds values;
+# every other threshold is read from settings.doctor under its own name.
+THRESHOLD_SETTINGS = {
+    "cpu_warning": "cpu",
+    "memory_warning": "memory",
+    "latency_warning": "latency",
+    "network_warning": "bandwidth",
+}
+
+
+# Trend series -> (fact prefix, threshold its sustained duration is measured
+# against). Facts are named like latency_p95 or cpu_sustained.
+TREND_FACTS = {
+    "cpu": ("cpu", "cpu_warning"),
+    "ping": ("latency", "latency_warning"),
+    "upload": ("upload", "upload_warning"),
+    "download": ("download", None),
+}
+TREND_STATS = ("mean", "p95", "slope", "window", "sustained")
+
 
 def _number(value: Any, default: float = 0) -> float:
     try:
@@ -31,34 +52,25 @@ def _number(value: Any, default: float = 0) -> float:
 
 
 def _thresholds(settings: dict[str, Any] | None) -> dict[str, float]:
-    thresholds = dict(DEFAULT_THRESHOLDS)
+    thresholds = rule_thresholds()
     configured = (settings or {}).get("thresholds", {})
     if isinstance(configured, dict):
-        thresholds["cpu_warning"] = _number(configured.get("cpu"), thresholds["cpu_warning"])
-        thresholds["memory_warning"] = _number(configured.get("memory"), thresholds["memory_warning"])
-        thresholds["latency_warning"] = _number(configured.get("latency"), thresholds["latency_warning"])
-        thresholds["network_warning"] = _number(configured.get("bandwidth"), thresholds["network_warning"])
+        for key, setting in THRESHOLD_SETTINGS.items():
+            thresholds[key] = _number(configured.get(setting), thresholds[key])
     doctor = (settings or {}).get("doctor", {})
     if isinstance(doctor, dict):
-        for key in ["upload_warning", "low_network", "many_open_ports", "frequent_alerts"]:
-            thresholds[key] = _number(doctor.get(key), thresholds[key])
+        for key in thresholds:
+            if key not in THRESHOLD_SETTINGS:
+                thresholds[key] = _number(doctor.get(key), thresholds[key])
     return thresholds
 
 
-def _card(
-    severity: str,
-    title: str,
-    possible_cause: str,
-    evidence: list[str],
-    suggested_actions: list[str],
-) -> dict[str, Any]:
-    return {
-        "severity": severity,
-        "title": title,
-        "possible_cause": possible_cause,
-        "evidence": evidence,
-        "suggested_actions": suggested_actions,
-    }
+def disabled_rules(settings: dict[str, Any] | None) -> tuple[str, ...]:
+    doctor = (settings or {}).get("doctor", {})
+    disabled = doctor.get("disabled_rules", ()) if isinstance(doctor, dict) else ()
+    if isinstance(disabled, str):
+        disabled = disabled.split(",")
+    return tuple(sorted({str(rule_id).strip() for rule_id in disabled or () if str(rule_id).strip()}))
 
 
 def _open_ports(scan_result: dict[str, Any] | None) -> list[int]:
@@ -77,13 +89,8 @@ def _open_ports(scan_result: dict[str, Any] | None) -> list[int]:
     return sorted(set(ports))
 
 
-def _recent_problem_events(activities: list[dict[str, Any]] | None) -> list[dict[str, Any]]:
-    problem_statuses = {"warning", "critical", "error"}
-    events = []
-    for activity in activities or []:
-        if str(activity.get("status", "")).lower() in problem_statuses:
-            events.append(activity)
-    return events
+def _is_problem(activity: dict[str, Any]) -> bool:
+    return str(activity.get("status", "")).lower() in PROBLEM_STATUSES
 
 
 def _overall_status(cards: list[dict[str, Any]]) -> str:
@@ -92,17 +99,7 @@ def _overall_status(cards: list[dict[str, Any]]) -> str:
     return max((card["severity"] for card in cards), key=lambda severity: SEVERITY_RANK[severity])
 
 
-def generate_diagnosis(
-    metrics: dict[str, Any],
-    latency: dict[str, Any],
-    activities: list[dict[str, Any]] | None = None,
-    scan_result: dict[str, Any] | None = None,
-    settings: dict[str, Any] | None = None,
-) -> dict[str, Any]:
-    thresholds = _thresholds(settings)
-
-    cpu = _number(metrics.get("cpu"))
-    memory = _number(metrics.get("memory"))
+def _metric_facts(metrics: dict[str, Any], latency: dict[str, Any]) -> dict[str, Any]:
     upload = _number(metrics.get("upload"))
     download = _number(metrics.get("download"))
     network_total = _number(metrics.get("network"), upload + download)
@@ -112,193 +109,231 @@ def generate_diagnosis(
     latency_ms = latency.get("latency_ms")
     latency_value = _number(latency_ms) if latency_ms is not None else None
     latency_status = str(latency.get("status", "unavailable"))
+    return {
+        "cpu": _number(metrics.get("cpu")),
+        "memory": _number(metrics.get("memory")),
+        "upload": upload,
+        "network_total": network_total,
+        "latency_value": latency_value,
+        "latency_status": latency_status,
+        "latency_missing": latency_status == "unavailable" or latency_value is None,
+        "latency_target": str(latency.get("target", "unknown")),
+        "latency_error_text": str(latency.get("error") or "not provided"),
+    }
 
-    high_cpu = cpu >= thresholds["cpu_warning"]
-    high_memory = memory >= thresholds["memory_warning"]
-    high_latency = latency_value is not None and latency_value >= thresholds["latency_warning"]
-    high_upload = upload >= thresholds["upload_warning"]
-    high_network = network_total >= thresholds["network_warning"]
-    low_network = network_total <= thresholds["low_network"]
-    cards: list[dict[str, Any]] = []
-
-    if latency_status == "unavailable" or latency_value is None:
-        cards.append(_card(
-            "warning",
-            "Latency target unavailable",
-            "The target may be unreachable because of DNS failure, firewall rules, or network restrictions.",
-            [
-                f"Latency status is {latency_status}",
-                f"Target is {latency.get('target', 'unknown')}",
-                f"Error: {latency.get('error') or 'not provided'}",
-            ],
-            [
-                "Try a different latency target such as 1.1.1.1 or your router IP",
-                "Check DNS and firewall settings",
-                "Verify the machine has internet access",
-            ],
-        ))
-
-    if high_latency and high_upload:
-        cards.append(_card(
-            "warning",
-            "High latency with heavy upload",
-            "Background upload, cloud sync, or congestion may be increasing response time.",
-            [
-                f"Latency is {latency_value} ms",
-                f"Upload bandwidth is {upload} Mbps",
-                f"CPU usage is {cpu}%",
-            ],
-            [
-                "Pause large uploads or cloud sync",
-                "Check apps consuming network bandwidth",
-                "Restart the router if the issue continues",
-            ],
-        ))
-    elif high_latency and not high_cpu and not high_network:
-        cards.append(_card(
-            "warning",
-            "High latency without local load",
-            "The issue may be outside this machine, such as router, ISP, DNS, or Wi-Fi quality.",
-            [
-                f"Latency is {latency_value} ms",
-                f"CPU usage is normal at {cpu}%",
-                f"Network usage is {network_total} Mbps",
-            ],
-            [
-                "Test latency to your router and a public DNS server",
-                "Switch from Wi-Fi to Ethernet if possible",
-                "Check ISP status or router health",
-            ],
-        ))
-
-    if high_cpu and high_network:
-        cards.append(_card(
-            "warning",
-            "High CPU with heavy network activity",
-            "A local process may be doing heavy transfer work or unexpected background activity.",
-            [
-                f"CPU usage is {cpu}%",
-                f"Total network usage is {network_total} Mbps",
-            ],
-            [
-                "Inspect running processes by CPU and network usage",
-                "Pause downloads, sync tools, or package managers",
-                "Check for unexpected background services",
-            ],
-        ))
-    elif high_cpu and low_network:
-        cards.append(_card(
-            "warning",
-            "Local system bottleneck",
-            "The machine is under CPU pressure, but the network is not busy.",
-            [
-                f"CPU usage is {cpu}%",
-                f"Total network usage is only {network_total} Mbps",
-            ],
-            [
-                "Close CPU-heavy local applications",
-                "Check build tools, browsers, or background jobs",
-                "Retest network after CPU load drops",
-            ],
-        ))
-
-    if high_memory:
-        cards.append(_card(
-            "warning",
-            "Memory pressure detected",
-            "High memory usage can slow local tools and make diagnostics less responsive.",
-            [
-                f"Memory usage is {memory}%",
-            ],
-            [
-                "Close unused applications",
-                "Check memory-heavy browser tabs or services",
-                "Restart long-running local processes if needed",
-            ],
-        ))
 
+def _scan_facts(scan_result: dict[str, Any] | None) -> dict[str, Any]:
+    """Scan facts are absent (None) without a scan, which skips the port rules."""
+    if not scan_result:
+        return dict.fromkeys(
+            ["open_ports", "open_port_count", "open_ports_text", "newly_opened_count", "newly_opened_text", "scan_host"]
+        )
     open_ports = _open_ports(scan_result)
-    if 22 in open_ports:
-        cards.append(_card(
-            "warning",
-            "SSH remote access exposed",
-            "Port 22 is open, so SSH access may be reachable from this network.",
-            [
-                "Port 22 is open in the latest scan",
-            ],
-            [
-                "Confirm SSH is required",
-                "Use key-based authentication and disable password login",
-                "Restrict SSH access with firewall rules",
-            ],
-        ))
-
-    if 3389 in open_ports:
-        cards.append(_card(
-            "critical",
-            "Remote Desktop exposure risk",
-            "Port 3389 is open, which can expose Remote Desktop access.",
-            [
-                "Port 3389 is open in the latest scan",
-            ],
-            [
-                "Disable Remote Desktop if not needed",
-                "Restrict access to trusted IPs",
-                "Use VPN or network-level authentication",
-            ],
-        ))
-
-    if len(open_ports) >= thresholds["many_open_ports"]:
-        cards.append(_card(
-            "warning",
-            "Increased attack surface",
-            "Many open ports increase the number of services that need hardening.",
-            [
-                f"{len(open_ports)} open ports found in the latest scan",
-                f"Open ports: {', '.join(str(port) for port in open_ports)}",
-            ],
-            [
-                "Close services that are not required",
-                "Review firewall rules",
-                "Document why each exposed service must remain open",
-            ],
-        ))
-
-    problem_events = _recent_problem_events(activities)
-    if len(problem_events) >= thresholds["frequent_alerts"]:
-        cards.append(_card(
-            "warning",
-            "Frequent recent alerts",
-            "Repeated warning or error events suggest an unstable system or network condition.",
-            [
-                f"{len(problem_events)} warning/error events found in recent activity",
-            ],
-            [
-                "Review the activity history for repeated patterns",
-                "Check whether alerts happen during a specific workload",
-                "Lower background network and CPU load before retesting",
-            ],
-        ))
-
-    if not cards:
-        cards.append(_card(
-            "healthy",
-            "System and network look healthy",
-            "No rule detected a current bottleneck or exposure from the available data.",
-            [
-                f"CPU usage is {cpu}%",
-                f"Memory usage is {memory}%",
-                f"Latency status is {latency_status}",
-                f"Network usage is {network_total} Mbps",
-            ],
-            [
-                "Continue monitoring",
-                "Run a port scan when you want exposure analysis",
-            ],
-        ))
-
+    scan_diff = scan_result.get("diff") or {}
+    newly_opened = []
+    if not scan_diff.get("first_scan"):
+        newly_opened = [port for port in scan_diff.get("opened", []) if port in open_ports]
     return {
-        "overall_status": _overall_status(cards),
-        "generated_at": datetime.now(timezone.utc).isoformat(),
-        "cards": cards,
+        "open_ports": frozenset(open_ports),
+        "open_port_count": len(open_ports),
+        "open_ports_text": ", ".join(str(port) for port in open_ports),
+        "newly_opened_count": len(newly_opened),
+        "newly_opened_text": ", ".join(str(port) for port in newly_opened),
+        "scan_host": str(scan_result.get("host", "the scanned host")),
     }
+
+
+def _trend_facts(trends: TrendWindows | None, thresholds: dict[str, float]) -> dict[str, Any]:
+    """Windowed facts; absent (None) without trends, which skips the trend rules."""
+    facts = dict.fromkeys(f"{prefix}_{stat}" for prefix, _ in TREND_FACTS.values() for stat in TREND_STATS)
+    if trends is None:
+        return facts
+    limits = {series: thresholds[key] for series, (_, key) in TREND_FACTS.items() if key}
+    for series, stats in trends.summary(limits).items():
+        if series not in TREND_FACTS:
+            continue
+        prefix = TREND_FACTS[series][0]
+        for stat in TREND_STATS:
+            facts[f"{prefix}_{stat}"] = stats.get(stat)
+    return facts
+
+
+def _smooth_instant_facts(facts: dict[str, Any]) -> None:
+    """
+    With a trend window, the load and latency facts read by the single-sample
+    rules (cpu_network, cpu_bottleneck, latency_upload, latency_external)
+    become window means, so one noisy sample neither raises nor clears a
+    card. Latency keeps the latest probe while that probe failed.
+    """
+    if facts["cpu_mean"] is not None:
+        facts["cpu"] = facts["cpu_mean"]
+    if facts["upload_mean"] is not None:
+        facts["upload"] = facts["upload_mean"]
+        facts["network_total"] = round(facts["upload_mean"] + (facts["download_mean"] or 0), 2)
+    if facts["latency_mean"] is not None and not facts["latency_missing"]:
+        facts["latency_value"] = facts["latency_mean"]
+
+
+class DiagnosisEngine:
+    """
+    Diagnosis state kept between calls, for callers that diagnose the same
+    machine over and over (the doctor route, the TUI refresh loop).
+
+    Rules come from the core.diagnosis_rules registry, compiled into a plan
+    for the rules enabled in settings (``doctor.disabled_rules``).
+    Thresholds are parsed once per settings snapshot. The problem-event
+    count follows the activity window incrementally: only activities newer
+    than the previous call are classified. Windowed trend facts (rolling
+    mean, p95, slope and sustained time above threshold) are read from a
+    core.timeseries.TrendWindows kept up to date by the sampler, so they
+    never scan history; when a window has samples, the single-sample CPU,
+    upload, network and latency facts are replaced by their window means.
+    Each call compares the new facts
+    with the previous ones and re-evaluates only the rules that read a
+    changed fact or threshold; when none did, the previous cards are
+    returned as they were, with a fresh ``generated_at``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._settings: dict[str, Any] | None = None
+        self._settings_key: tuple | None = None
+        self._thresholds: dict[str, float] = {}
+        self._disabled: tuple[str, ...] = ()
+        self._plan: RulePlan | None = None
+        self._plan_key: tuple | None = None
+        self._dirty: set[int] = set()
+        self._events: deque[tuple[Any, bool]] = deque()
+        self._problem_count = 0
+        self._scan_key: tuple | None = None
+        self._scan_facts = _scan_facts(None)
+        self._facts: dict[str, Any] | None = None
+        self._cards: list[dict[str, Any] | None] = []
+        self._fallback_card: dict[str, Any] | None = None
+        self._result: tuple[str, list[dict[str, Any]]] | None = None
+        self.rule_runs = 0
+
+    def _load_settings(self, settings: dict[str, Any] | None, version: object) -> None:
+        # metrics_store hands out one read-only snapshot per settings
+        # version, so holding a reference makes its identity a safe key.
+        # Newly registered rules may declare thresholds of their own.
+        key = (version, id(settings), registry_generation())
+        if key != self._settings_key or settings is not self._settings:
+            self._settings, self._settings_key = settings, key
+            self._disabled = disabled_rules(settings)
+            thresholds = _thresholds(settings)
+            if self._plan is not None:
+                for name, value in thresholds.items():
+                    if self._thresholds.get(name) != value:
+                        self._dirty.update(self._plan.by_input.get(name, ()))
+            self._thresholds = thresholds
+        plan_key = (registry_generation(), self._disabled)
+        if plan_key != self._plan_key:
+            self._plan, self._plan_key = compile_plan(self._disabled), plan_key
+            self._cards = [None] * len(self._plan.rules)
+            self._dirty = set(range(len(self._plan.rules)))
+            self._facts = None
+            self._result = None
+
+    def _count_problem_events(self, activities: list[dict[str, Any]] | None) -> int:
+        """
+        Problem events in ``activities`` (newest first). Entries newer than
+        the last call are classified and pushed onto the window, entries
+        that fell out of it are popped; if the window does not line up with
+        the previous one (ids missing, store reset) everything is recounted.
+        """
+        activities = activities or []
+        fresh = None
+        if self._events and self._events[0][0] is not None:
+            newest = self._events[0][0]
+            for index, activity in enumerate(activities):
+                if activity.get("id") == newest:
+                    fresh = activities[:index]
+                    break
+        if fresh is None:
+            self._events.clear()
+            self._problem_count = 0
+            fresh = activities
+        for activity in reversed(fresh):
+            problem = _is_problem(activity)
+            self._events.appendleft((activity.get("id"), problem))
+            self._problem_count += problem
+        while len(self._events) > len(activities):
+            self._problem_count -= self._events.pop()[1]
+        if activities and (len(self._events) != len(activities) or self._events[-1][0] != activities[-1].get("id")):
+            self._events = deque((activity.get("id"), _is_problem(activity)) for activity in activities)
+            self._problem_count = sum(problem for _, problem in self._events)
+        return self._problem_count
+
+    def _scan_facts_for(self, scan_result: dict[str, Any] | None) -> dict[str, Any]:
+        # Store summaries carry the scan time, so one scan is parsed once.
+        key = (scan_result.get("host"), scan_result.get("timestamp")) if scan_result else None
+        if key is None or key[1] is None or key != self._scan_key:
+            self._scan_facts = _scan_facts(scan_result)
+            self._scan_key = key
+        return self._scan_facts
+
+    def diagnose(
+        self,
+        metrics: dict[str, Any],
+        latency: dict[str, Any],
+        activities: list[dict[str, Any]] | None = None,
+        scan_result: dict[str, Any] | None = None,
+        settings: dict[str, Any] | None = None,
+        settings_version: object = None,
+        trends: TrendWindows | None = None,
+    ) -> dict[str, Any]:
+        with self._lock:
+            self._load_settings(settings, settings_version)
+            plan = self._plan
+            facts = {
+                **_metric_facts(metrics, latency),
+                **self._scan_facts_for(scan_result),
+                "problem_events": self._count_problem_events(activities),
+                **_trend_facts(trends, self._thresholds),
+            }
+            _smooth_instant_facts(facts)
+            previous = self._facts
+            if previous is None:
+                changed_facts = set(facts)
+            else:
+                changed_facts = {name for name, value in facts.items() if previous.get(name) != value}
+            self._facts = facts
+            for name in changed_facts:
+                self._dirty.update(plan.by_input.get(name, ()))
+
+            changed = self._result is None
+            for index in sorted(self._dirty):
+                self._cards[index] = plan.rules[index].evaluate(facts, self._thresholds)
+                self.rule_runs += 1
+                changed = True
+            self._dirty.clear()
+
+            fallback = plan.fallback
+            if fallback is not None and (changed or changed_facts.intersection(fallback.inputs)):
+                self._fallback_card = fallback.evaluate(facts, self._thresholds)
+                changed = True
+            if changed:
+                cards = [card for card in self._cards if card is not None]
+                if not cards and self._fallback_card is not None:
+                    cards = [self._fallback_card]
+                self._result = (_overall_status(cards), cards)
+
+            overall_status, cards = self._result
+            return {
+                "overall_status": overall_status,
+                "generated_at": datetime.now(timezone.utc).isoformat(),
+                "cards": list(cards),
+            }
+
+
+def generate_diagnosis(
+    metrics: dict[str, Any],
+    latency: dict[str, Any],
+    activities: list[dict[str, Any]] | None = None,
+    scan_result: dict[str, Any] | None = None,
+    settings: dict[str, Any] | None = None,
+    trends: TrendWindows | None = None,
+) -> dict[str, Any]:
+    """One-off diagnosis; repeated callers should keep a DiagnosisEngine."""
+    return DiagnosisEngine().diagnose(metrics, latency, activities, scan_result, settings, trends=trends)
@@ -0,0 +1,452 @@
+from __future__ import annotations
+
+import operator
+from string import Formatter
+from typing import Any, Callable, Iterable
+
+
+# Thresholds shared by the built-in rules; rules may declare more.
+DEFAULT_THRESHOLDS = {
+    "cpu_warning": 80,
+    "memory_warning": 85,
+    "latency_warning": 150,
+    "upload_warning": 25,
+    "network_warning": 40,
+    "low_network": 5,
+    "many_open_ports": 8,
+    "frequent_alerts": 3,
+}
+
+OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "contains": operator.contains,
+}
+
+
+class Threshold(str):
+    """Marks a condition operand as a threshold name rather than a literal."""
+
+
+class Rule:
+    """
+    One Network Doctor check, described as data.
+
+    ``conditions`` are ``(fact, op, operand)`` triples that must all hold;
+    an operand is a literal or a Threshold. ``evidence`` lines are
+    str.format templates over facts and thresholds. ``inputs`` lists facts
+    the rule needs beyond those it names in conditions and templates; when
+    any input is absent (None) the rule is skipped. ``thresholds`` are
+    defaults for threshold names the rule introduces, overridable from
+    settings.doctor like the built-in ones.
+
+    A ``fallback`` rule only produces its card when no other rule did.
+    """
+
+    def __init__(
+        self,
+        rule_id: str,
+        severity: str,
+        title: str,
+        possible_cause: str,
+        evidence: Iterable[str] = (),
+        suggested_actions: Iterable[str] = (),
+        conditions: Iterable[tuple[str, str, Any]] = (),
+        inputs: Iterable[str] = (),
+        thresholds: dict[str, float] | None = None,
+        fallback: bool = False,
+    ) -> None:
+        self.id = rule_id
+        self.severity = severity
+        self.title = title
+        self.possible_cause = possible_cause
+        self.evidence = tuple(evidence)
+        self.suggested_actions = tuple(suggested_actions)
+        self.conditions = tuple(conditions)
+        self.thresholds = dict(thresholds or {})
+        self.fallback = fallback
+        for _, op, _ in self.conditions:
+            if op not in OPERATORS:
+                raise ValueError(f"Rule {rule_id!r} uses unknown operator {op!r}.")
+
+        fields = {
+            name
+            for template in self.evidence
+            for _, name, _, _ in Formatter().parse(template)
+            if name
+        }
+        self.threshold_inputs = tuple(sorted(
+            {operand for _, _, operand in self.conditions if isinstance(operand, Threshold)}
+            | {name for name in fields if name in self.thresholds or name in DEFAULT_THRESHOLDS}
+        ))
+        self.inputs = tuple(sorted(
+            set(inputs)
+            | {fact for fact, _, _ in self.conditions}
+            | (fields - set(self.threshold_inputs))
+        ))
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "severity": self.severity,
+            "title": self.title,
+            "inputs": list(self.inputs),
+            "thresholds": list(self.threshold_inputs),
+            "fallback": self.fallback,
+        }
+
+
+def _card(rule: Rule, facts: dict[str, Any], thresholds: dict[str, float]) -> dict[str, Any]:
+    values = {**thresholds, **facts}
+    return {
+        "severity": rule.severity,
+        "title": rule.title,
+        "possible_cause": rule.possible_cause,
+        "evidence": [template.format(**values) for template in rule.evidence],
+        "suggested_actions": list(rule.suggested_actions),
+    }
+
+
+class CompiledRule:
+    """A Rule with its conditions resolved to operator functions."""
+
+    __slots__ = ("rule", "inputs", "checks")
+
+    def __init__(self, rule: Rule) -> None:
+        self.rule = rule
+        self.inputs = rule.inputs
+        self.checks = tuple(
+            (fact, OPERATORS[op], operand, isinstance(operand, Threshold))
+            for fact, op, operand in rule.conditions
+        )
+
+    def evaluate(self, facts: dict[str, Any], thresholds: dict[str, float]) -> dict[str, Any] | None:
+        for name in self.inputs:
+            if facts.get(name) is None:
+                return None
+        for fact, check, operand, is_threshold in self.checks:
+            if not check(facts[fact], thresholds[operand] if is_threshold else operand):
+                return None
+        return _card(self.rule, facts, thresholds)
+
+
+class RulePlan:
+    """
+    The enabled rules in registry order, plus an index from each fact and
+    threshold to the rules that read it, so a change to one fact only
+    re-evaluates the rules that depend on it.
+    """
+
+    def __init__(self, rules: list[Rule]) -> None:
+        self.rules = [CompiledRule(rule) for rule in rules if not rule.fallback]
+        fallbacks = [CompiledRule(rule) for rule in rules if rule.fallback]
+        self.fallback = fallbacks[0] if fallbacks else None
+        self.by_input: dict[str, list[int]] = {}
+        for index, compiled in enumerate(self.rules):
+            for name in (*compiled.inputs, *compiled.rule.threshold_inputs):
+                self.by_input.setdefault(name, []).append(index)
+
+
+_REGISTRY: list[Rule] = []
+_generation = 0
+
+
+def register_rule(rule: Rule) -> Rule:
+    """Adds a rule to the registry; cards appear in registration order."""
+    global _generation
+    if any(existing.id == rule.id for existing in _REGISTRY):
+        raise ValueError(f"Diagnosis rule {rule.id!r} is already registered.")
+    _REGISTRY.append(rule)
+    _generation += 1
+    return rule
+
+
+def registered_rules() -> list[Rule]:
+    return list(_REGISTRY)
+
+
+def registry_generation() -> int:
+    return _generation
+
+
+def rule_thresholds() -> dict[str, float]:
+    """DEFAULT_THRESHOLDS plus the defaults declared by registered rules."""
+    defaults: dict[str, float] = dict(DEFAULT_THRESHOLDS)
+    for rule in _REGISTRY:
+        defaults.update(rule.thresholds)
+    return defaults
+
+
+def compile_plan(disabled: Iterable[str] = ()) -> RulePlan:
+    disabled = set(disabled)
+    return RulePlan([rule for rule in _REGISTRY if rule.id not in disabled])
+
+
+register_rule(Rule(
+    "latency_unavailable",
+    "warning",
+    "Latency target unavailable",
+    "The target may be unreachable because of DNS failure, firewall rules, or network restrictions.",
+    evidence=[
+        "Latency status is {latency_status}",
+        "Target is {latency_target}",
+        "Error: {latency_error_text}",
+    ],
+    suggested_actions=[
+        "Try a different latency target such as 1.1.1.1 or your router IP",
+        "Check DNS and firewall settings",
+        "Verify the machine has internet access",
+    ],
+    conditions=[("latency_missing", "==", True)],
+))
+
+register_rule(Rule(
+    "latency_upload",
+    "warning",
+    "High latency with heavy upload",
+    "Background upload, cloud sync, or congestion may be increasing response time.",
+    evidence=[
+        "Latency is {latency_value} ms",
+        "Upload bandwidth is {upload} Mbps",
+        "CPU usage is {cpu}%",
+    ],
+    suggested_actions=[
+        "Pause large uploads or cloud sync",
+        "Check apps consuming network bandwidth",
+        "Restart the router if the issue continues",
+    ],
+    conditions=[
+        ("latency_value", ">=", Threshold("latency_warning")),
+        ("upload", ">=", Threshold("upload_warning")),
+    ],
+))
+
+register_rule(Rule(
+    "latency_external",
+    "warning",
+    "High latency without local load",
+    "The issue may be outside this machine, such as router, ISP, DNS, or Wi-Fi quality.",
+    evidence=[
+        "Latency is {latency_value} ms",
+        "CPU usage is normal at {cpu}%",
+        "Network usage is {network_total} Mbps",
+    ],
+    suggested_actions=[
+        "Test latency to your router and a public DNS server",
+        "Switch from Wi-Fi to Ethernet if possible",
+        "Check ISP status or router health",
+    ],
+    conditions=[
+        ("latency_value", ">=", Threshold("latency_warning")),
+        ("upload", "<", Threshold("upload_warning")),
+        ("cpu", "<", Threshold("cpu_warning")),
+        ("network_total", "<", Threshold("network_warning")),
+    ],
+))
+
+register_rule(Rule(
+    "latency_p95_sustained",
+    "warning",
+    "Latency high across the last few minutes",
+    "Most probes in the trend window were slow, so this is not a single noisy sample.",
+    evidence=[
+        "p95 latency over the last {latency_window:.0f} s is {latency_p95} ms",
+        "Mean latency over the same window is {latency_mean} ms",
+    ],
+    suggested_actions=[
+        "Check whether a long-running transfer or sync overlaps the window",
+        "Compare latency to your router with latency to the internet",
+        "Contact your ISP if the gateway is fast but external targets stay slow",
+    ],
+    conditions=[
+        ("latency_p95", ">=", Threshold("latency_warning")),
+        ("latency_window", ">=", Threshold("trend_seconds")),
+    ],
+    thresholds={"trend_seconds": 300},
+))
+
+register_rule(Rule(
+    "latency_rising",
+    "info",
+    "Latency trending upward",
+    "Response time has been climbing steadily across the trend window.",
+    evidence=[
+        "Latency is rising by {latency_slope} ms per minute",
+        "Mean latency over the last {latency_window:.0f} s is {latency_mean} ms",
+    ],
+    suggested_actions=[
+        "Watch whether latency keeps climbing toward the warning threshold",
+        "Look for a growing upload or download that started recently",
+    ],
+    conditions=[
+        ("latency_slope", ">=", Threshold("latency_slope_warning")),
+        ("latency_window", ">=", Threshold("trend_seconds")),
+    ],
+    thresholds={"latency_slope_warning": 10, "trend_seconds": 300},
+))
+
+register_rule(Rule(
+    "cpu_network",
+    "warning",
+    "High CPU with heavy network activity",
+    "A local process may be doing heavy transfer work or unexpected background activity.",
+    evidence=[
+        "CPU usage is {cpu}%",
+        "Total network usage is {network_total} Mbps",
+    ],
+    suggested_actions=[
+        "Inspect running processes by CPU and network usage",
+        "Pause downloads, sync tools, or package managers",
+        "Check for unexpected background services",
+    ],
+    conditions=[
+        ("cpu", ">=", Threshold("cpu_warning")),
+        ("network_total", ">=", Threshold("network_warning")),
+    ],
+))
+
+register_rule(Rule(
+    "cpu_bottleneck",
+    "warning",
+    "Local system bottleneck",
+    "The machine is under CPU pressure, but the network is not busy.",
+    evidence=[
+        "CPU usage is {cpu}%",
+        "Total network usage is only {network_total} Mbps",
+    ],
+    suggested_actions=[
+        "Close CPU-heavy local applications",
+        "Check build tools, browsers, or background jobs",
+        "Retest network after CPU load drops",
+    ],
+    conditions=[
+        ("cpu", ">=", Threshold("cpu_warning")),
+        ("network_total", "<=", Threshold("low_network")),
+        ("network_total", "<", Threshold("network_warning")),
+    ],
+))
+
+register_rule(Rule(
+    "cpu_sustained",
+    "warning",
+    "Sustained high CPU",
+    "CPU has stayed above the warning threshold for several minutes, not just one sample.",
+    evidence=[
+        "CPU has been at or above {cpu_warning:g}% for {cpu_sustained:.0f} s",
+        "Mean CPU over the last {cpu_window:.0f} s is {cpu_mean}%",
+    ],
+    suggested_actions=[
+        "Find the process holding the CPU with top or Task Manager",
+        "Stop or reschedule long-running builds, scans or sync jobs",
+    ],
+    conditions=[("cpu_sustained", ">=", Threshold("trend_seconds"))],
+    thresholds={"trend_seconds": 300},
+))
+
+register_rule(Rule(
+    "memory_pressure",
+    "warning",
+    "Memory pressure detected",
+    "High memory usage can slow local tools and make diagnostics less responsive.",
+    evidence=["Memory usage is {memory}%"],
+    suggested_actions=[
+        "Close unused applications",
+        "Check memory-heavy browser tabs or services",
+        "Restart long-running local processes if needed",
+    ],
+    conditions=[("memory", ">=", Threshold("memory_warning"))],
+))
+
+register_rule(Rule(
+    "ssh_exposed",
+    "warning",
+    "SSH remote access exposed",
+    "Port 22 is open, so SSH access may be reachable from this network.",
+    evidence=["Port 22 is open in the latest scan"],
+    suggested_actions=[
+        "Confirm SSH is required",
+        "Use key-based authentication and disable password login",
+        "Restrict SSH access with firewall rules",
+    ],
+    conditions=[("open_ports", "contains", 22)],
+))
+
+register_rule(Rule(
+    "rdp_exposed",
+    "critical",
+    "Remote Desktop exposure risk",
+    "Port 3389 is open, which can expose Remote Desktop access.",
+    evidence=["Port 3389 is open in the latest scan"],
+    suggested_actions=[
+        "Disable Remote Desktop if not needed",
+        "Restrict access to trusted IPs",
+        "Use VPN or network-level authentication",
+    ],
+    conditions=[("open_ports", "contains", 3389)],
+))
+
+register_rule(Rule(
+    "new_open_ports",
+    "warning",
+    "New ports opened since the previous scan",
+    "A service started listening since the last scan of this host.",
+    evidence=["Newly open on {scan_host}: {newly_opened_text}"],
+    suggested_actions=[
+        "Confirm the new services were started intentionally",
+        "Close or firewall services that should not be exposed",
+    ],
+    conditions=[("newly_opened_count", ">", 0)],
+))
+
+register_rule(Rule(
+    "attack_surface",
+    "warning",
+    "Increased attack surface",
+    "Many open ports increase the number of services that need hardening.",
+    evidence=[
+        "{open_port_count} open ports found in the latest scan",
+        "Open ports: {open_ports_text}",
+    ],
+    suggested_actions=[
+        "Close services that are not required",
+        "Review firewall rules",
+        "Document why each exposed service must remain open",
+    ],
+    conditions=[("open_port_count", ">=", Threshold("many_open_ports"))],
+))
+
+register_rule(Rule(
+    "frequent_alerts",
+    "warning",
+    "Frequent recent alerts",
+    "Repeated warning or error events suggest an unstable system or network condition.",
+    evidence=["{problem_events} warning/error events found in recent activity"],
+    suggested_actions=[
+        "Review the activity history for repeated patterns",
+        "Check whether alerts happen during a specific workload",
+        "Lower background network and CPU load before retesting",
+    ],
+    conditions=[("problem_events", ">=", Threshold("frequent_alerts"))],
+))
+
+register_rule(Rule(
+    "healthy",
+    "healthy",
+    "System and network look healthy",
+    "No rule detected a current bottleneck or exposure from the available data.",
+    evidence=[
+        "CPU usage is {cpu}%",
+        "Memory usage is {memory}%",
+        "Latency status is {latency_status}",
+        "Network usage is {network_total} Mbps",
+    ],
+    suggested_actions=[
+        "Continue monitoring",
+        "Run a port scan when you want exposure analysis",
+    ],
+    fallback=True,
+))
@@ -0,0 +1,84 @@
+import asyncio
+import re
+from typing import Any
+
+
+BANNER_BYTES = 1024
+PASSIVE_READ_SECONDS = 0.8
+BANNER_TIMEOUT = 2.0
+# Sent only when the service waits for the client to speak first. HTTP
+# servers answer with a status line; Redis rejects it as an unknown inline
+# command, which identifies it just as well.
+CLIENT_PROBE = b"HEAD / HTTP/1.0\r\n\r\n"
+
+# (service, pattern); group 1, when present, is the product string.
+SIGNATURES = [
+    ("ssh", re.compile(rb"^SSH-[\d.]+-(\S+)")),
+    ("http", re.compile(rb"^HTTP/[\d.]+ \d{3}[^\r\n]*(?:\r\n[^\r\n]+)*?\r\nServer: *([^\r\n]+)", re.I)),
+    ("http", re.compile(rb"^HTTP/[\d.]+ \d{3}")),
+    ("redis", re.compile(rb"^(?:\+PONG|-NOAUTH|-DENIED|-ERR unknown command|-ERR wrong number)")),
+    ("smtp", re.compile(rb"^220[ -]([^\r\n]*(?:SMTP|Postfix|Exim|Sendmail)[^\r\n]*)", re.I)),
+    ("ftp", re.compile(rb"^220[ -]([^\r\n]*)")),
+    ("pop3", re.compile(rb"^\+OK")),
+    ("imap", re.compile(rb"^\* OK")),
+    ("mysql", re.compile(rb"^.{3}\x00\x0a([\d.]+[^\x00]*)\x00", re.S)),
+    ("tls", re.compile(rb"^\x15\x03[\x00-\x04]")),
+]
+
+
+def _printable(data: bytes, limit: int = 80) -> str:
+    line = data.split(b"\n", 1)[0].decode("latin-1").strip()
+    return "".join(char if char.isprintable() else "." for char in line)[:limit]
+
+
+def identify(data: bytes) -> dict[str, str]:
+    """Matches a banner or probe reply against SIGNATURES."""
+    if not data:
+        return {}
+    for service, pattern in SIGNATURES:
+        match = pattern.match(data)
+        if match:
+            product = match.group(1) if pattern.groups else b""
+            return {"service": service, "product": _printable(product), "banner": _printable(data)}
+    return {"service": "", "product": "", "banner": _printable(data)}
+
+
+async def _read(reader: asyncio.StreamReader, timeout: float) -> bytes:
+    try:
+        return await asyncio.wait_for(reader.read(BANNER_BYTES), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return b""
+
+
+async def grab_banner(address: str, port: int, timeout: float = BANNER_TIMEOUT) -> dict[str, str]:
+    """
+    Opens a fresh connection to an open port and identifies the service:
+    first by whatever it sends unprompted (SSH, FTP, SMTP, MySQL...), then
+    by its reply to CLIENT_PROBE. Reads are bounded in size and time, and
+    an unreachable or silent port yields an empty dict.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return {}
+    try:
+        data = await _read(reader, min(PASSIVE_READ_SECONDS, timeout))
+        if not data:
+            writer.write(CLIENT_PROBE)
+            await writer.drain()
+            data = await _read(reader, timeout)
+    except OSError:
+        data = b""
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+    return identify(data)
+
+
+def describe(info: dict[str, Any]) -> str:
+    """Short "service (product)" text for scan updates."""
+    service = info.get("service") or "unknown"
+    return f"{service} ({info['product']})" if info.get("product") else service
@@ -1,10 +1,45 @@
+import errno
+import random
+import selectors
 import socket
+import statistics
+import struct
+import threading
 import time
-from typing import Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+from core.timeseries import percentile
 
 
 DEFAULT_LATENCY_TARGET = "8.8.8.8"
 DEFAULT_LATENCY_PORT = 53
+DEFAULT_PROBE_SAMPLES = 3
+MAX_PROBE_SAMPLES = 10
+PROBE_INTERVAL_SECONDS = 5.0
+PROBE_JITTER = 0.2
+PROBE_TIMEOUT_SECONDS = 0.75
+# Longer than the prober's worst-case gap between two results (longest
+# jittered wait plus a probe that runs to its timeout), so readers hit a
+# result the prober refreshed rather than opening their own sockets.
+LATENCY_CACHE_TTL_SECONDS = PROBE_INTERVAL_SECONDS * (1 + PROBE_JITTER) + PROBE_TIMEOUT_SECONDS + 0.5
+# Hostname targets are looked up again at most this often.
+RESOLVE_CACHE_SECONDS = 300.0
+RESOLVE_POLL_SECONDS = 0.02
+
+_resolve_cache: dict[tuple[str, int], tuple[float, tuple]] = {}
+_resolve_lock = threading.Lock()
+
+
+def _latency_status(latency_ms: float | None) -> str:
+    if latency_ms is None:
+        return "unavailable"
+    if latency_ms <= 120:
+        return "ok"
+    if latency_ms <= 250:
+        return "degraded"
+    return "unavailable"
 
 
 def measure_latency(target: str = DEFAULT_LATENCY_TARGET, port: int = DEFAULT_LATENCY_PORT, timeout: float = 1.5) -> dict[str, Any]:
@@ -27,18 +62,11 @@ def measure_latency(target: str = DEFAULT_LATENCY_TARGET, port: int = DEFAULT_LA
             "error": str(exc),
         }
 
-    if latency_ms <= 120:
-        status = "ok"
-    elif latency_ms <= 250:
-        status = "degraded"
-    else:
-        status = "unavailable"
-
     return {
         "latency_ms": latency_ms,
         "target": target,
         "port": int(port),
-        "status": status,
+        "status": _latency_status(latency_ms),
         "error": None,
     }
 
@@ -51,3 +79,445 @@ def latency_settings(settings: dict[str, Any]) -> tuple[str, int]:
     except (TypeError, ValueError):
         port = DEFAULT_LATENCY_PORT
     return str(target), port
+
+
+def default_gateway(route_file: str = "/proc/net/route") -> str | None:
+    """Reads the IPv4 default gateway from the kernel routing table (Linux only)."""
+    try:
+        lines = Path(route_file).read_text().splitlines()[1:]
+    except OSError:
+        return None
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3 or fields[1] != "00000000":
+            continue
+        try:
+            return socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
+        except (ValueError, struct.error):
+            continue
+    return None
+
+
+def dns_servers(resolv_file: str = "/etc/resolv.conf") -> list[str]:
+    try:
+        lines = Path(resolv_file).read_text().splitlines()
+    except OSError:
+        return []
+    servers = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] == "nameserver":
+            servers.append(fields[1])
+    return servers
+
+
+def _parse_target(value: str, default_port: int) -> tuple[str, int] | None:
+    value = value.strip()
+    if not value:
+        return None
+    host, sep, port = value.rpartition(":")
+    # Bare IPv6 addresses contain colons too; only split "host:port".
+    if sep and host and ":" not in host and port.isdigit():
+        return host, int(port)
+    return value, default_port
+
+
+def latency_targets(settings: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    Builds the probe set from settings.network: the primary latency target,
+    the default gateway, the first system DNS server and any extra
+    ``probe_targets`` ("host" or "host:port", list or comma-separated).
+    Gateway and DNS probing can be switched off with ``probe_gateway`` and
+    ``probe_dns``.
+    """
+    network = settings.get("network", {}) if isinstance(settings, dict) else {}
+    target, port = latency_settings(settings)
+    candidates = [("primary", target, port)]
+
+    if network.get("probe_gateway", True):
+        gateway = default_gateway()
+        if gateway:
+            candidates.append(("gateway", gateway, port))
+    if network.get("probe_dns", True):
+        servers = dns_servers()
+        if servers:
+            candidates.append(("dns", servers[0], DEFAULT_LATENCY_PORT))
+
+    extra = network.get("probe_targets") or []
+    if isinstance(extra, str):
+        extra = extra.split(",")
+    for value in extra:
+        parsed = _parse_target(str(value), port)
+        if parsed:
+            candidates.append(("custom", *parsed))
+
+    targets, seen = [], set()
+    for name, host, host_port in candidates:
+        if (host, host_port) in seen:
+            continue
+        seen.add((host, host_port))
+        targets.append({"name": name, "target": host, "port": host_port})
+    return targets
+
+
+def probe_samples(settings: dict[str, Any]) -> int:
+    network = settings.get("network", {}) if isinstance(settings, dict) else {}
+    try:
+        samples = int(network.get("probe_samples", DEFAULT_PROBE_SAMPLES))
+    except (TypeError, ValueError):
+        samples = DEFAULT_PROBE_SAMPLES
+    return max(1, min(MAX_PROBE_SAMPLES, samples))
+
+
+def _target_stats(target: dict[str, Any], rtts: list[float], samples: int, error: str | None) -> dict[str, Any]:
+    received = len(rtts)
+    loss_pct = round((samples - received) / samples * 100, 1)
+    result = {
+        **target,
+        "samples": samples,
+        "received": received,
+        "loss_pct": loss_pct,
+        "min_ms": None,
+        "median_ms": None,
+        "p95_ms": None,
+        "jitter_ms": None,
+        "latency_ms": None,
+        "status": "unavailable",
+        "error": error if not received else None,
+    }
+    if not received:
+        return result
+
+    median = round(statistics.median(rtts), 2)
+    diffs = [abs(b - a) for a, b in zip(rtts, rtts[1:])]
+    result.update({
+        "min_ms": round(min(rtts), 2),
+        "median_ms": median,
+        "p95_ms": round(percentile(rtts, 95), 2),
+        "jitter_ms": round(sum(diffs) / len(diffs), 2) if diffs else 0.0,
+        "latency_ms": median,
+        "status": _latency_status(median),
+    })
+    if loss_pct and result["status"] == "ok":
+        result["status"] = "degraded"
+    return result
+
+
+class _Resolver:
+    """
+    Address lookups for probe_targets(). IP literals and recently resolved
+    names are ready at once; other names are looked up in parallel threads,
+    so a slow lookup only delays its own target's connects.
+    """
+
+    def __init__(self, targets: list[dict[str, Any]]) -> None:
+        self._ready: list[tuple[int, tuple | str]] = []
+        self._lookups: dict[Future, tuple[tuple[str, int], list[int]]] = {}
+        self._pool: ThreadPoolExecutor | None = None
+        names: dict[tuple[str, int], list[int]] = {}
+        now = time.monotonic()
+        for index, target in enumerate(targets):
+            try:
+                key = (str(target["target"]), int(target["port"]))
+                with _resolve_lock:
+                    cached = _resolve_cache.get(key)
+                if cached is not None and cached[0] > now:
+                    self._ready.append((index, cached[1]))
+                    continue
+                info = socket.getaddrinfo(*key, type=socket.SOCK_STREAM, flags=socket.AI_NUMERICHOST)[0]
+                self._ready.append((index, info))
+            except socket.gaierror:
+                names.setdefault(key, []).append(index)
+            except (OSError, ValueError) as exc:
+                self._ready.append((index, str(exc)))
+        if names:
+            self._pool = ThreadPoolExecutor(max_workers=len(names))
+            for key, indexes in names.items():
+                future = self._pool.submit(socket.getaddrinfo, *key, type=socket.SOCK_STREAM)
+                self._lookups[future] = (key, indexes)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._lookups)
+
+    def take(self) -> list[tuple[int, tuple | str]]:
+        """(index, getaddrinfo entry or error) for targets resolved since the last call."""
+        ready, self._ready = self._ready, []
+        for future in [future for future in self._lookups if future.done()]:
+            key, indexes = self._lookups.pop(future)
+            try:
+                info = future.result()[0]
+            except (OSError, ValueError) as exc:
+                info = str(exc)
+            else:
+                with _resolve_lock:
+                    _resolve_cache[key] = (time.monotonic() + RESOLVE_CACHE_SECONDS, info)
+            ready.extend((index, info) for index in indexes)
+        return ready
+
+    def abandon(self) -> list[int]:
+        """Gives up on unfinished lookups and returns their target indexes."""
+        if self._pool is not None:
+            # A lookup stuck in the system resolver is not waited for.
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        indexes = [index for _, pending in self._lookups.values() for index in pending]
+        self._lookups.clear()
+        return indexes
+
+
+def probe_targets(
+    targets: list[dict[str, Any]],
+    samples: int = DEFAULT_PROBE_SAMPLES,
+    timeout: float = 1.0,
+) -> list[dict[str, Any]]:
+    """
+    Measures every target concurrently with non-blocking TCP connects and
+    returns per-target min/median/p95/jitter/loss. All ``samples`` connects
+    for all targets share one ``timeout`` window, name resolution included,
+    so adding targets does not add latency for the caller. A refused
+    connection still completes a round trip (the host answered with RST),
+    so it counts as a reply.
+    """
+    samples = max(1, int(samples))
+    rtts: list[dict[int, float]] = [{} for _ in targets]
+    errors: list[str | None] = [None for _ in targets]
+    selector = selectors.DefaultSelector()
+    deadline = time.perf_counter() + timeout
+    resolver = _Resolver(targets)
+
+    try:
+        while True:
+            for index, info in resolver.take():
+                if isinstance(info, str):
+                    errors[index] = info
+                    continue
+                family, kind, proto, _, address = info
+                for sample in range(samples):
+                    sock = socket.socket(family, kind, proto)
+                    sock.setblocking(False)
+                    started = time.perf_counter()
+                    code = sock.connect_ex(address)
+                    if code in (0, errno.ECONNREFUSED):
+                        rtts[index][sample] = (time.perf_counter() - started) * 1000
+                        sock.close()
+                    elif code in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                        selector.register(sock, selectors.EVENT_WRITE, (index, sample, started))
+                    else:
+                        errors[index] = errno.errorcode.get(code, str(code))
+                        sock.close()
+
+            if not selector.get_map() and not resolver.pending:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            if resolver.pending:
+                # Wake up now and then to start connects for finished lookups.
+                remaining = min(remaining, RESOLVE_POLL_SECONDS)
+            if not selector.get_map():
+                time.sleep(remaining)
+                continue
+            for key, _ in selector.select(remaining):
+                index, sample, started = key.data
+                finished = time.perf_counter()
+                sock = key.fileobj
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code in (0, errno.ECONNREFUSED):
+                    rtts[index][sample] = (finished - started) * 1000
+                else:
+                    errors[index] = errno.errorcode.get(code, str(code))
+                selector.unregister(sock)
+                sock.close()
+    finally:
+        for index in resolver.abandon():
+            errors[index] = "name resolution timed out"
+        for key in list(selector.get_map().values()):
+            index = key.data[0]
+            errors[index] = errors[index] or "timed out"
+            key.fileobj.close()
+        selector.close()
+
+    return [
+        _target_stats(target, [rtts[index][s] for s in sorted(rtts[index])], samples, errors[index])
+        for index, target in enumerate(targets)
+    ]
+
+
+class LatencyCache:
+    """
+    TTL cache of probe results keyed by (target, port). Concurrent callers
+    asking for the same stale key share one probe: the first caller measures
+    it and the others wait for that result instead of opening more sockets.
+    """
+
+    def __init__(self, ttl: float = LATENCY_CACHE_TTL_SECONDS) -> None:
+        self.ttl = ttl
+        self._entries: dict[tuple[str, int], tuple[float, dict[str, Any]]] = {}
+        self._inflight: dict[tuple[str, int], threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, key: tuple[str, int], now: float) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None or now - entry[0] >= self.ttl:
+            return None
+        return {**entry[1], "cached": True, "age_seconds": round(now - entry[0], 2)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def measure(
+        self,
+        targets: list[dict[str, Any]],
+        samples: int = DEFAULT_PROBE_SAMPLES,
+        timeout: float = 1.0,
+        force: bool = False,
+    ) -> list[dict[str, Any]]:
+        results: dict[tuple[str, int], dict[str, Any]] = {}
+        owned: list[dict[str, Any]] = []
+        waiting: list[tuple[tuple[str, int], threading.Event]] = []
+
+        with self._lock:
+            now = time.monotonic()
+            for target in targets:
+                key = (target["target"], int(target["port"]))
+                cached = None if force else self._fresh(key, now)
+                if cached is not None:
+                    results[key] = cached
+                elif key in self._inflight:
+                    waiting.append((key, self._inflight[key]))
+                elif key not in results:
+                    self._inflight[key] = threading.Event()
+                    owned.append(target)
+                    results[key] = {}
+
+        if owned:
+            measured = []
+            try:
+                measured = probe_targets(owned, samples=samples, timeout=timeout)
+            finally:
+                with self._lock:
+                    now = time.monotonic()
+                    for result in measured:
+                        key = (result["target"], int(result["port"]))
+                        self._entries[key] = (now, result)
+                        results[key] = {**result, "cached": False, "age_seconds": 0.0}
+                    for target in owned:
+                        self._inflight.pop((target["target"], int(target["port"])), threading.Event()).set()
+
+        for key, event in waiting:
+            event.wait(timeout + 1.0)
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                results[key] = {**entry[1], "cached": True, "age_seconds": 0.0}
+
+        output = []
+        for target in targets:
+            key = (target["target"], int(target["port"]))
+            result = results.get(key) or _target_stats(target, [], samples, "probe did not complete")
+            output.append({**result, "name": target.get("name", result.get("name"))})
+        return output
+
+
+latency_cache = LatencyCache()
+
+
+def _primary_result(result: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "latency_ms": result["latency_ms"],
+        "target": result["target"],
+        "port": result["port"],
+        "status": result["status"],
+        "error": result["error"],
+        "jitter_ms": result["jitter_ms"],
+        "loss_pct": result["loss_pct"],
+        "cached": result.get("cached", False),
+    }
+
+
+def measure_latency_targets(settings: dict[str, Any], timeout: float = 1.0, force: bool = False) -> dict[str, Any]:
+    """
+    Probes every configured target in one timeout window, reusing results
+    from the shared cache while they are fresh. ``primary`` keeps the
+    measure_latency result shape so existing callers can use it as-is;
+    ``targets`` carries the per-target statistics.
+    """
+    targets = latency_cache.measure(
+        latency_targets(settings),
+        samples=probe_samples(settings),
+        timeout=timeout,
+        force=force,
+    )
+    return {"primary": _primary_result(targets[0]), "targets": targets}
+
+
+def cached_latency(settings: dict[str, Any], timeout: float = 1.0) -> dict[str, Any]:
+    """Primary-target latency through the shared cache (no gateway/DNS probes)."""
+    target, port = latency_settings(settings)
+    result = latency_cache.measure(
+        [{"name": "primary", "target": target, "port": port}],
+        samples=probe_samples(settings),
+        timeout=timeout,
+    )[0]
+    return _primary_result(result)
+
+
+class LatencyProber:
+    """
+    Probes the configured latency targets on its own schedule and keeps the
+    last result, so periodic loops can merge latency without waiting on a
+    TCP connect. Each wait is jittered by +/- ``jitter`` of the interval to
+    avoid probing in lockstep with other periodic work.
+    """
+
+    def __init__(
+        self,
+        settings_loader: Callable[[], dict[str, Any]],
+        interval: float = PROBE_INTERVAL_SECONDS,
+        jitter: float = PROBE_JITTER,
+        timeout: float = PROBE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.settings_loader = settings_loader
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self._latest: dict[str, Any] | None = None
+        self._latest_targets: list[dict[str, Any]] = []
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def latest(self) -> dict[str, Any] | None:
+        return self._latest
+
+    def latest_targets(self) -> list[dict[str, Any]]:
+        return self._latest_targets
+
+    def probe(self) -> dict[str, Any]:
+        measured = measure_latency_targets(self.settings_loader(), timeout=self.timeout, force=True)
+        result = measured["primary"]
+        result["measured_at"] = int(time.time())
+        self._latest, self._latest_targets = result, measured["targets"]
+        return result
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.probe()
+            except Exception:
+                # A failed settings read must not kill the prober thread.
+                pass
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            self._stop_event.wait(delay)
@@ -0,0 +1,97 @@
+import xml.etree.ElementTree as ET
+from typing import Any, Iterable, Iterator
+
+
+def _percent(value: str | None) -> float:
+    try:
+        return round(float(value or 0), 2)
+    except ValueError:
+        return 0.0
+
+
+def iter_nmap_events(chunks: Iterable[str]) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    Incrementally parses nmap's -oX output as it is produced and yields
+    ``(kind, data)`` events:
+
+    - ``progress``: a ``--stats-every`` <taskprogress> or <taskend> record
+    - ``port``: one <port> of the current host
+    - ``extraports``: a group of unlisted ports sharing one state
+    - ``host``: a finished <host> with its address, status and whether
+      nmap gave up on it at --host-timeout
+    - ``finished``: the closing <runstats> summary
+
+    ``chunks`` can be any iterable of text, e.g. a process's stdout.
+
+    nmap writes a host's <port> elements only once it has finished that
+    host, so ``port`` events arrive per host, not per port: a single
+    long-running host shows only ``progress`` until it completes.
+
+    Every element is detached from its parent once handled (children of a
+    <port> go with it), so memory stays bounded by one port's subtree
+    however many hosts and ports the document holds.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    open_elements: list[ET.Element] = []
+    host: str | None = None
+    host_status = "unknown"
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "start":
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            parent = open_elements[-1] if open_elements else None
+            tag = element.tag
+            in_host = parent is not None and parent.tag == "host"
+            if tag == "address" and in_host and host is None and element.attrib.get("addrtype") in ("ipv4", "ipv6"):
+                host = element.attrib.get("addr")
+            elif tag == "taskprogress":
+                yield "progress", {
+                    "task": element.attrib.get("task", "scan"),
+                    "percent": _percent(element.attrib.get("percent")),
+                    "remaining": int(element.attrib.get("remaining", 0) or 0),
+                }
+            elif tag == "taskend":
+                yield "progress", {
+                    "task": element.attrib.get("task", "scan"),
+                    "percent": 100.0,
+                    "remaining": 0,
+                }
+            elif tag == "extraports":
+                yield "extraports", {
+                    "host": host,
+                    "state": element.attrib.get("state", "unknown"),
+                    "count": int(element.attrib.get("count", 0) or 0),
+                }
+            elif tag == "port":
+                state_el = element.find("state")
+                service_el = element.find("service")
+                service = service_el.attrib if service_el is not None else {}
+                yield "port", {
+                    "host": host,
+                    "port": int(element.attrib.get("portid", "0")),
+                    "protocol": element.attrib.get("protocol", "tcp"),
+                    "state": state_el.attrib.get("state", "unknown") if state_el is not None else "unknown",
+                    "service": service.get("name", ""),
+                    "product": service.get("product", ""),
+                    "version": service.get("version", ""),
+                }
+            elif tag == "status" and in_host:
+                host_status = element.attrib.get("state", "unknown")
+            elif tag == "host":
+                yield "host", {
+                    "host": host,
+                    "status": host_status,
+                    "timed_out": element.attrib.get("timedout") == "true",
+                }
+                host, host_status = None, "unknown"
+            elif tag == "finished":
+                yield "finished", dict(element.attrib)
+
+            if parent is not None and parent.tag != "port":
+                parent.remove(element)
+    # No parser.close(): a stopped or killed nmap leaves the document
+    # unterminated, and the caller reports that through the exit code.
@@ -1,8 +1,12 @@
 import shutil
 import subprocess
+import threading
 import time
 import xml.etree.ElementTree as ET
-from typing import Any
+from typing import Any, Iterator
+
+from core.nmap_xml import iter_nmap_events
+from core.portset import PortSet
 
 
 COMMON_PORT_RISKS = {
@@ -22,43 +26,81 @@ COMMON_PORT_RISKS = {
     3389: ("RDP", "critical"),
 }
 
+# Services identified by banner grabbing (core.fingerprint); these take
+# precedence over the port-number guess above.
+SERVICE_RISKS = {
+    "ssh": ("SSH", "warning"),
+    "ftp": ("FTP", "warning"),
+    "smtp": ("SMTP", "info"),
+    "http": ("HTTP", "info"),
+    "tls": ("TLS", "info"),
+    "pop3": ("POP3", "warning"),
+    "imap": ("IMAP", "warning"),
+    "mysql": ("MySQL", "warning"),
+    "redis": ("Redis", "critical"),
+}
+
+RISK_PORTS = {
+    risk: PortSet(port for port, (_, level) in COMMON_PORT_RISKS.items() if level == risk)
+    for risk in ("critical", "warning")
+}
+
+SCAN_ENGINES = ("auto", "nmap", "native")
+NMAP_STATS_INTERVAL = "2s"
+
 
 def parse_ports(ports_input: str) -> str:
-    ports = []
-    for part in (ports_input or "").replace(" ", "").split(","):
-        if not part:
-            continue
-        if "-" in part:
-            try:
-                start, end = [int(value) for value in part.split("-", 1)]
-            except ValueError:
-                continue
-            if 1 <= start <= end <= 65535:
-                ports.append(f"{start}-{end}")
-        else:
-            try:
-                port = int(part)
-            except ValueError:
-                continue
-            if 1 <= port <= 65535:
-                ports.append(str(port))
-    return ",".join(sorted(set(ports), key=lambda value: int(value.split("-", 1)[0])))
-
-
-def count_ports(ports: str) -> int:
-    total = 0
-    for part in (ports or "").split(","):
-        if not part:
-            continue
-        if "-" in part:
-            start, end = [int(value) for value in part.split("-", 1)]
-            total += end - start + 1
-        else:
-            total += 1
-    return total
+    """Canonical nmap -p spec for user input; invalid items are dropped."""
+    return PortSet.from_spec(ports_input).to_spec()
+
+
+def _setting_int(values: dict[str, Any], key: str, default: int, low: int, high: int) -> int:
+    try:
+        value = int(values.get(key, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(low, min(value, high))
+
+
+def scan_settings(settings: dict[str, Any] | None) -> dict[str, Any]:
+    """Scan tuning from settings.advanced, clamped to sane ranges."""
+    advanced = (settings or {}).get("advanced", {})
+    if not isinstance(advanced, dict):
+        advanced = {}
+    engine = str(advanced.get("scan_engine", "auto")).lower()
+    return {
+        "timeout": _setting_int(advanced, "scan_timeout", 30, 5, 300),
+        "threads": _setting_int(advanced, "scan_threads", 10, 1, 100),
+        "retries": _setting_int(advanced, "scan_retries", 3, 0, 10),
+        "cache_minutes": _setting_int(advanced, "scan_cache_minutes", 10, 0, 1440),
+        "engine": engine if engine in SCAN_ENGINES else "auto",
+        "banner_grab": bool(advanced.get("banner_grab", True)),
+        "max_pps": _setting_int(advanced, "scan_max_pps", 0, 0, 100000),
+    }
+
+
+def nmap_rate_args(config: dict[str, Any]) -> list[str]:
+    """
+    Caps nmap's parallelism at scan_threads and its send rate at
+    scan_max_pps. No floor is set, so nmap's own congestion control can
+    still back off on lossy paths.
+    """
+    args = ["--max-parallelism", str(config["threads"])]
+    if config["max_pps"]:
+        args += ["--max-rate", str(config["max_pps"])]
+    return args
+
+
+def resolve_engine(engine: str) -> str:
+    """Maps "auto" to nmap when it is installed and to the built-in scanner otherwise."""
+    if engine == "auto":
+        return "nmap" if shutil.which("nmap") else "native"
+    return engine
 
 
-def risk_for_port(port: int, service: str = "") -> str:
+def risk_for_port(port: int, service: str = "", fingerprint: str = "") -> str:
+    if fingerprint in SERVICE_RISKS:
+        return SERVICE_RISKS[fingerprint][1]
     if port in COMMON_PORT_RISKS:
         return COMMON_PORT_RISKS[port][1]
     if service.lower() in {"telnet", "redis", "mongodb"}:
@@ -66,118 +108,291 @@ def risk_for_port(port: int, service: str = "") -> str:
     return "info"
 
 
-def label_for_port(port: int, service: str = "") -> str:
+def ports_by_risk(ports: PortSet, fingerprints: dict[int, str] | None = None) -> dict[str, PortSet]:
+    """
+    Members of ``ports`` on the critical/warning lists, e.g. the open ports
+    of a scan. ``fingerprints`` maps ports to identified services, which
+    move a port to its service's risk level whatever its number.
+    """
+    risky = {risk: ports & members for risk, members in RISK_PORTS.items()}
+    for port, service in (fingerprints or {}).items():
+        if port not in ports or service not in SERVICE_RISKS:
+            continue
+        single = PortSet([port])
+        for risk in risky:
+            risky[risk] = risky[risk] - single
+        level = SERVICE_RISKS[service][1]
+        if level in risky:
+            risky[level] = risky[level] | single
+    return {risk: members for risk, members in risky.items() if members}
+
+
+def risk_note(open_ports: PortSet, fingerprints: dict[int, str] | None = None) -> str:
+    risky = ports_by_risk(open_ports, fingerprints)
+    if not risky:
+        return ""
+    return " Risky ports open: " + "; ".join(f"{risk} {ports.to_spec()}" for risk, ports in risky.items()) + "."
+
+
+def label_for_port(port: int, service: str = "", fingerprint: str = "") -> str:
+    if fingerprint in SERVICE_RISKS:
+        return SERVICE_RISKS[fingerprint][0]
     if port in COMMON_PORT_RISKS:
         return COMMON_PORT_RISKS[port][0]
     return service or "unknown"
 
 
-def _parse_nmap_xml(xml_text: str, target: str) -> list[dict[str, Any]]:
-    root = ET.fromstring(xml_text)
-    rows = []
-    for port_el in root.findall(".//port"):
-        port = int(port_el.attrib.get("portid", "0"))
-        protocol = port_el.attrib.get("protocol", "tcp").upper()
-        state_el = port_el.find("state")
-        service_el = port_el.find("service")
-        state = state_el.attrib.get("state", "unknown") if state_el is not None else "unknown"
-        service = service_el.attrib.get("name", "") if service_el is not None else ""
-        label = label_for_port(port, service)
-        rows.append({
-            "port": port,
-            "protocol": protocol,
-            "state": state,
-            "service": label,
-            "risk": risk_for_port(port, service),
-            "target": target,
-        })
-    if not rows:
-        for extraports in root.findall(".//extraports"):
-            state = extraports.attrib.get("state", "unknown")
-            count = int(extraports.attrib.get("count", "0"))
-            if count:
-                rows.append({
-                    "port": f"{count} ports",
-                    "protocol": "TCP",
-                    "state": state,
-                    "service": "nmap summary",
-                    "risk": "info",
-                    "target": target,
-                })
-    return sorted(rows, key=lambda row: row["port"])
+def nmap_command(targets: list[str], ports: str, config: dict[str, Any]) -> list[str]:
+    """nmap TCP connect scan writing XML (with --stats-every progress) to stdout."""
+    return [
+        "nmap",
+        "-Pn",
+        "-sT",
+        "-T4",
+        "-p",
+        ports,
+        "--host-timeout",
+        f"{config['timeout']}s",
+        "--max-retries",
+        str(config["retries"]),
+        *nmap_rate_args(config),
+        "--stats-every",
+        NMAP_STATS_INTERVAL,
+        "-oX",
+        "-",
+        *targets,
+    ]
 
 
-def run_local_port_scan(target: str, ports_input: str, timeout: int = 45) -> dict[str, Any]:
-    target = (target or "").strip()
-    ports = parse_ports(ports_input)
-    started = time.time()
+def iter_nmap_lines(stream, stop_event: threading.Event | None = None, timeout: float | None = None) -> Iterator[str]:
+    """
+    Yields lines from nmap's stdout until it closes or a stop is requested.
+    The --stats-every records bound how long either check waits. Raises
+    subprocess.TimeoutExpired once ``timeout`` seconds have passed.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    for line in iter(stream.readline, ""):
+        if stop_event is not None and stop_event.is_set():
+            return
+        if deadline is not None and time.monotonic() > deadline:
+            raise subprocess.TimeoutExpired("nmap", timeout)
+        yield line
+
+
+def _failed(message: str, target: str, ports: str) -> dict[str, Any]:
+    return {"status": "failed", "message": message, "results": [], "target": target, "ports": ports}
 
-    if not target:
-        return {"status": "failed", "message": "Target host/IP is required.", "results": []}
-    if not ports:
-        return {"status": "failed", "message": "At least one valid port is required.", "results": []}
-    if shutil.which("nmap") is None:
-        return {
-            "status": "failed",
-            "message": "nmap is not installed or not available in PATH.",
-            "results": [],
-            "target": target,
-            "ports": ports,
-        }
 
-    command = ["nmap", "-Pn", "-sT", "-T4", "-p", ports, "-oX", "-", target]
+def _iter_native_port_scan(
+    target: str,
+    ports: PortSet,
+    config: dict[str, Any],
+    started: float,
+    stop_event: threading.Event | None,
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    from core.async_scan import iter_native_scan, summarize_rows
+
+    rows = []
+    total = len(ports)
+    reported = 0
     try:
-        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=False)
-    except subprocess.TimeoutExpired:
-        return {
-            "status": "failed",
-            "message": f"Scan timed out after {timeout} seconds.",
-            "results": [],
-            "target": target,
-            "ports": ports,
-        }
+        for row in iter_native_scan(
+            target,
+            ports,
+            threads=config["threads"],
+            timeout=config["timeout"],
+            retries=config["retries"],
+            stop_event=stop_event,
+            banner_grab=config["banner_grab"],
+            max_pps=config["max_pps"],
+        ):
+            rows.append(row)
+            if row["state"] == "open":
+                yield "row", row
+            percent = len(rows) * 100 // total
+            if percent >= reported + 5:
+                reported = percent
+                yield "progress", {"percent": percent, "message": f"{len(rows)}/{total} ports checked"}
     except OSError as exc:
-        return {
-            "status": "failed",
-            "message": str(exc),
-            "results": [],
-            "target": target,
-            "ports": ports,
-        }
+        yield "result", _failed(f"Could not resolve {target}: {exc}", target, ports.to_spec())
+        return
 
-    if completed.returncode != 0:
-        return {
-            "status": "failed",
-            "message": completed.stderr.strip() or f"nmap exited with code {completed.returncode}.",
-            "results": [],
-            "target": target,
-            "ports": ports,
-        }
+    open_ports = PortSet(row["port"] for row in rows if row["state"] == "open")
+    fingerprints = {row["port"]: row["fingerprint"] for row in rows if row.get("fingerprint")}
+    status = "completed"
+    message = f"Scan completed: {len(open_ports)} open port(s).{risk_note(open_ports, fingerprints)}"
+    if stop_event is not None and stop_event.is_set():
+        status = "stopped"
+        message = f"Scan stopped: {len(rows)} of {total} port(s) checked, {len(open_ports)} open."
+    elif len(rows) < total:
+        status = "partial"
+        message = f"Scan timed out after {config['timeout']} seconds: {len(rows)} of {total} port(s) checked, {len(open_ports)} open."
 
+    yield "result", {
+        "status": status,
+        "message": message,
+        "results": summarize_rows(rows, target),
+        "target": target,
+        "ports": ports.to_spec(),
+        # Ports that returned a state; less than ``ports`` when the host
+        # deadline cut the scan short.
+        "scanned_ports": PortSet(row["port"] for row in rows).to_spec(),
+        "open_ports": list(open_ports),
+        "scanned_count": total,
+        "duration_seconds": round(time.time() - started, 2),
+        "engine": "native",
+    }
+
+
+def _iter_nmap_port_scan(
+    target: str,
+    ports: PortSet,
+    config: dict[str, Any],
+    started: float,
+    stop_event: threading.Event | None,
+    timeout: float | None,
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    spec = ports.to_spec()
+    try:
+        process = subprocess.Popen(nmap_command([target], spec, config), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except OSError as exc:
+        yield "result", _failed(str(exc), target, spec)
+        return
+
+    rows = []
+    summaries = []
+    timed_out = False
     try:
-        results = _parse_nmap_xml(completed.stdout, target)
+        # Parsed as nmap writes it, so memory does not grow with the XML.
+        for kind, data in iter_nmap_events(iter_nmap_lines(process.stdout, stop_event, timeout)):
+            if kind == "progress":
+                yield "progress", {"percent": data["percent"], "message": f"{data['task']}: {data['percent']}%"}
+            elif kind == "port":
+                row = {
+                    "port": data["port"],
+                    "protocol": data["protocol"].upper(),
+                    "state": data["state"],
+                    "service": label_for_port(data["port"], data["service"]),
+                    "risk": risk_for_port(data["port"], data["service"]),
+                    "target": target,
+                }
+                rows.append(row)
+                yield "row", row
+            elif kind == "extraports" and data["count"]:
+                summaries.append({
+                    "port": f"{data['count']} ports",
+                    "protocol": "TCP",
+                    "state": data["state"],
+                    "service": "nmap summary",
+                    "risk": "info",
+                    "target": target,
+                })
+            elif kind == "host" and data["timed_out"]:
+                timed_out = True
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        yield "result", _failed(f"Scan timed out after {timeout} seconds.", target, spec)
+        return
     except ET.ParseError as exc:
-        return {
-            "status": "failed",
-            "message": f"Could not parse nmap output: {exc}",
-            "results": [],
+        process.kill()
+        process.wait()
+        yield "result", _failed(f"Could not parse nmap output: {exc}", target, spec)
+        return
+
+    results = sorted(rows or summaries, key=lambda row: row["port"])
+    open_ports = [row["port"] for row in rows if row["state"] == "open"]
+    if stop_event is not None and stop_event.is_set():
+        process.terminate()
+        process.wait()
+        yield "result", {
+            "status": "stopped",
+            "message": f"Scan stopped: {len(open_ports)} open port(s) found so far.",
+            "results": results,
             "target": target,
-            "ports": ports,
+            "ports": spec,
+            "open_ports": open_ports,
         }
+        return
 
-    open_ports = [row["port"] for row in results if row["state"] == "open"]
-    scanned_count = count_ports(ports)
-    message = f"Scan completed: {len(open_ports)} open port(s)."
-    if not results:
-        message = f"Scan completed: no per-port rows returned for {scanned_count} scanned port(s)."
+    stderr = process.stderr.read()
+    process.wait()
+    if process.returncode != 0:
+        yield "result", _failed(stderr.strip() or f"nmap exited with code {process.returncode}.", target, spec)
+        return
 
-    return {
-        "status": "completed",
+    message = f"Scan completed: {len(open_ports)} open port(s).{risk_note(PortSet(open_ports))}"
+    if timed_out:
+        message = f"Scan timed out after {config['timeout']} seconds: {len(open_ports)} open port(s) found, results are partial."
+    elif not results:
+        message = f"Scan completed: no per-port rows returned for {len(ports)} scanned port(s)."
+    yield "result", {
+        "status": "partial" if timed_out else "completed",
         "message": message,
         "results": results,
         "target": target,
-        "ports": ports,
+        "ports": spec,
+        # nmap reports nothing reliable for a host it gave up on.
+        "scanned_ports": "" if timed_out else spec,
         "open_ports": open_ports,
-        "scanned_count": scanned_count,
+        "scanned_count": len(ports),
         "duration_seconds": round(time.time() - started, 2),
+        "engine": "nmap",
     }
+
+
+def iter_local_port_scan(
+    target: str,
+    ports_input: str,
+    settings: dict[str, Any] | None = None,
+    stop_event: threading.Event | None = None,
+    timeout: float | None = None,
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    Streaming port scan with either engine. Yields ``(kind, data)``:
+
+    - ``progress``: ``{"percent", "message"}``
+    - ``row``: a result row (open ports from the native engine as soon as
+      each is found; every listed port from nmap, once nmap finishes the
+      host)
+    - ``result``: last, the same dict run_local_port_scan() returns
+
+    Setting ``stop_event`` ends the scan early with status "stopped". A
+    scan cut short by the host deadline ends with status "partial"; its
+    ``scanned_ports`` lists only the ports that returned a state.
+    Per-host limits come from settings.advanced; ``timeout`` optionally
+    caps an nmap run's total wall time.
+    """
+    target = (target or "").strip()
+    ports = PortSet.from_spec(ports_input)
+    started = time.time()
+    config = scan_settings(settings)
+
+    if not target:
+        yield "result", {"status": "failed", "message": "Target host/IP is required.", "results": []}
+    elif not ports:
+        yield "result", {"status": "failed", "message": "At least one valid port is required.", "results": []}
+    elif resolve_engine(config["engine"]) == "native":
+        yield from _iter_native_port_scan(target, ports, config, started, stop_event)
+    elif shutil.which("nmap") is None:
+        yield "result", _failed(
+            "nmap is not installed or not available in PATH. Set advanced.scan_engine to auto or native to use the built-in scanner.",
+            target,
+            ports.to_spec(),
+        )
+    else:
+        yield from _iter_nmap_port_scan(target, ports, config, started, stop_event, timeout)
+
+
+def run_local_port_scan(
+    target: str,
+    ports_input: str,
+    timeout: float | None = None,
+    settings: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Blocking form of iter_local_port_scan(); returns the final result."""
+    result: dict[str, Any] = {}
+    for kind, data in iter_local_port_scan(target, ports_input, settings=settings, timeout=timeout):
+        if kind == "result":
+            result = data
+    return result
@@ -0,0 +1,82 @@
+import asyncio
+
+
+INITIAL_WINDOW = 4
+DECREASE_FACTOR = 0.5
+
+
+class RateController:
+    """
+    Adaptive limit on connects in flight (AIMD, in the spirit of TCP
+    congestion control) with an optional packets-per-second ceiling.
+
+    The window starts small and grows by one per answered probe until the
+    first drop (slow start), then by about one per window's worth of
+    answers. A drop halves it, at most once per round: drops of probes sent
+    before the last decrease are the same congestion event. Like nmap, a
+    port that never answers is treated as filtered, not as loss; a drop is
+    a probe that is answered on retry after timing out, a connection reset,
+    or local socket exhaustion.
+
+    Every attempt, including retries, passes through ``acquire()``, which
+    waits for room in the window and for its pacing slot.
+    """
+
+    def __init__(self, max_window: int, max_pps: int = 0, min_window: int = 1) -> None:
+        self.max_window = max(1, max_window)
+        self.min_window = max(1, min(min_window, self.max_window))
+        self.window = float(min(INITIAL_WINDOW, self.max_window))
+        self.threshold = float(self.max_window)
+        self.max_pps = max(0, max_pps)
+        self.in_flight = 0
+        self.sent = 0
+        self.answered = 0
+        self.drops = 0
+        self.decreases = 0
+        self._recovery_ticket = 0
+        self._next_slot = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Waits for a free slot and returns a ticket to pass to release()."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.window))
+            self.in_flight += 1
+            self.sent += 1
+            ticket = self.sent
+        if self.max_pps:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.max_pps
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        return ticket
+
+    async def release(self, ticket: int, answered: bool, dropped: bool = False) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if answered:
+                self.answered += 1
+            if dropped:
+                self.drops += 1
+                if ticket > self._recovery_ticket:
+                    self.threshold = max(self.min_window, self.window * DECREASE_FACTOR)
+                    self.window = self.threshold
+                    self.decreases += 1
+                    self._recovery_ticket = self.sent
+            elif answered:
+                step = 1.0 if self.window < self.threshold else 1.0 / self.window
+                self.window = min(self.max_window, self.window + step)
+            self._condition.notify_all()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "window": round(self.window, 1),
+            "max_window": self.max_window,
+            "max_pps": self.max_pps,
+            "sent": self.sent,
+            "answered": self.answered,
+            "drops": self.drops,
+            "decreases": self.decreases,
+        }
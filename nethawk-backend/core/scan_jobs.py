@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from typing import Any, Callable
+
+
+MAX_FINISHED_JOBS = 50
+FINISHED_STATES = ("completed", "partial", "failed", "stopped")
+
+
+class ScanJob:
+    def __init__(self, owner: str, host: str, ports: str, priority: int = 0, schedule: str | None = None) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.host = host
+        self.ports = ports
+        self.priority = priority
+        self.schedule = schedule
+        self.status = "queued"
+        self.message = ""
+        self.open_ports: list[int] = []
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.stop_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "host": self.host,
+            "ports": self.ports,
+            "priority": self.priority,
+            "schedule": self.schedule,
+            "status": self.status,
+            "message": self.message,
+            "open_ports": list(self.open_ports),
+            "created_at": int(self.created_at),
+            "started_at": int(self.started_at) if self.started_at else None,
+            "finished_at": int(self.finished_at) if self.finished_at else None,
+        }
+
+
+class ScanJobManager:
+    """
+    Runs port scans as jobs on a bounded pool. Jobs wait in a priority queue
+    (higher ``priority`` first, FIFO within a priority) until a worker slot
+    frees up, and each job has its own stop event, so cancelling one
+    operator's scan never touches another's.
+
+    ``runner(job)`` does the actual scan, honours ``job.stop_event`` and
+    returns the final status ("completed", "partial", "failed" or
+    "stopped").
+    """
+
+    def __init__(self, runner: Callable[[ScanJob], str], max_workers: int = 2) -> None:
+        self.runner = runner
+        self.max_workers = max(1, max_workers)
+        self._jobs: dict[str, ScanJob] = {}
+        self._queue: list[tuple[int, int, ScanJob]] = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, owner: str, host: str, ports: str, priority: int = 0, schedule: str | None = None) -> ScanJob:
+        job = ScanJob(owner, host, ports, priority, schedule)
+        with self._lock:
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job))
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> ScanJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, owner: str | None = None) -> list[ScanJob]:
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if owner is None or job.owner == owner]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def queue_position(self, job_id: str) -> int | None:
+        """1-based position among queued jobs, or None if the job is not queued."""
+        with self._lock:
+            ordered = sorted(entry for entry in self._queue if entry[2].status == "queued")
+        for position, (_, _, job) in enumerate(ordered, start=1):
+            if job.id == job_id:
+                return position
+        return None
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == "queued")
+            return {"running": self._running, "queued": queued, "max_workers": self.max_workers}
+
+    def cancel(self, job_id: str, owner: str | None = None) -> bool:
+        """Stops a queued or running job. With ``owner`` set, only that owner's job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished or (owner is not None and job.owner != owner):
+                return False
+            job.stop_event.set()
+            if job.status == "queued":
+                # The heap entry is skipped when it reaches the top.
+                self._finish(job, "stopped", "Scan cancelled before it started.")
+        return True
+
+    def cancel_owner(self, owner: str) -> int:
+        return sum(1 for job in self.jobs(owner) if self.cancel(job.id, owner))
+
+    def _finish(self, job: ScanJob, status: str, message: str = "") -> None:
+        job.status = status
+        job.message = message or job.message
+        job.finished_at = time.time()
+        finished = [item for item in self._jobs.values() if item.finished]
+        if len(finished) > MAX_FINISHED_JOBS:
+            finished.sort(key=lambda item: item.finished_at or 0)
+            for item in finished[: len(finished) - MAX_FINISHED_JOBS]:
+                del self._jobs[item.id]
+
+    def _dispatch(self) -> None:
+        to_start = []
+        with self._lock:
+            while self._queue and self._running < self.max_workers:
+                _, _, job = heapq.heappop(self._queue)
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                self._running += 1
+                to_start.append(job)
+        for job in to_start:
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job: ScanJob) -> None:
+        status, message = "failed", ""
+        try:
+            status = self.runner(job)
+        except Exception as exc:
+            message = str(exc)
+        finally:
+            with self._lock:
+                if status not in FINISHED_STATES:
+                    status = "stopped" if job.stop_event.is_set() else "completed"
+                self._finish(job, status, message)
+                self._running -= 1
+            self._dispatch()
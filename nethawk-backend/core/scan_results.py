@@ -0,0 +1,195 @@
+import time
+from typing import Any, Iterable
+
+from core.portset import PortSet
+
+
+MAX_CLOSED_SNAPSHOTS = 32
+CLOSED_RETENTION_SECONDS = 24 * 3600
+MAX_HISTORY = 50
+MAX_TARGETS = 256
+TARGET_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+def states_from_rows(rows: list[dict[str, Any]]) -> tuple[dict[int, str], dict[int, str], str | None]:
+    """
+    Splits scan result rows into per-port states and services. Summary rows
+    ("N ports") stand for every unlisted port; their state is only usable as
+    the default when there is exactly one such group.
+    """
+    states: dict[int, str] = {}
+    services: dict[int, str] = {}
+    summaries = set()
+    for row in rows:
+        if isinstance(row.get("port"), int):
+            states[row["port"]] = row.get("state", "unknown")
+            services[row["port"]] = row.get("service", "")
+        else:
+            summaries.add(row.get("state"))
+    default_state = summaries.pop() if len(summaries) == 1 else None
+    return states, services, default_state
+
+
+class ScanResults:
+    """
+    Per-target port states from past scans, kept as plain dicts so every
+    persistence mode can store them as JSON.
+
+    Open ports (and ports that used to be open) are tracked individually.
+    Ports in any other state are kept as port specs: the latest filtered
+    (or open|filtered, ...) ranges under "ranges", and one spec of ports
+    confirmed closed per scan. The closed specs let a repeat scan skip
+    ranges confirmed closed recently while still re-verifying everything
+    that was ever open. Targets not scanned for TARGET_RETENTION_SECONDS,
+    and the least recently scanned beyond MAX_TARGETS, are dropped by
+    prune().
+    """
+
+    def __init__(self, records: dict[str, dict] | None = None) -> None:
+        self.records: dict[str, dict] = dict(records or {})
+
+    def get(self, target: str) -> dict | None:
+        return self.records.get(target)
+
+    def recently_closed(self, target: str, ports: PortSet, max_age: float, now: float | None = None) -> PortSet:
+        record = self.records.get(target)
+        if not record or max_age <= 0:
+            return PortSet()
+        now = now or time.time()
+        closed = PortSet()
+        for item in record.get("closed", []):
+            if now - item["checked_at"] <= max_age:
+                closed |= PortSet.from_spec(item.get("ports"))
+        tracked = PortSet(int(port) for port, entry in record.get("ports", {}).items() if entry["state"] != "closed")
+        return (ports & closed) - tracked
+
+    def record(
+        self,
+        target: str,
+        scanned: PortSet | Iterable[int],
+        states: dict[int, str],
+        default_state: str | None = None,
+        services: dict[int, str] | None = None,
+        now: float | None = None,
+    ) -> dict[str, Any]:
+        """
+        Merges one scan of ``scanned`` ports into the target's record and
+        returns the diff against what was open before. Ports without an
+        explicit state take ``default_state``. With no default they were not
+        observed (e.g. a scan cut short by its deadline): their tracked
+        entries are left alone and they stay out of the diff.
+        """
+        now = int(now or time.time())
+        services = services or {}
+        first_scan = target not in self.records
+        record = self.records.setdefault(target, {"target": target, "ports": {}, "closed": []})
+        tracked = record["ports"]
+        tracked_ports = PortSet(int(port) for port in tracked)
+        previous_open = PortSet(int(port) for port, entry in tracked.items() if entry["state"] == "open")
+
+        scanned = PortSet.coerce(scanned)
+        explicit = PortSet(states) & scanned
+        observed = scanned if default_state is not None else explicit
+        implicit = observed - explicit
+        grouped: dict[str, list[int]] = {}
+        for port in explicit:
+            grouped.setdefault(states[port], []).append(port)
+        by_state = {state: PortSet(ports) for state, ports in grouped.items()}
+        if default_state is not None and implicit:
+            by_state[default_state] = by_state.get(default_state, PortSet()) | implicit
+
+        # Only open ports, and ports that already have an entry, are tracked
+        # one by one. Every other state is kept as a port spec, so a full
+        # range of filtered or closed ports costs one string, not 65k dicts.
+        for state, ports in by_state.items():
+            for port in ports if state == "open" else ports & tracked_ports:
+                entry = tracked.get(str(port))
+                if entry is None:
+                    tracked[str(port)] = {
+                        "state": state,
+                        "service": services.get(port, ""),
+                        "checked_at": now,
+                        "changed_at": now,
+                    }
+                    continue
+                if entry["state"] != state:
+                    entry["changed_at"] = now
+                entry.update({"state": state, "checked_at": now})
+                if state != "closed":
+                    entry["service"] = services.get(port) or entry.get("service", "")
+
+        ranges = record.setdefault("ranges", {})
+        for state in list(ranges):
+            remaining = PortSet.from_spec(ranges[state]) - observed
+            if remaining:
+                ranges[state] = remaining.to_spec()
+            else:
+                del ranges[state]
+        for state, ports in by_state.items():
+            if state in ("open", "closed"):
+                continue
+            untracked = ports - tracked_ports
+            if untracked:
+                ranges[state] = (PortSet.from_spec(ranges.get(state)) | untracked).to_spec()
+
+        now_open = by_state.get("open", PortSet())
+        closed = by_state.get("closed", PortSet())
+        if closed:
+            record["closed"].insert(0, {"ports": closed.to_spec(), "checked_at": now})
+        record["closed"] = [
+            item for item in record["closed"][:MAX_CLOSED_SNAPSHOTS]
+            if now - item["checked_at"] <= CLOSED_RETENTION_SECONDS and "ports" in item
+        ]
+
+        diff = {
+            "opened": list(now_open - previous_open),
+            "closed": list((previous_open & observed) - now_open),
+            "first_scan": first_scan,
+            "at": now,
+        }
+        record["diff"] = diff
+        record["updated_at"] = now
+        record["last_scan"] = {"ports": observed.to_spec(), "at": now, "scanned": len(observed)}
+        open_ports = self.open_ports(target)
+        record["history"] = [
+            {"at": now, "scanned": len(observed), "open": len(open_ports), "opened": diff["opened"], "closed": diff["closed"]},
+            *record.get("history", [])[:MAX_HISTORY - 1],
+        ]
+        return {**diff, "open_ports": open_ports}
+
+    def prune(self, now: float | None = None) -> list[str]:
+        """Drops expired and surplus targets; returns the dropped names."""
+        now = now or time.time()
+        by_age = sorted(self.records, key=lambda name: self.records[name].get("updated_at", 0), reverse=True)
+        dropped = [
+            name for index, name in enumerate(by_age)
+            if index >= MAX_TARGETS or now - self.records[name].get("updated_at", 0) > TARGET_RETENTION_SECONDS
+        ]
+        for name in dropped:
+            del self.records[name]
+        return dropped
+
+    def open_ports(self, target: str) -> list[int]:
+        record = self.records.get(target) or {}
+        return sorted(int(port) for port, entry in record.get("ports", {}).items() if entry["state"] == "open")
+
+    def history(self, target: str) -> list[dict]:
+        """One entry per recorded scan of target, newest first."""
+        return list((self.records.get(target) or {}).get("history", []))
+
+    def summary(self, target: str | None = None) -> dict | None:
+        """Latest result for target, or for the most recently scanned target."""
+        if target is None:
+            if not self.records:
+                return None
+            target = max(self.records, key=lambda key: self.records[key].get("updated_at", 0))
+        record = self.records.get(target)
+        if not record:
+            return None
+        return {
+            "host": target,
+            "ports": record.get("last_scan", {}).get("ports"),
+            "open_ports": self.open_ports(target),
+            "diff": record.get("diff", {"opened": [], "closed": []}),
+            "timestamp": record.get("updated_at"),
+        }
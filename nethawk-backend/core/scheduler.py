@@ -0,0 +1,295 @@
+import logging
+import re
+import threading
+import time
+from datetime import datetime, time as clock, timedelta
+from typing import Any, Callable
+
+
+logger = logging.getLogger(__name__)
+
+SHORTCUTS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+INTERVAL_PATTERN = re.compile(r"^(?:every\s+)?(\d+)\s*([mhd])$", re.I)
+INTERVAL_UNITS = {"m": 60, "h": 3600, "d": 86400}
+MIN_INTERVAL_SECONDS = 60
+CRON_SEARCH_DAYS = 366 * 5
+SCHEDULER_TICK_SECONDS = 30.0
+
+
+def _cron_field(text: str, low: int, high: int) -> list[int]:
+    values: set[int] = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in {text!r}.")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = [int(value) for value in part.split("-", 1)]
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"{text!r} is outside {low}-{high}.")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+class CronSpec:
+    """
+    Standard five-field cron expression (minute hour day month weekday) in
+    server local time, with *, lists, ranges and steps. As in cron, when
+    both day fields are restricted a day matching either one fires.
+    """
+
+    def __init__(self, expression: str) -> None:
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron schedules need five fields: minute hour day month weekday.")
+        try:
+            self.minutes = _cron_field(fields[0], 0, 59)
+            self.hours = _cron_field(fields[1], 0, 23)
+            self.days = set(_cron_field(fields[2], 1, 31))
+            self.months = set(_cron_field(fields[3], 1, 12))
+            self.weekdays = {day % 7 for day in _cron_field(fields[4], 0, 7)}
+        except ValueError as exc:
+            raise ValueError(f"Invalid cron schedule {expression!r}: {exc}") from None
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        in_week = day.isoweekday() % 7 in self.weekdays
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def next_after(self, moment: float) -> float:
+        start = datetime.fromtimestamp(moment).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(CRON_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.combine(day.date(), clock(hour, minute))
+                        if candidate >= start:
+                            return candidate.timestamp()
+            day += timedelta(days=1)
+        raise ValueError("Cron schedule never fires.")
+
+
+class IntervalSpec:
+    def __init__(self, seconds: int) -> None:
+        if seconds < MIN_INTERVAL_SECONDS:
+            raise ValueError(f"Scan intervals must be at least {MIN_INTERVAL_SECONDS // 60} minute.")
+        self.seconds = seconds
+
+    def next_after(self, moment: float) -> float:
+        return moment + self.seconds
+
+
+def parse_schedule(text: str) -> CronSpec | IntervalSpec:
+    """
+    Accepts intervals ("30m", "every 6h", "1d"), @hourly/@daily/@weekly/
+    @monthly, or a five-field cron expression. Raises ValueError.
+    """
+    text = (text or "").strip()
+    match = INTERVAL_PATTERN.match(text)
+    if match:
+        return IntervalSpec(int(match.group(1)) * INTERVAL_UNITS[match.group(2).lower()])
+    return CronSpec(SHORTCUTS.get(text.lower(), text))
+
+
+class ScheduledScan:
+    def __init__(self, index: int, values: dict[str, Any]) -> None:
+        self.target = str(values.get("target") or "").strip()
+        self.ports = str(values.get("ports") or "").strip()
+        self.id = str(values.get("id") or (f"{self.target}:{self.ports}" if self.target else f"schedule-{index}"))
+        self.name = str(values.get("name") or self.id)
+        self.schedule = str(values.get("schedule") or "")
+        self.enabled = bool(values.get("enabled", True))
+        self.spec: CronSpec | IntervalSpec | None = None
+        self.error = ""
+        try:
+            if not self.target or not self.ports:
+                raise ValueError("Scheduled scans need a target and ports.")
+            self.spec = parse_schedule(self.schedule)
+            # Cron expressions such as "0 0 31 2 *" parse but never fire.
+            self.spec.next_after(time.time())
+        except ValueError as exc:
+            self.spec = None
+            self.error = str(exc)
+
+
+def load_schedules(settings: dict[str, Any] | None) -> list[ScheduledScan]:
+    scans = (settings or {}).get("scans", {})
+    entries = scans.get("schedules", ()) if isinstance(scans, dict) else ()
+    return [ScheduledScan(index, entry) for index, entry in enumerate(entries) if isinstance(entry, dict)]
+
+
+class ScanScheduler:
+    """
+    Runs scans from settings.scans.schedules in the background. Each tick
+    reloads the schedules, so edits apply without a restart, and submits
+    due ones through ``submit(scan)``, which returns the queued job (a
+    core.scan_jobs.ScanJob).
+
+    A schedule never overlaps itself: a run that comes due while the
+    previous one is still queued or running is skipped and counted. At
+    most ``settings.scans.max_running`` scheduled scans run at once; due
+    schedules beyond that wait for the next free slot, longest-overdue
+    first. Runs missed while
+    the process was down are not replayed; the next run is computed from
+    now.
+    """
+
+    def __init__(self, settings_source: Callable[[], dict], tick: float = SCHEDULER_TICK_SECONDS) -> None:
+        self.settings_source = settings_source
+        self.tick = tick
+        self.submit: Callable[[ScheduledScan], Any] | None = None
+        self._state: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+
+    def start(self, submit: Callable[[ScheduledScan], Any]) -> None:
+        self.submit = submit
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Scan scheduler tick failed")
+            self._stop_event.wait(self.tick)
+
+    def _config(self) -> tuple[dict[str, Any], list[ScheduledScan]]:
+        settings = self.settings_source() or {}
+        scans = settings.get("scans", {})
+        return (scans if isinstance(scans, dict) else {}), load_schedules(settings)
+
+    def run_pending(self, now: float | None = None) -> list[str]:
+        """Submits every due schedule that may run now; returns their ids."""
+        now = now or time.time()
+        config, schedules = self._config()
+        if not config.get("scheduler_enabled", True) or self.submit is None:
+            return []
+        max_running = max(1, int(config.get("max_running", 1) or 1))
+        started = []
+        with self._lock:
+            self._state = {scan.id: self._state.get(scan.id, {}) for scan in schedules}
+            running = sum(1 for state in self._state.values() if self._active(state))
+            due = []
+            for scan in schedules:
+                state = self._state[scan.id]
+                if scan.spec is None or not scan.enabled:
+                    state["next_run"] = None
+                    continue
+                # One broken schedule must not stop the others in this tick.
+                try:
+                    if self._is_due(scan, state, now):
+                        due.append(scan)
+                    state.pop("error", None)
+                except Exception as exc:
+                    self._failed(scan, state, exc)
+            # Longest-overdue first, so a full pool does not starve the
+            # schedules listed last.
+            due.sort(key=lambda scan: self._state[scan.id]["next_run"])
+            for scan in due:
+                if running >= max_running:
+                    break
+                state = self._state[scan.id]
+                try:
+                    state["job"] = self.submit(scan)
+                    state["last_run"] = now
+                    state["next_run"] = scan.spec.next_after(now)
+                except Exception as exc:
+                    self._failed(scan, state, exc)
+                    continue
+                running += 1
+                started.append(scan.id)
+        return started
+
+    def _is_due(self, scan: ScheduledScan, state: dict[str, Any], now: float) -> bool:
+        """Advances one schedule's next run; returns True when it may start now."""
+        if state.get("schedule") != scan.schedule or state.get("next_run") is None:
+            # New or edited schedules: intervals start now, cron
+            # expressions at their next slot.
+            state["schedule"] = scan.schedule
+            state["next_run"] = now if isinstance(scan.spec, IntervalSpec) else scan.spec.next_after(now)
+        if now < state["next_run"]:
+            return False
+        if self._active(state):
+            state["skipped"] = state.get("skipped", 0) + 1
+            state["next_run"] = scan.spec.next_after(now)
+            logger.info(f"Scheduled scan {scan.id} skipped: previous run still active")
+            return False
+        return True
+
+    @staticmethod
+    def _failed(scan: ScheduledScan, state: dict[str, Any], exc: Exception) -> None:
+        logger.exception(f"Scheduled scan {scan.id} failed")
+        state["error"] = str(exc)
+        state["next_run"] = None
+
+    def run_now(self, schedule_id: str) -> bool:
+        """Queues one run of a schedule immediately, unless it is already active."""
+        _, schedules = self._config()
+        scan = next((item for item in schedules if item.id == schedule_id and item.spec is not None), None)
+        if scan is None or self.submit is None:
+            return False
+        with self._lock:
+            state = self._state.setdefault(scan.id, {})
+            if self._active(state):
+                return False
+            state["job"] = self.submit(scan)
+            state["last_run"] = time.time()
+        return True
+
+    @staticmethod
+    def _active(state: dict[str, Any]) -> bool:
+        job = state.get("job")
+        return job is not None and not job.finished
+
+    def status(self) -> list[dict[str, Any]]:
+        _, schedules = self._config()
+        with self._lock:
+            items = []
+            for scan in schedules:
+                state = self._state.get(scan.id, {})
+                job = state.get("job")
+                items.append({
+                    "id": scan.id,
+                    "name": scan.name,
+                    "target": scan.target,
+                    "ports": scan.ports,
+                    "schedule": scan.schedule,
+                    "enabled": scan.enabled,
+                    "error": scan.error or state.get("error", ""),
+                    "next_run": int(state["next_run"]) if state.get("next_run") else None,
+                    "last_run": int(state["last_run"]) if state.get("last_run") else None,
+                    "last_status": job.status if job is not None else None,
+                    "last_job_id": job.id if job is not None else None,
+                    "skipped_runs": state.get("skipped", 0),
+                })
+        return items
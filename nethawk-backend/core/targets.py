@@ -0,0 +1,106 @@
+import ipaddress
+import re
+from typing import Any, Iterator
+
+from core.latency import probe_targets
+
+
+MAX_SCAN_HOSTS = 1024
+DISCOVERY_PORTS = (22, 80, 443, 445, 3389)
+DISCOVERY_BATCH = 256
+RANGE_PATTERN = re.compile(r"^\d{1,3}(\.\d{1,3}){3}-\d{1,3}((\.\d{1,3}){3})?$")
+HOSTNAME_PATTERN = re.compile(r"^(?=.{1,253}$)[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?(\.[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*$")
+
+
+def _range_hosts(item: str, max_hosts: int) -> Iterator[str]:
+    """Expands "10.0.0.5-10.0.0.20" or the short form "10.0.0.5-20"."""
+    start_text, end_text = item.split("-", 1)
+    start = ipaddress.IPv4Address(start_text)
+    if "." in end_text:
+        end = ipaddress.IPv4Address(end_text)
+    else:
+        end = ipaddress.IPv4Address(f"{start_text.rsplit('.', 1)[0]}.{end_text}")
+    if end < start:
+        raise ValueError(f"Range {item} ends before it starts.")
+    if int(end) - int(start) >= max_hosts:
+        raise OverflowError
+    for value in range(int(start), int(end) + 1):
+        yield str(ipaddress.IPv4Address(value))
+
+
+def _item_hosts(item: str, max_hosts: int) -> list[str]:
+    try:
+        if "/" in item:
+            network = ipaddress.ip_network(item, strict=False)
+            if network.num_addresses > 2:
+                return [str(host) for host in network.hosts()]
+            return [str(host) for host in network]
+        if RANGE_PATTERN.match(item):
+            return list(_range_hosts(item, max_hosts))
+        return [str(ipaddress.ip_address(item))]
+    except ValueError:
+        # Anything that is not an address may still be a hostname, but a
+        # mistyped dotted quad ("192.168.1.300") should not be.
+        if "/" in item or item.replace(".", "").replace("-", "").isdigit() or not HOSTNAME_PATTERN.match(item):
+            raise ValueError(f"Invalid target {item}.") from None
+        return [item]
+    except OverflowError:
+        raise ValueError(f"Target covers more than {max_hosts} hosts.") from None
+
+
+def parse_targets(spec: str, max_hosts: int = MAX_SCAN_HOSTS) -> list[str]:
+    """
+    Expands a target spec into hosts. Items are separated by commas or
+    whitespace and may be single IPs, hostnames, CIDRs ("192.168.1.0/24")
+    or IPv4 ranges ("192.168.1.10-40", "10.0.0.1-10.0.1.255").
+
+    Raises ValueError for invalid items or when the spec covers more than
+    ``max_hosts`` addresses.
+    """
+    hosts: list[str] = []
+    seen: set[str] = set()
+    for item in re.split(r"[,\s]+", (spec or "").strip()):
+        if not item:
+            continue
+        if "/" in item:
+            try:
+                size = ipaddress.ip_network(item, strict=False).num_addresses
+            except ValueError:
+                raise ValueError(f"Invalid target {item}.") from None
+            if size > max_hosts + 2:
+                raise ValueError(f"Target covers more than {max_hosts} hosts.")
+        for host in _item_hosts(item, max_hosts):
+            if host in seen:
+                continue
+            seen.add(host)
+            hosts.append(host)
+            if len(hosts) > max_hosts:
+                raise ValueError(f"Target covers more than {max_hosts} hosts.")
+    if not hosts:
+        raise ValueError("At least one target host is required.")
+    return hosts
+
+
+def discover_hosts(
+    hosts: list[str],
+    ports: tuple[int, ...] = DISCOVERY_PORTS,
+    timeout: float = 1.0,
+) -> Iterator[dict[str, Any]]:
+    """
+    TCP connect host discovery. Every host gets one connect per discovery
+    port, all running concurrently in batches of DISCOVERY_BATCH sockets; a
+    host is up if any connect completes or is refused (a RST still proves
+    the host exists). Yields ``{"host", "up", "latency_ms"}`` for each host
+    as its batch finishes, so callers can report progress as it goes.
+    """
+    per_batch = max(1, DISCOVERY_BATCH // max(1, len(ports)))
+    for offset in range(0, len(hosts), per_batch):
+        batch = hosts[offset:offset + per_batch]
+        probes = [{"name": host, "target": host, "port": port} for host in batch for port in ports]
+        best: dict[str, float | None] = {host: None for host in batch}
+        for result in probe_targets(probes, samples=1, timeout=timeout):
+            if result["received"]:
+                current = best[result["name"]]
+                best[result["name"]] = result["min_ms"] if current is None else min(current, result["min_ms"])
+        for host in batch:
+            yield {"host": host, "up": best[host] is not None, "latency_ms": best[host]}
@@ -0,0 +1,551 @@
+from __future__ import annotations
+
+import math
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import chain
+from typing import Any, Iterable, Iterator
+
+
+BANDWIDTH_FIELDS = ("ts", "upload", "download", "ping")
+ROLLUP_SERIES = ("upload", "download", "ping")
+ROLLUP_FIELDS = ("ts", "count") + tuple(
+    f"{name}{suffix}" for name in ROLLUP_SERIES for suffix in ("", "_min", "_max", "_p95")
+)
+DAY_SECONDS = 86400
+TREND_SERIES = ("upload", "download", "ping", "cpu")
+TREND_WINDOW_SECONDS = 300
+# Running sums for the slope are kept relative to an origin timestamp and
+# rebuilt from the window once the origin is this old, so float error from
+# adding and removing samples cannot build up.
+REBASE_SECONDS = 3600
+
+# (name, bucket width in seconds, longest retention in days)
+ROLLUP_TIERS = (
+    ("1m", 60, 7),
+    ("5m", 300, 30),
+    ("1h", 3600, 365),
+)
+
+
+def _float(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return -1.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class ColumnWindow:
+    """
+    A read-only view over a contiguous time range of a ColumnRing.
+
+    The window holds at most two memoryview segments per column (the ring may
+    wrap), so building one never copies samples. Views stay valid until the
+    ring overwrites the slots they cover, which for history reads served within
+    a request is never in practice.
+    """
+
+    def __init__(self, fields: tuple[str, ...], segments: dict[str, tuple[memoryview, ...]]) -> None:
+        self.fields = fields
+        self._segments = segments
+        self._size = sum(len(segment) for segment in segments[fields[0]]) if fields else 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def segments(self, field: str) -> tuple[memoryview, ...]:
+        return self._segments[field]
+
+    def values(self, field: str) -> Iterator[float]:
+        return chain.from_iterable(self._segments[field])
+
+    def rows(self) -> Iterator[dict[str, float]]:
+        columns = [self.values(field) for field in self.fields]
+        for values in zip(*columns):
+            yield dict(zip(self.fields, values))
+
+    def __iter__(self) -> Iterator[dict[str, float]]:
+        return self.rows()
+
+
+class ColumnRing:
+    """
+    Fixed-capacity ring buffer storing one array('d') per field.
+
+    Rows must be appended in non-decreasing ``ts`` order so time ranges can be
+    located with a binary search instead of a scan.
+    """
+
+    def __init__(self, fields: Iterable[str], capacity: int) -> None:
+        self.fields = tuple(fields)
+        if "ts" not in self.fields:
+            raise ValueError("ColumnRing requires a 'ts' field")
+        self.capacity = max(1, int(capacity))
+        self._columns = {field: array("d", bytes(8 * self.capacity)) for field in self.fields}
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _physical(self, logical: int) -> int:
+        return (self._start + logical) % self.capacity
+
+    def append(self, row: dict[str, Any]) -> None:
+        if self._size < self.capacity:
+            index = self._physical(self._size)
+            self._size += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+        for field, column in self._columns.items():
+            column[index] = _float(row.get(field))
+
+    def clear(self) -> None:
+        self._start = 0
+        self._size = 0
+
+    def row(self, logical: int) -> dict[str, float]:
+        if logical < 0:
+            logical += self._size
+        if not 0 <= logical < self._size:
+            raise IndexError("ColumnRing index out of range")
+        index = self._physical(logical)
+        return {field: column[index] for field, column in self._columns.items()}
+
+    def latest(self) -> dict[str, float] | None:
+        return self.row(-1) if self._size else None
+
+    def _ts(self, logical: int) -> float:
+        return self._columns["ts"][self._physical(logical)]
+
+    def bisect_left(self, ts: float) -> int:
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, ts: float) -> int:
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts(mid) <= ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def drop_before(self, ts: float) -> int:
+        dropped = self.bisect_left(ts)
+        if dropped:
+            self._start = self._physical(dropped)
+            self._size -= dropped
+        return dropped
+
+    def resize(self, capacity: int) -> None:
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+        keep = min(self._size, capacity)
+        window = self.slice(self._size - keep, self._size)
+        columns = {}
+        for field in self.fields:
+            column = array("d", bytes(8 * capacity))
+            offset = 0
+            for segment in window.segments(field):
+                column[offset:offset + len(segment)] = array("d", segment)
+                offset += len(segment)
+            columns[field] = column
+        self._columns = columns
+        self.capacity = capacity
+        self._start = 0
+        self._size = keep
+
+    def slice(self, lo: int, hi: int) -> ColumnWindow:
+        lo = max(0, min(lo, self._size))
+        hi = max(lo, min(hi, self._size))
+        first = self._physical(lo)
+        count = hi - lo
+        spans = []
+        if count:
+            if first + count <= self.capacity:
+                spans.append((first, first + count))
+            else:
+                spans.append((first, self.capacity))
+                spans.append((0, first + count - self.capacity))
+        segments = {
+            field: tuple(memoryview(column)[a:b] for a, b in spans)
+            for field, column in self._columns.items()
+        }
+        return ColumnWindow(self.fields, segments)
+
+    def window(self, start: float | None = None, end: float | None = None) -> ColumnWindow:
+        lo = self.bisect_left(start) if start is not None else 0
+        hi = self.bisect_right(end) if end is not None else self._size
+        return self.slice(lo, hi)
+
+    def tail(self, count: int) -> ColumnWindow:
+        return self.slice(self._size - max(0, count), self._size)
+
+
+def downsample(
+    rows: Iterable[dict[str, Any]],
+    step: float,
+    series: tuple[str, ...] = ("upload", "download", "ping"),
+) -> list[dict[str, Any]]:
+    """
+    Folds time-ordered rows into fixed-width buckets carrying min/avg/max per
+    series. The avg is exposed under the plain series name so bucketed output
+    stays chartable with the same keys as raw points. Negative pings mark a
+    failed probe and are left out of the ping statistics.
+    """
+    step = max(float(step), 1.0)
+    buckets: list[dict[str, Any]] = []
+    bucket_ts = None
+    count = 0
+    stats: dict[str, list[float]] = {}
+
+    def close() -> None:
+        bucket: dict[str, Any] = {"ts": int(bucket_ts), "count": count}
+        for name in series:
+            low, high, total, samples = stats[name]
+            if samples:
+                bucket[name] = round(total / samples, 2)
+                bucket[f"{name}_min"] = round(low, 2)
+                bucket[f"{name}_max"] = round(high, 2)
+            else:
+                bucket[name] = bucket[f"{name}_min"] = bucket[f"{name}_max"] = -1
+        buckets.append(bucket)
+
+    for row in rows:
+        ts = _float(row.get("ts"))
+        key = ts - (ts % step)
+        if key != bucket_ts:
+            if bucket_ts is not None:
+                close()
+            bucket_ts = key
+            count = 0
+            stats = {name: [float("inf"), float("-inf"), 0.0, 0] for name in series}
+        count += 1
+        for name in series:
+            value = _float(row.get(name), -1.0)
+            if name == "ping" and value < 0:
+                continue
+            entry = stats[name]
+            if value < entry[0]:
+                entry[0] = value
+            if value > entry[1]:
+                entry[1] = value
+            entry[2] += value
+            entry[3] += 1
+
+    if bucket_ts is not None:
+        close()
+    return buckets
+
+
+def merge_buckets(rows: Iterable[dict[str, Any]], step: float) -> list[dict[str, Any]]:
+    """
+    Re-buckets pre-aggregated rollup rows into wider buckets. Averages are
+    weighted by sample count; the merged p95 is the highest p95 seen, which
+    is an upper bound rather than an exact percentile.
+    """
+    step = max(float(step), 1.0)
+    merged: list[dict[str, Any]] = []
+    current: dict[str, Any] | None = None
+    weights: dict[str, float] = {}
+
+    for row in rows:
+        key = int(row["ts"] - (row["ts"] % step))
+        count = int(row["count"])
+        if current is None or current["ts"] != key:
+            current = {"ts": key, "count": 0}
+            for name in ROLLUP_SERIES:
+                current[name] = current[f"{name}_min"] = current[f"{name}_max"] = current[f"{name}_p95"] = -1
+            weights = {name: 0.0 for name in ROLLUP_SERIES}
+            merged.append(current)
+        current["count"] += count
+        for name in ROLLUP_SERIES:
+            if row[name] < 0:
+                continue
+            if weights[name]:
+                total = current[name] * weights[name] + row[name] * count
+                current[name] = round(total / (weights[name] + count), 2)
+                current[f"{name}_min"] = min(current[f"{name}_min"], row[f"{name}_min"])
+                current[f"{name}_max"] = max(current[f"{name}_max"], row[f"{name}_max"])
+                current[f"{name}_p95"] = max(current[f"{name}_p95"], row[f"{name}_p95"])
+            else:
+                for suffix in ("", "_min", "_max", "_p95"):
+                    current[f"{name}{suffix}"] = row[f"{name}{suffix}"]
+            weights[name] += count
+    return merged
+
+
+class RollupTier:
+    """
+    Aggregates raw samples into fixed-width buckets as they arrive. The open
+    bucket keeps its raw values (at most width / sample interval per series)
+    so the p95 is exact; closed buckets go into a ColumnRing sized from the
+    retention window.
+    """
+
+    def __init__(self, name: str, width: int, retention_seconds: float) -> None:
+        self.name = name
+        self.width = width
+        self.retention_seconds = retention_seconds
+        self.ring = ColumnRing(ROLLUP_FIELDS, math.ceil(retention_seconds / width))
+        self._bucket_ts: float | None = None
+        self._count = 0
+        self._values: dict[str, array] = {name: array("d") for name in ROLLUP_SERIES}
+
+    def set_retention(self, retention_seconds: float) -> None:
+        self.retention_seconds = retention_seconds
+        self.ring.resize(math.ceil(retention_seconds / self.width))
+
+    def prune(self, now: float) -> int:
+        return self.ring.drop_before(now - self.retention_seconds)
+
+    def _close(self) -> dict[str, Any]:
+        bucket: dict[str, Any] = {"ts": self._bucket_ts, "count": self._count}
+        for name, values in self._values.items():
+            if values:
+                bucket[name] = round(sum(values) / len(values), 2)
+                bucket[f"{name}_min"] = min(values)
+                bucket[f"{name}_max"] = max(values)
+                bucket[f"{name}_p95"] = percentile(list(values), 95)
+            else:
+                bucket[name] = bucket[f"{name}_min"] = bucket[f"{name}_max"] = bucket[f"{name}_p95"] = -1
+            del values[:]
+        self.ring.append(bucket)
+        self._count = 0
+        return bucket
+
+    def add(self, row: dict[str, Any]) -> dict[str, Any] | None:
+        ts = _float(row.get("ts"))
+        key = ts - (ts % self.width)
+        closed = None
+        if self._bucket_ts is not None and key != self._bucket_ts:
+            closed = self._close()
+        self._bucket_ts = key
+        self._count += 1
+        for name, values in self._values.items():
+            value = _float(row.get(name), -1.0)
+            if name == "ping" and value < 0:
+                continue
+            values.append(value)
+        return closed
+
+
+class Rollups:
+    """The 1m/5m/1h rollup tiers fed from the raw bandwidth stream."""
+
+    def __init__(self, retention_days: float = 30, cleanup: bool = True) -> None:
+        self.tiers = [
+            RollupTier(name, width, max_days * DAY_SECONDS)
+            for name, width, max_days in ROLLUP_TIERS
+        ]
+        self.cleanup = cleanup
+        self.configure(retention_days, cleanup)
+
+    def configure(self, retention_days: float, cleanup: bool = True) -> None:
+        """
+        Applies advanced.retention_days to every tier, each capped at its own
+        longest retention. With cleanup disabled tiers keep their cap.
+        """
+        self.cleanup = cleanup
+        for tier, (_, _, max_days) in zip(self.tiers, ROLLUP_TIERS):
+            days = min(retention_days, max_days) if cleanup else max_days
+            tier.set_retention(days * DAY_SECONDS)
+
+    def add(self, row: dict[str, Any]) -> list[tuple[RollupTier, dict[str, Any]]]:
+        closed = []
+        for tier in self.tiers:
+            bucket = tier.add(row)
+            if bucket is not None:
+                closed.append((tier, bucket))
+                if self.cleanup:
+                    tier.prune(bucket["ts"])
+        return closed
+
+    def tier(self, name: str) -> RollupTier:
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier
+        raise KeyError(name)
+
+    def tier_for(self, resolution: float) -> RollupTier | None:
+        """Coarsest tier whose buckets are no wider than the resolution."""
+        chosen = None
+        for tier in self.tiers:
+            if tier.width <= resolution:
+                chosen = tier
+        return chosen
+
+
+class RollingWindow:
+    """
+    Statistics over the samples of the last ``seconds``, updated as samples
+    arrive and expire instead of recomputed from history. Mean and the
+    least-squares slope come from running sums, the p95 from a sorted copy
+    of the window, and ``sustained_above()`` from a stack of suffix minima
+    (each entry is the lowest sample from there to the newest one), so the
+    newest sample below a threshold is found without scanning every sample.
+    """
+
+    def __init__(self, seconds: float = TREND_WINDOW_SECONDS) -> None:
+        self.seconds = seconds
+        self.clear()
+
+    def clear(self) -> None:
+        self._samples: deque[tuple[float, float]] = deque()
+        self._sorted: list[float] = []
+        # [ts, value, ts of the sample that followed it]
+        self._minima: deque[list] = deque()
+        self._evicted: tuple[float, float] | None = None
+        self._origin = 0.0
+        self._sum_y = self._sum_x = self._sum_xx = self._sum_xy = 0.0
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def _rebase(self, origin: float) -> None:
+        self._origin = origin
+        self._sum_y = self._sum_x = self._sum_xx = self._sum_xy = 0.0
+        for ts, value in self._samples:
+            self._accumulate(ts, value, 1)
+
+    def _accumulate(self, ts: float, value: float, sign: int) -> None:
+        x = ts - self._origin
+        self._sum_y += sign * value
+        self._sum_x += sign * x
+        self._sum_xx += sign * x * x
+        self._sum_xy += sign * x * value
+
+    def add(self, ts: float, value: float) -> None:
+        if self._samples:
+            last_ts = self._samples[-1][0]
+            if ts < last_ts:
+                return
+            if ts - last_ts > self.seconds:
+                # A gap longer than the window (sampler stopped): start over.
+                self.clear()
+        if not self._samples:
+            self._origin = ts
+        self._samples.append((ts, value))
+        insort(self._sorted, value)
+        self._accumulate(ts, value, 1)
+        if self._minima:
+            self._minima[-1][2] = ts
+        while self._minima and self._minima[-1][1] >= value:
+            self._minima.pop()
+        self._minima.append([ts, value, None])
+
+        cutoff = ts - self.seconds
+        while self._samples[0][0] <= cutoff:
+            old_ts, old_value = self._samples.popleft()
+            del self._sorted[bisect_left(self._sorted, old_value)]
+            self._accumulate(old_ts, old_value, -1)
+            self._evicted = (old_ts, old_value)
+        while self._minima[0][0] <= cutoff:
+            self._minima.popleft()
+        if ts - self._origin > REBASE_SECONDS:
+            self._rebase(self._samples[0][0])
+
+    def mean(self) -> float:
+        return self._sum_y / len(self._samples) if self._samples else -1.0
+
+    def p95(self) -> float:
+        if not self._sorted:
+            return -1.0
+        return self._sorted[max(0, math.ceil(0.95 * len(self._sorted)) - 1)]
+
+    def slope(self) -> float:
+        """Least-squares trend in units per minute."""
+        count = len(self._samples)
+        denominator = count * self._sum_xx - self._sum_x * self._sum_x
+        if count < 2 or denominator <= 0:
+            return 0.0
+        return (count * self._sum_xy - self._sum_x * self._sum_y) / denominator * 60
+
+    def coverage(self) -> float:
+        """Seconds of history behind the window, at most ``seconds``."""
+        if not self._samples:
+            return 0.0
+        if self._evicted is not None:
+            return float(self.seconds)
+        return self._samples[-1][0] - self._samples[0][0]
+
+    def sustained_above(self, threshold: float) -> float:
+        """Seconds the series has stayed at or above threshold, up to ``seconds``."""
+        if not self._samples or self._samples[-1][1] < threshold:
+            return 0.0
+        latest = self._samples[-1][0]
+        for ts, value, next_ts in reversed(self._minima):
+            if value < threshold:
+                return latest - next_ts
+        if self._evicted is not None and self._evicted[1] >= threshold:
+            return float(self.seconds)
+        return latest - self._samples[0][0]
+
+    def stats(self, threshold: float | None = None) -> dict[str, float]:
+        stats = {
+            "count": len(self._samples),
+            "mean": round(self.mean(), 2),
+            "p95": round(self.p95(), 2),
+            "slope": round(self.slope(), 2),
+            "window": round(self.coverage(), 1),
+        }
+        if threshold is not None:
+            stats["sustained"] = round(self.sustained_above(threshold), 1)
+        return stats
+
+
+class TrendWindows:
+    """
+    One RollingWindow per series, fed with every sampler row as it is
+    stored. Negative pings mark a failed probe and are left out, as in the
+    rollups. Safe to read from request threads while the sampler writes.
+    """
+
+    def __init__(self, series: tuple[str, ...] = TREND_SERIES, seconds: float = TREND_WINDOW_SECONDS) -> None:
+        self.seconds = seconds
+        self.windows = {name: RollingWindow(seconds) for name in series}
+        self._lock = threading.Lock()
+
+    def add(self, row: dict[str, Any]) -> None:
+        ts = _float(row.get("ts"))
+        with self._lock:
+            for name, window in self.windows.items():
+                if row.get(name) is None:
+                    continue
+                value = _float(row.get(name), -1.0)
+                if name == "ping" and value < 0:
+                    continue
+                window.add(ts, value)
+
+    def summary(self, thresholds: dict[str, float] | None = None) -> dict[str, dict[str, float]]:
+        """
+        Stats per series that has samples. Series with an entry in
+        ``thresholds`` also report how long they have been at or above it.
+        """
+        thresholds = thresholds or {}
+        with self._lock:
+            return {
+                name: window.stats(thresholds.get(name))
+                for name, window in self.windows.items()
+                if len(window)
+            }
@@ -1,24 +1,148 @@
+import atexit
 import json
+import logging
+import math
 import os
+import threading
 import time
 from collections import deque
+from datetime import datetime, timedelta
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
+from core.portset import PortSet
+from core.scan_results import ScanResults
+from core.timeseries import BANDWIDTH_FIELDS, ColumnRing, Rollups, TrendWindows, downsample, merge_buckets
+from sqlite_store import SQLiteBackend
+
 try:
     import redis  # type: ignore
 except Exception:  # pragma: no cover - optional dependency
     redis = None
 
+logger = logging.getLogger(__name__)
+
+
+HISTORY_INTERVAL_SECONDS = 2
+HISTORY_CAPACITY = 43200  # 24h at 2s intervals
+MAX_QUERY_BUCKETS = 500
+DEFAULT_QUERY_SECONDS = 3600
+DEFAULT_RETENTION_DAYS = 30.0
+MAX_PENDING_WRITES = 5000
+MAX_ACTIVITIES = 100
+JOURNAL_COMPACT_LINES = 500
+SNAPSHOT_DEBOUNCE_SECONDS = 1.0
+SQLITE_PRUNE_SECONDS = 600.0
+SETTINGS_RECHECK_SECONDS = 5.0
+
+
+class FrozenSettings(dict):
+    """
+    Read-only settings snapshot shared by every caller of get_settings().
+    It is still a dict for isinstance checks and JSON encoding; copy it with
+    dict(...) or copy.deepcopy(...) before changing anything.
+    """
+
+    def _readonly(self, *args: object, **kwargs: object) -> None:
+        raise TypeError("settings snapshot is read-only; copy it and call set_settings()")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __deepcopy__(self, memo: dict) -> dict:
+        return _thaw(self)
+
+    def __reduce__(self) -> tuple:
+        return (_freeze, (_thaw(self),))
+
+
+def _freeze(value: object) -> object:
+    if isinstance(value, dict):
+        return FrozenSettings({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value: object) -> object:
+    if isinstance(value, dict):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def _bandwidth_point(row: dict) -> dict:
+    ts = int(row["ts"])
+    return {
+        "timestamp": time.strftime("%H:%M:%S", time.localtime(ts)),
+        "ts": ts,
+        "upload": row["upload"],
+        "download": row["download"],
+        "ping": row["ping"],
+    }
+
+
+def _legacy_history_points(raw: list[str], now: float) -> list[dict]:
+    """
+    Points from the pre-sorted-set ``bandwidth_history`` list, oldest first,
+    each with a ``ts``. The first versions only stored "HH:MM:SS"; walking
+    back from now, a clock time later than the point after it means the
+    list crossed midnight there.
+    """
+    points = []
+    later = now
+    for item in reversed(raw):
+        try:
+            point = json.loads(item)
+            if "ts" in point:
+                ts = float(point["ts"])
+            else:
+                clock_time = datetime.strptime(point["timestamp"], "%H:%M:%S").time()
+                ts = datetime.combine(datetime.fromtimestamp(later).date(), clock_time).timestamp()
+                if ts > later:
+                    ts -= timedelta(days=1).total_seconds()
+        except (TypeError, ValueError, KeyError, AttributeError):
+            continue
+        points.append({**point, "ts": int(ts)})
+        later = ts
+    points.reverse()
+    return points
+
 
 class MetricsStore:
-    def __init__(self, local_file: str | Path | None = None) -> None:
+    def __init__(
+        self,
+        local_file: str | Path | None = None,
+        persistence: str | None = None,
+        sqlite_file: str | Path | None = None,
+    ) -> None:
         self._redis = None
-        self._history = deque(maxlen=43200)  # 24h at 2s intervals
+        self._sqlite = None
+        self._sqlite_points = []
+        self._sqlite_rollups = []
+        self._last_prune = 0.0
+        self._history = ColumnRing(BANDWIDTH_FIELDS, HISTORY_CAPACITY)
+        self._latest_point = None
+        self._rollups = Rollups(DEFAULT_RETENTION_DAYS)
+        self._trends = TrendWindows()
         self._interface_snapshot = []
-        self._settings = {}
-        self._activities = deque(maxlen=100)
+        self._scan_results = ScanResults()
+        self._settings = FrozenSettings()
+        self._settings_listeners = []
+        self._settings_subscription = None
+        self._activities = deque(maxlen=MAX_ACTIVITIES)
         self._prefix = os.getenv("NETHAWK_REDIS_PREFIX", "nethawk")
+        # Redis write-behind buffer: queued commands go out in one pipeline
+        # every flush_ticks sampler ticks or flush_seconds, whichever is first.
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_ticks = 1
+        self._flush_seconds = float(os.getenv("NETHAWK_REDIS_FLUSH_SECONDS", "10"))
+        self._ticks_since_flush = 0
+        self._last_flush = time.monotonic()
+        self._settings_version = None
+        self._settings_checked_at = 0.0
         self._local_file = Path(
             local_file
             or os.getenv(
@@ -26,114 +150,601 @@ class MetricsStore:
                 Path(__file__).resolve().parent / ".nethawk" / "store.json",
             )
         )
+        self._journal_file = self._local_file.with_suffix(".activities.jsonl")
+        self._journal_lines = 0
+        self._local_lock = threading.Lock()
+        self._snapshot_timer = None
+        self._last_snapshot = 0.0
 
+        persistence = (persistence or os.getenv("NETHAWK_PERSISTENCE", "")).strip().lower()
         redis_url = os.getenv("REDIS_URL")
-        if redis_url and redis is not None:
+        if persistence == "sqlite":
+            self._sqlite = SQLiteBackend(
+                sqlite_file
+                or os.getenv("NETHAWK_SQLITE_PATH", self._local_file.with_name("nethawk.db"))
+            )
+            self._flush_ticks = max(1, int(os.getenv("NETHAWK_SQLITE_FLUSH_TICKS", "5")))
+        elif redis_url and redis is not None and persistence in {"", "redis"}:
             try:
                 client = redis.Redis.from_url(redis_url, decode_responses=True)
                 client.ping()
                 self._redis = client
+                self._flush_ticks = max(1, int(os.getenv("NETHAWK_REDIS_FLUSH_TICKS", "1")))
             except Exception:
                 self._redis = None
 
-        if not self._redis:
+        if self._redis:
+            # None marks the cached settings as stale until the next read.
+            self._settings = None
+            self._subscribe_settings_changes()
+            self._migrate_redis_history()
+        elif self._sqlite:
+            self._load_sqlite_state()
+        else:
             self._load_local_state()
+        self._apply_retention(self.get_settings())
 
     def _key(self, suffix: str) -> str:
         return f"{self._prefix}:{suffix}"
 
+    def _migrate_redis_history(self) -> None:
+        """
+        Moves history from the ``bandwidth_history`` list of earlier versions
+        into the ``bandwidth_series`` sorted set and the rollups, then drops
+        the list. Each point keeps its JSON as the member, so two processes
+        migrating at once ZADD the same members and nothing is duplicated.
+        """
+        legacy = self._key("bandwidth_history")
+        try:
+            raw = self._redis.lrange(legacy, -HISTORY_CAPACITY, -1)
+        except Exception:
+            return
+        if not raw:
+            return
+        points = _legacy_history_points(raw, time.time())
+        key = self._key("bandwidth_series")
+        pipe = self._redis.pipeline(transaction=True)
+        for start in range(0, len(points), 1000):
+            pipe.zadd(key, {json.dumps(point): point["ts"] for point in points[start:start + 1000]})
+        pipe.zremrangebyrank(key, 0, -HISTORY_CAPACITY - 1)
+        pipe.delete(legacy)
+        try:
+            pipe.execute()
+        except Exception:
+            return
+        now = time.time()
+        for point in points:
+            self._add_rollup_point(point)
+            if point["ts"] > now - self._trends.seconds:
+                self._trends.add(point)
+        try:
+            self._flush_pending()
+        except Exception:
+            # The rollup writes stay queued for the sampler's next flush.
+            return
+
     def _load_local_state(self) -> None:
-        if not self._local_file.exists():
+        legacy_activities = []
+        if self._local_file.exists():
+            try:
+                with self._local_file.open("r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+                if isinstance(data, dict):
+                    settings = data.get("settings", {})
+                    activities = data.get("activities", [])
+                    scan_results = data.get("scan_results", {})
+                    self._settings = _freeze(settings if isinstance(settings, dict) else {})
+                    self._scan_results = ScanResults(scan_results if isinstance(scan_results, dict) else {})
+                    legacy_activities = activities if isinstance(activities, list) else []
+            except (OSError, json.JSONDecodeError):
+                self._settings = FrozenSettings()
+
+        if not self._journal_file.exists():
+            # Stores written before the journal kept activities in store.json.
+            self._activities = deque(legacy_activities, maxlen=MAX_ACTIVITIES)
+            if legacy_activities:
+                self._compact_journal()
             return
+
+        self._activities = deque(maxlen=MAX_ACTIVITIES)
         try:
-            with self._local_file.open("r", encoding="utf-8") as fh:
-                data = json.load(fh)
-            if not isinstance(data, dict):
+            with self._journal_file.open("r", encoding="utf-8") as fh:
+                for line in fh:
+                    self._journal_lines += 1
+                    try:
+                        activity = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-append.
+                        continue
+                    if isinstance(activity, dict):
+                        self._activities.appendleft(activity)
+        except OSError:
+            return
+
+    def _load_sqlite_state(self) -> None:
+        settings = self._sqlite.get_value("settings")
+        self._settings = _freeze(settings if isinstance(settings, dict) else {})
+        legacy_results = self._sqlite.get_value("scan_results")
+        if isinstance(legacy_results, dict):
+            # Earlier versions kept every target in one kv blob.
+            for target, record in legacy_results.items():
+                self._sqlite.save_scan_record(target, record)
+            self._sqlite.delete_value("scan_results")
+        self._scan_results = ScanResults(self._sqlite.load_scan_records())
+        self._apply_retention(self._settings)
+        self._activities = deque(self._sqlite.find_activities(limit=MAX_ACTIVITIES), maxlen=MAX_ACTIVITIES)
+        # Closed buckets are restored as-is rather than rebuilt from raw
+        # samples, so tiers survive restarts without double counting.
+        now = time.time()
+        for point in self._sqlite.load_bandwidth(now - HISTORY_CAPACITY * HISTORY_INTERVAL_SECONDS):
+            self._history.append(point)
+            self._latest_point = _bandwidth_point(point)
+            if point["ts"] > now - self._trends.seconds:
+                self._trends.add(point)
+        for tier in self._rollups.tiers:
+            for bucket in self._sqlite.load_rollups(tier.name, now - tier.retention_seconds):
+                tier.ring.append(bucket)
+
+    def _flush_sqlite(self) -> None:
+        with self._pending_lock:
+            points, self._sqlite_points = self._sqlite_points, []
+            buckets, self._sqlite_rollups = self._sqlite_rollups, []
+        if points:
+            self._sqlite.insert_bandwidth(points)
+        if buckets:
+            self._sqlite.insert_rollups(buckets)
+
+        now = time.time()
+        if now - self._last_prune < SQLITE_PRUNE_SECONDS:
+            return
+        self._last_prune = now
+        rollup_before = {}
+        if self._rollups.cleanup:
+            rollup_before = {tier.name: now - tier.retention_seconds for tier in self._rollups.tiers}
+        activities_before = now - self._rollups.tiers[-1].retention_seconds if self._rollups.cleanup else None
+        self._sqlite.prune(now - HISTORY_CAPACITY * HISTORY_INTERVAL_SECONDS, rollup_before, activities_before)
+
+    def _write_atomic(self, path: Path, write) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            "w",
+            encoding="utf-8",
+            dir=path.parent,
+            delete=False,
+            prefix=f".{path.name}.",
+            suffix=".tmp",
+        ) as fh:
+            write(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+            tmp_name = fh.name
+        Path(tmp_name).replace(path)
+
+    def _append_journal(self, activity: dict) -> None:
+        """
+        Adds an activity to memory and the journal under one lock, so a
+        concurrent compaction sees it in both or in neither.
+        """
+        with self._local_lock:
+            self._activities.appendleft(activity)
+            try:
+                self._journal_file.parent.mkdir(parents=True, exist_ok=True)
+                with self._journal_file.open("a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(activity) + "\n")
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            except OSError:
+                # Persistence should never take down live monitoring.
                 return
-            settings = data.get("settings", {})
-            activities = data.get("activities", [])
-            self._settings = settings if isinstance(settings, dict) else {}
-            self._activities = deque(activities if isinstance(activities, list) else [], maxlen=100)
-        except (OSError, json.JSONDecodeError):
-            self._settings = {}
-            self._activities = deque(maxlen=100)
+            self._journal_lines += 1
+            compact = self._journal_lines >= JOURNAL_COMPACT_LINES
+        if compact:
+            self._compact_journal()
+
+    def _compact_journal(self) -> None:
+        def write(fh) -> None:
+            for activity in reversed(activities):
+                fh.write(json.dumps(activity) + "\n")
+
+        try:
+            with self._local_lock:
+                activities = list(self._activities)
+                self._write_atomic(self._journal_file, write)
+                self._journal_lines = len(activities)
+        except OSError:
+            return
 
     def _save_local_state(self) -> None:
+        """
+        Snapshots settings and scan results to store.json. Writes are debounced: the first
+        change goes out immediately, changes within SNAPSHOT_DEBOUNCE_SECONDS
+        after it are coalesced into one trailing write.
+        """
+        if self._redis:
+            return
+        with self._local_lock:
+            if self._snapshot_timer is not None:
+                return
+            delay = self._last_snapshot + SNAPSHOT_DEBOUNCE_SECONDS - time.monotonic()
+            if delay > 0:
+                self._snapshot_timer = threading.Timer(delay, self._write_snapshot)
+                self._snapshot_timer.daemon = True
+                self._snapshot_timer.start()
+                return
+        self._write_snapshot()
+
+    def _write_snapshot(self) -> None:
+        with self._local_lock:
+            self._snapshot_timer = None
+            self._last_snapshot = time.monotonic()
+            payload = {"settings": self._settings, "scan_results": self._scan_results.records}
+            try:
+                self._write_atomic(self._local_file, lambda fh: json.dump(payload, fh, indent=2))
+            except OSError:
+                return
+
+    def close(self) -> None:
+        """Writes out any pending debounced snapshot or buffered Redis/SQLite writes."""
         if self._redis:
+            self._flush_pending()
+            return
+        if self._sqlite:
+            self._flush_sqlite()
+            return
+        with self._local_lock:
+            timer, self._snapshot_timer = self._snapshot_timer, None
+        if timer is not None:
+            timer.cancel()
+            self._write_snapshot()
+
+    def _queue(self, command: str, *args: object, **kwargs: object) -> None:
+        with self._pending_lock:
+            self._pending.append((command, args, kwargs))
+
+    def _flush_pending(self) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
             return
+
+        pipe = self._redis.pipeline(transaction=True)
+        for command, args, kwargs in pending:
+            getattr(pipe, command)(*args, **kwargs)
+        pipe.get(self._key("settings_version"))
         try:
-            self._local_file.parent.mkdir(parents=True, exist_ok=True)
-            payload = {
-                "settings": self._settings,
-                "activities": list(self._activities),
-            }
-            with NamedTemporaryFile(
-                "w",
-                encoding="utf-8",
-                dir=self._local_file.parent,
-                delete=False,
-                prefix=f".{self._local_file.name}.",
-                suffix=".tmp",
-            ) as fh:
-                json.dump(payload, fh, indent=2)
-                tmp_name = fh.name
-            Path(tmp_name).replace(self._local_file)
-        except OSError:
-            # Persistence should never take down live monitoring.
+            results = pipe.execute()
+        except Exception:
+            with self._pending_lock:
+                self._pending = (pending + self._pending)[-MAX_PENDING_WRITES:]
+            raise
+        self._note_settings_version(results[-1])
+
+    def _flush_for_read(self) -> None:
+        # Reads flush first so they see this process's buffered samples. A
+        # failed flush keeps the writes queued and must not fail the read:
+        # serve whatever Redis already has.
+        try:
+            self._flush_pending()
+        except Exception as exc:
+            logger.warning("Redis flush before read failed, serving stored data: %s", exc)
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Marks the end of a sampler tick. In Redis mode buffered writes are sent
+        as a single MULTI pipeline once enough ticks have passed or the flush
+        deadline is reached; the same round trip re-checks the settings version.
+        In SQLite mode the buffered samples are inserted as one transaction.
+        """
+        if not self._redis and not self._sqlite:
             return
+        self._ticks_since_flush += 1
+        now = time.monotonic()
+        if not force and self._ticks_since_flush < self._flush_ticks and now - self._last_flush < self._flush_seconds:
+            return
+        self._ticks_since_flush = 0
+        self._last_flush = now
+        if self._sqlite:
+            self._flush_sqlite()
+        else:
+            self._flush_pending()
+
+    def _subscribe_settings_changes(self) -> None:
+        # Other workers publish the new version on this channel; without a
+        # working subscription get_settings() falls back to polling the
+        # version key every SETTINGS_RECHECK_SECONDS.
+        try:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self._key("settings_changed"): self._on_settings_message})
+            self._settings_subscription = pubsub.run_in_thread(
+                sleep_time=1.0,
+                daemon=True,
+                exception_handler=self._on_settings_subscription_error,
+            )
+        except Exception:
+            self._settings_subscription = None
+
+    def _on_settings_message(self, message: dict) -> None:
+        self._note_settings_version(message.get("data"))
+
+    def _on_settings_subscription_error(self, error: Exception, pubsub: object, thread: object) -> None:
+        thread.stop()
+        self._settings_subscription = None
+
+    def _note_settings_version(self, version: object) -> None:
+        self._settings_checked_at = time.monotonic()
+        version = None if version is None else str(version)
+        if version != self._settings_version:
+            self._settings_version = version
+            self._settings = None
 
     def get_persistence_mode(self) -> str:
-        return "redis" if self._redis else "local_json"
+        if self._redis:
+            return "redis"
+        return "sqlite" if self._sqlite else "local_json"
 
     def get_local_store_path(self) -> str:
-        return str(self._local_file)
+        return str(self._sqlite.path if self._sqlite else self._local_file)
 
     def add_bandwidth_point(self, point: dict) -> None:
         if self._redis:
-            key = self._key("bandwidth_history")
-            self._redis.rpush(key, json.dumps(point))
-            self._redis.ltrim(key, -43200, -1)
+            # Sorted by ts so range reads can be pushed down to Redis.
+            key = self._key("bandwidth_series")
+            self._queue("zadd", key, {json.dumps(point): point.get("ts", time.time())})
+            self._queue("zremrangebyrank", key, 0, -HISTORY_CAPACITY - 1)
+            self._latest_point = point
         else:
+            # Only the numeric columns are kept per sample; the full point
+            # (including the latency detail dict) is retained for the newest one.
             self._history.append(point)
+            self._latest_point = point
+            if self._sqlite:
+                with self._pending_lock:
+                    self._sqlite_points.append(point)
+        self._trends.add(point)
+        self._add_rollup_point(point)
 
-    def get_bandwidth_history(self) -> list[dict]:
+    def get_trends(self) -> TrendWindows:
+        """Rolling windows over the samples this process has stored."""
+        return self._trends
+
+    def get_bandwidth_history(
+        self,
+        limit: int | None = None,
+        since: float | None = None,
+        until: float | None = None,
+    ) -> list[dict]:
         if self._redis:
-            key = self._key("bandwidth_history")
-            raw = self._redis.lrange(key, 0, -1)
+            self._flush_for_read()
+            key = self._key("bandwidth_series")
+            low = "-inf" if since is None else since
+            high = "+inf" if until is None else until
+            if limit:
+                raw = self._redis.zrevrangebyscore(key, high, low, start=0, num=limit)
+                raw.reverse()
+            else:
+                raw = self._redis.zrangebyscore(key, low, high)
             return [json.loads(item) for item in raw]
-        return list(self._history)
+
+        lo = self._history.bisect_left(since) if since is not None else 0
+        hi = self._history.bisect_right(until) if until is not None else len(self._history)
+        if limit:
+            lo = max(lo, hi - limit)
+        return [_bandwidth_point(row) for row in self._history.slice(lo, hi)]
+
+    def get_latest_bandwidth_point(self) -> dict | None:
+        if self._redis and self._latest_point is None:
+            raw = self._redis.zrange(self._key("bandwidth_series"), -1, -1)
+            return json.loads(raw[0]) if raw else None
+        return self._latest_point
+
+    def query_bandwidth(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        resolution: float | None = None,
+    ) -> list[dict]:
+        """
+        Returns min/avg/max buckets for the requested time range; without a
+        start it covers the last DEFAULT_QUERY_SECONDS. Without an explicit
+        resolution the bucket width is chosen so the range fits in
+        MAX_QUERY_BUCKETS points. Ranges reaching past the raw buffer or
+        asking for minute-or-wider buckets are served from the rollup tiers.
+        """
+        end = time.time() if end is None else end
+        if start is None:
+            start = end - DEFAULT_QUERY_SECONDS
+        raw_horizon = end - HISTORY_CAPACITY * HISTORY_INTERVAL_SECONDS
+        if not resolution:
+            resolution = max(HISTORY_INTERVAL_SECONDS, math.ceil((end - start) / MAX_QUERY_BUCKETS))
+        tier = self._rollups.tier_for(resolution)
+        if tier is None and start < raw_horizon:
+            tier = self._rollups.tiers[0]
+        if tier is not None:
+            buckets = merge_buckets(self.get_rollup(tier.name, start, end), resolution)
+            return self._stamp_buckets(buckets)
+
+        if self._redis:
+            self._flush_for_read()
+            raw = self._redis.zrangebyscore(self._key("bandwidth_series"), start, end)
+            rows = [json.loads(item) for item in raw]
+        else:
+            rows = self._history.window(start, end).rows()
+        return self._stamp_buckets(downsample(rows, resolution))
+
+    @staticmethod
+    def _stamp_buckets(buckets: list[dict]) -> list[dict]:
+        for bucket in buckets:
+            bucket["timestamp"] = time.strftime("%H:%M:%S", time.localtime(bucket["ts"]))
+        return buckets
+
+    def _add_rollup_point(self, point: dict) -> None:
+        for tier, bucket in self._rollups.add(point):
+            if self._sqlite:
+                with self._pending_lock:
+                    self._sqlite_rollups.append((tier.name, bucket))
+            if not self._redis:
+                continue
+            key = self._key(f"rollup:{tier.name}")
+            self._queue("zadd", key, {json.dumps(bucket): bucket["ts"]})
+            if self._rollups.cleanup:
+                self._queue("zremrangebyscore", key, "-inf", f"({bucket['ts'] - tier.retention_seconds}")
+
+    def _apply_retention(self, settings: dict) -> None:
+        advanced = settings.get("advanced", {}) if isinstance(settings, dict) else {}
+        try:
+            retention_days = max(1.0, float(advanced.get("retention_days", DEFAULT_RETENTION_DAYS)))
+        except (TypeError, ValueError):
+            retention_days = DEFAULT_RETENTION_DAYS
+        self._rollups.configure(retention_days, bool(advanced.get("db_cleanup", True)))
+
+    def get_rollup(self, tier: str, since: float | None = None, until: float | None = None) -> list[dict]:
+        """Closed 1m/5m/1h buckets with min/max/avg/p95 per series."""
+        if self._redis:
+            self._flush_for_read()
+            raw = self._redis.zrangebyscore(
+                self._key(f"rollup:{tier}"),
+                "-inf" if since is None else since,
+                "+inf" if until is None else until,
+            )
+            return [json.loads(item) for item in raw]
+        rows = self._rollups.tier(tier).ring.window(since, until).rows()
+        return [{**row, "ts": int(row["ts"]), "count": int(row["count"])} for row in rows]
 
     def set_interface_snapshot(self, interfaces: list[dict]) -> None:
         if self._redis:
-            key = self._key("interface_usage")
-            self._redis.set(key, json.dumps(interfaces))
+            self._queue("set", self._key("interface_usage"), json.dumps(interfaces))
         else:
             self._interface_snapshot = interfaces
 
     def get_interface_snapshot(self) -> list[dict]:
         if self._redis:
+            self._flush_for_read()
             key = self._key("interface_usage")
             raw = self._redis.get(key)
             return json.loads(raw) if raw else []
         return self._interface_snapshot
 
+    def _refresh_scan_records(self, target: str | None = None) -> None:
+        # Redis is shared between processes, so read the record(s) back
+        # before using the local copy.
+        key = self._key("scan_results")
+        if target is None:
+            raw = self._redis.hgetall(key)
+            self._scan_results = ScanResults({name: json.loads(value) for name, value in raw.items()})
+            return
+        raw = self._redis.hget(key, target)
+        if raw:
+            self._scan_results.records[target] = json.loads(raw)
+
+    def scan_skip_ports(self, target: str, ports: PortSet, max_age: float) -> PortSet:
+        """Ports of ``ports`` confirmed closed on target within max_age seconds."""
+        if self._redis:
+            self._refresh_scan_records(target)
+        with self._local_lock:
+            return self._scan_results.recently_closed(target, ports, max_age)
+
+    def record_scan(
+        self,
+        target: str,
+        scanned: PortSet,
+        states: dict[int, str],
+        default_state: str | None = None,
+        services: dict[int, str] | None = None,
+    ) -> dict:
+        """Stores one scan's port states for target and returns the opened/closed diff."""
+        if self._redis:
+            self._refresh_scan_records(target)
+        with self._local_lock:
+            diff = self._scan_results.record(target, scanned, states, default_state, services)
+            dropped = self._scan_results.prune()
+            record = self._scan_results.get(target)
+            if self._sqlite:
+                # One row per target, so a sweep rewrites only its own hosts.
+                self._sqlite.save_scan_record(target, record, dropped)
+            payload = json.dumps(record)
+        if self._redis:
+            key = self._key("scan_results")
+            self._redis.hset(key, target, payload)
+            if dropped:
+                self._redis.hdel(key, *dropped)
+        elif not self._sqlite:
+            self._save_local_state()
+        return diff
+
+    def get_scan_history(self, target: str) -> list[dict]:
+        if self._redis:
+            self._refresh_scan_records(target)
+        with self._local_lock:
+            return self._scan_results.history(target)
+
+    def get_scan_result(self, target: str | None = None) -> dict | None:
+        """Latest structured scan result for target (default: most recent target)."""
+        if self._redis:
+            self._refresh_scan_records(target)
+        with self._local_lock:
+            return self._scan_results.summary(target)
+
+    def _store_settings(self, settings: dict, version: object) -> FrozenSettings:
+        snapshot = _freeze(settings)
+        self._settings = snapshot
+        self._settings_version = None if version is None else str(version)
+        self._settings_checked_at = time.monotonic()
+        self._apply_retention(snapshot)
+        for callback in list(self._settings_listeners):
+            callback(snapshot)
+        return snapshot
+
+    def on_settings_change(self, callback) -> None:
+        """Registers callback(settings) for every settings change seen by this process."""
+        self._settings_listeners.append(callback)
+
+    def get_settings_version(self) -> str | None:
+        self.get_settings()
+        return self._settings_version
+
     def set_settings(self, settings: dict) -> dict:
-        settings = dict(settings)
+        settings = _thaw(settings)
         settings["updated_at"] = int(time.time())
         if self._redis:
-            key = self._key("settings")
-            self._redis.set(key, json.dumps(settings))
+            pipe = self._redis.pipeline(transaction=True)
+            pipe.set(self._key("settings"), json.dumps(settings))
+            pipe.incr(self._key("settings_version"))
+            _, version = pipe.execute()
+            saved = self._store_settings(settings, version)
+            self._redis.publish(self._key("settings_changed"), str(version))
+            return saved
+        version = int(self._settings_version or 0) + 1
+        saved = self._store_settings(settings, version)
+        if self._sqlite:
+            self._sqlite.set_value("settings", settings)
         else:
-            self._settings = settings
             self._save_local_state()
-        return settings
+        return saved
 
     def get_settings(self) -> dict:
-        if self._redis:
-            key = self._key("settings")
-            raw = self._redis.get(key)
-            return json.loads(raw) if raw else {}
-        return self._settings
+        """
+        Returns the cached, read-only settings snapshot. In Redis mode the
+        snapshot is refreshed only when the settings version moves.
+        """
+        if not self._redis:
+            return self._settings
+        # The pub/sub thread may drop self._settings at any point, so work
+        # on a local reference and return that.
+        snapshot = self._settings
+        if (
+            snapshot is not None
+            and self._settings_subscription is None
+            and time.monotonic() - self._settings_checked_at >= SETTINGS_RECHECK_SECONDS
+        ):
+            self._note_settings_version(self._redis.get(self._key("settings_version")))
+            snapshot = self._settings
+        if snapshot is None:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.get(self._key("settings"))
+            pipe.get(self._key("settings_version"))
+            raw, version = pipe.execute()
+            snapshot = self._store_settings(json.loads(raw) if raw else {}, version)
+        return snapshot
 
     def add_activity(self, activity_type: str, message: str, status: str = "info", **extra: object) -> dict:
         now = int(time.time())
@@ -149,19 +760,49 @@ class MetricsStore:
         if self._redis:
             key = self._key("activities")
             self._redis.lpush(key, json.dumps(activity))
-            self._redis.ltrim(key, 0, 99)
-        else:
+            self._redis.ltrim(key, 0, MAX_ACTIVITIES - 1)
+        elif self._sqlite:
             self._activities.appendleft(activity)
-            self._save_local_state()
+            self._sqlite.insert_activity(activity)
+        else:
+            self._append_journal(activity)
         return activity
 
     def get_activities(self, limit: int = 10) -> list[dict]:
-        limit = max(1, min(limit, 100))
+        limit = max(1, min(limit, MAX_ACTIVITIES))
         if self._redis:
             key = self._key("activities")
             raw = self._redis.lrange(key, 0, limit - 1)
             return [json.loads(item) for item in raw]
         return list(self._activities)[:limit]
 
+    def find_activities(
+        self,
+        activity_type: str | None = None,
+        status: str | None = None,
+        require: str | None = None,
+        limit: int = 1,
+    ) -> list[dict]:
+        """
+        Newest activities matching type/status that carry a non-null
+        ``require`` field, e.g. the last scan with open_ports. SQLite answers
+        this from its indexes; the other modes scan the recent activity list.
+        """
+        if self._sqlite:
+            return self._sqlite.find_activities(activity_type, status, require, limit)
+        matches = []
+        for activity in self.get_activities(limit=MAX_ACTIVITIES):
+            if activity_type is not None and activity.get("type") != activity_type:
+                continue
+            if status is not None and activity.get("status") != status:
+                continue
+            if require is not None and activity.get(require) is None:
+                continue
+            matches.append(activity)
+            if len(matches) >= limit:
+                break
+        return matches
+
 
 metrics_store = MetricsStore()
+atexit.register(metrics_store.close)
@@ -1,10 +1,12 @@
+import threading
+
 from textual.app import App, ComposeResult
 from textual.containers import Container, Horizontal, Vertical
 from textual.reactive import reactive
 from textual.widgets import Button, Input, Static
 from textual.worker import Worker
 
-from core.port_scan import run_local_port_scan
+from core.port_scan import iter_local_port_scan
 from metrics_store import metrics_store
 from nethawk_tui.screens import (
     render_bandwidth,
@@ -23,6 +25,7 @@ from nethawk_tui.widgets import (
     current_settings,
     format_time,
     recent_activities,
+    record_scan_result,
     save_tui_settings,
 )
 
@@ -45,6 +48,7 @@ class NetHawkTUI(App):
         ("up", "nav_previous", "Previous"),
         ("down", "nav_next", "Next"),
         ("enter", "refresh", "Open"),
+        ("escape", "cancel_scan", "Cancel scan"),
     ]
 
     active_screen = reactive("dashboard")
@@ -55,6 +59,7 @@ class NetHawkTUI(App):
     refresh_count = reactive(0)
     refresh_in_progress = False
     scan_running = False
+    scan_stop: threading.Event | None = None
     scan_state = {
         "status": "idle",
         "target": "127.0.0.1",
@@ -77,7 +82,9 @@ class NetHawkTUI(App):
                         yield Input(value="127.0.0.1", placeholder="Target host/IP", id="scan_target")
                         yield Static("Ports or range", classes="field_label")
                         yield Input(value="22,80,443", placeholder="Ports e.g. 22,80,443 or 1-100", id="scan_ports")
-                        yield Button("Start Scan", id="scan_start", variant="primary")
+                        with Horizontal(classes="buttons"):
+                            yield Button("Start Scan", id="scan_start", variant="primary")
+                            yield Button("Cancel Scan", id="scan_cancel", variant="error")
                     with Horizontal(id="settings_form", classes="form"):
                         yield Input(placeholder="Latency target", id="set_latency_target")
                         yield Input(placeholder="Latency port", id="set_latency_port")
@@ -96,7 +103,7 @@ class NetHawkTUI(App):
         self.query_one("#topbar", Static).update(render_topbar(self.status, self.latency, self.refreshed_at))
         self.query_one("#sidebar", Static).update(render_sidebar(self.active_screen))
         self.query_one("#bottombar", Static).update(
-            f" {self.last_message} | q r d o s b h g ? | arrows nav"
+            f" {self.last_message} | q r d o s b h g ? | arrows nav | esc cancel scan"
         )
         self.update_forms()
 
@@ -161,11 +168,30 @@ class NetHawkTUI(App):
                 "results": result.get("results", []),
                 "open_ports": result.get("open_ports", []),
             })
-            if result.get("status") == "completed":
+            if result.get("status") == "stopped":
                 metrics_store.add_activity(
                     "scan",
-                    f"TUI port scan completed for {result.get('target')}: {len(result.get('open_ports', []))} open port(s)",
-                    "success",
+                    f"TUI port scan stopped for {result.get('target')}: {len(result.get('open_ports', []))} open port(s) found",
+                    "warning",
+                    host=result.get("target"),
+                    ports=result.get("ports"),
+                    open_ports=result.get("open_ports", []),
+                )
+            elif result.get("status") in ("completed", "partial"):
+                partial = result.get("status") == "partial"
+                diff = record_scan_result(result)
+                self.scan_state["diff"] = diff
+                if diff["opened"] or diff["closed"]:
+                    changes = []
+                    if diff["opened"]:
+                        changes.append(f"opened {', '.join(str(port) for port in diff['opened'])}")
+                    if diff["closed"]:
+                        changes.append(f"closed {', '.join(str(port) for port in diff['closed'])}")
+                    self.scan_state["message"] = f"{self.scan_state['message']} Since last scan: {'; '.join(changes)}."
+                metrics_store.add_activity(
+                    "scan",
+                    f"TUI port scan {'timed out' if partial else 'completed'} for {result.get('target')}: {len(result.get('open_ports', []))} open port(s)",
+                    "warning" if partial else "success",
                     host=result.get("target"),
                     ports=result.get("ports"),
                     open_ports=result.get("open_ports", []),
@@ -288,6 +314,8 @@ class NetHawkTUI(App):
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "scan_start":
             self.start_scan()
+        elif event.button.id == "scan_cancel":
+            self.action_cancel_scan()
         elif event.button.id == "settings_save":
             self.save_settings()
 
@@ -322,13 +350,50 @@ class NetHawkTUI(App):
             return
         target = self.query_one("#scan_target", Input).value.strip()
         ports = self.query_one("#scan_ports", Input).value.strip()
-        self.scan_state.update({"status": "running", "target": target, "ports": ports, "message": "Scan running...", "results": []})
+        self.scan_state.update({"status": "running", "target": target, "ports": ports, "message": "Scan running...", "results": [], "progress": 0})
         metrics_store.add_activity("scan", f"TUI port scan started for {target} on {ports}", "info", host=target, ports=ports)
         self.scan_running = True
+        self.scan_stop = threading.Event()
         self.query_one("#content", Static).update(render_scan(self.scan_state))
-        self.last_message = "Scan running"
+        self.last_message = "Scan running (esc to cancel)"
+        self.refresh_chrome()
+        stop_event = self.scan_stop
+        self.run_worker(lambda: self.run_scan(target, ports, stop_event), thread=True)
+
+    def run_scan(self, target: str, ports: str, stop_event: threading.Event) -> dict:
+        """Worker thread: streams the scan into the UI and returns the final result."""
+        result = {"status": "failed", "message": "Scan ended without a result.", "target": target, "ports": ports, "results": []}
+        try:
+            for kind, data in iter_local_port_scan(target, ports, settings=current_settings(), stop_event=stop_event):
+                if kind == "result":
+                    result = data
+                else:
+                    self.call_from_thread(self.scan_update, kind, data)
+        except Exception as exc:
+            result = {**result, "message": str(exc)}
+        return {"kind": "scan_result", "result": result}
+
+    def scan_update(self, kind: str, data: dict) -> None:
+        if not self.scan_running:
+            return
+        if kind == "row":
+            self.scan_state["results"].append(data)
+            open_count = sum(1 for row in self.scan_state["results"] if row.get("state") == "open")
+            self.scan_state["message"] = f"Scan running... {open_count} open port(s) so far."
+        elif kind == "progress":
+            self.scan_state["progress"] = data["percent"]
+        if self.active_screen == "scan":
+            self.query_one("#content", Static).update(render_scan(self.scan_state))
+
+    def action_cancel_scan(self) -> None:
+        if not self.scan_running or self.scan_stop is None:
+            return
+        self.scan_stop.set()
+        self.scan_state["message"] = "Cancelling scan..."
+        self.last_message = "Cancelling scan"
+        if self.active_screen == "scan":
+            self.query_one("#content", Static).update(render_scan(self.scan_state))
         self.refresh_chrome()
-        self.run_worker(lambda: {"kind": "scan_result", "result": run_local_port_scan(target, ports)}, thread=True)
 
     def save_settings(self) -> None:
         values = {
@@ -84,6 +84,35 @@ def metric_panel(label: str, value: str, percent: float | None = None, style: st
     return Panel(content, title=label, border_style=style, box=box.ROUNDED)
 
 
+def _ms(value) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def render_latency_targets(targets: list[dict]):
+    table = Table(title="Latency Targets", box=box.ROUNDED, expand=True, border_style="cyan")
+    table.add_column("Probe", width=10)
+    table.add_column("Target")
+    table.add_column("Min", justify="right")
+    table.add_column("Median", justify="right")
+    table.add_column("p95", justify="right")
+    table.add_column("Jitter", justify="right")
+    table.add_column("Loss", justify="right")
+    table.add_column("Status")
+    for item in targets:
+        status = str(item.get("status", "unknown"))
+        table.add_row(
+            str(item.get("name", "-")),
+            f"{item.get('target')}:{item.get('port')}",
+            _ms(item.get("min_ms")),
+            _ms(item.get("median_ms")),
+            _ms(item.get("p95_ms")),
+            _ms(item.get("jitter_ms")),
+            f"{item.get('loss_pct', 0):.0f}%",
+            Text(status, style=status_color(status)),
+        )
+    return table
+
+
 def render_dashboard(snapshot: dict, pulse: int = 0):
     latency = snapshot["latency"]
     latency_ms = latency.get("latency_ms")
@@ -126,6 +155,9 @@ def render_dashboard(snapshot: dict, pulse: int = 0):
         border_style="dim",
         box=box.ROUNDED,
     )
+    targets = latency.get("targets") or []
+    if len(targets) > 1:
+        return Group(table, render_latency_targets(targets), note)
     return Group(table, note)
 
 
@@ -144,6 +176,8 @@ def render_doctor(result: dict):
 
     if not panels:
         panels.append(Panel("No diagnosis available.", border_style="yellow", box=box.ROUNDED))
+    if result.get("latency_targets"):
+        panels.append(render_latency_targets(result["latency_targets"]))
     return Group(*panels)
 
 
@@ -175,6 +209,8 @@ def render_scan(scan_state: dict):
     summary.add_row("Status", Text(str(status).upper(), style=status_color(status)))
     summary.add_row("Target", str(scan_state.get("target") or "127.0.0.1"))
     summary.add_row("Ports", str(scan_state.get("ports") or "22,80,443"))
+    if status == "running":
+        summary.add_row("Progress", f"{scan_state.get('progress', 0):.0f}%")
     summary.add_row("Message", str(scan_state.get("message") or "Enter target and ports, then press Start Scan."))
 
     results = Table(title="Scan Results", box=box.ROUNDED, expand=True, border_style="cyan")
@@ -204,7 +240,7 @@ def render_scan(scan_state: dict):
     return Group(
         Panel(summary, title="Port Scan", border_style=status_color(status), box=box.ROUNDED),
         results,
-        Panel("Type in the bottom fields. Use Tab to move fields. Press Enter or Start Scan to run.", border_style="dim", box=box.ROUNDED),
+        Panel("Type in the bottom fields. Use Tab to move fields. Press Enter or Start Scan to run, Esc or Cancel Scan to stop.", border_style="dim", box=box.ROUNDED),
     )
 
 
@@ -254,6 +290,7 @@ def render_help():
     table.add_row("Up/Down", "Move through sidebar")
     table.add_row("Enter", "Refresh/open current screen")
     table.add_row("?", "Open Help")
+    table.add_row("Esc", "Cancel a running port scan")
     return Group(
         table,
         Panel(
@@ -4,13 +4,17 @@ from datetime import datetime
 
 import psutil
 
-from core.diagnosis_engine import generate_diagnosis
-from core.latency import latency_settings, measure_latency
+from core.diagnosis_engine import DiagnosisEngine
+from core.latency import measure_latency_targets
+from core.portset import PortSet
+from core.scan_results import states_from_rows
+from core.timeseries import TrendWindows
 from metrics_store import metrics_store
 
 _last_net_sample: tuple[float, object] | None = None
-_last_latency: dict | None = None
-_last_latency_at = 0.0
+_diagnosis_engine = DiagnosisEngine()
+# Fed from every dashboard refresh; the TUI does not run the backend sampler.
+_trends = TrendWindows()
 
 
 def _bandwidth_sample() -> tuple[float, float]:
@@ -34,17 +38,8 @@ def _bandwidth_sample() -> tuple[float, float]:
 
 
 def _latency_sample(force: bool = False) -> dict:
-    global _last_latency, _last_latency_at
-    now = time.perf_counter()
-    if not force and _last_latency is not None and now - _last_latency_at < 3:
-        return {**_last_latency, "cached": True}
-
-    settings = metrics_store.get_settings()
-    target, port = latency_settings(settings)
-    _last_latency = measure_latency(target=target, port=port, timeout=0.35)
-    _last_latency["cached"] = False
-    _last_latency_at = now
-    return _last_latency
+    measured = measure_latency_targets(metrics_store.get_settings(), timeout=0.35, force=force)
+    return {**measured["primary"], "targets": measured["targets"]}
 
 
 def collect_dashboard_snapshot(force_latency: bool = False) -> dict:
@@ -52,7 +47,7 @@ def collect_dashboard_snapshot(force_latency: bool = False) -> dict:
     disk = shutil.disk_usage("/")
     latency = _latency_sample(force=force_latency)
 
-    return {
+    snapshot = {
         "cpu": psutil.cpu_percent(interval=None),
         "memory": psutil.virtual_memory().percent,
         "disk": round((disk.used / disk.total) * 100, 2),
@@ -62,15 +57,23 @@ def collect_dashboard_snapshot(force_latency: bool = False) -> dict:
         "uptime_seconds": int(time.time() - psutil.boot_time()),
         "timestamp": int(time.time()),
     }
+    _trends.add({
+        "ts": time.time(),
+        "cpu": snapshot["cpu"],
+        "upload": upload,
+        "download": download,
+        "ping": latency["latency_ms"] if latency.get("latency_ms") is not None else -1,
+    })
+    return snapshot
 
 
 def collect_doctor_snapshot(force_latency: bool = False) -> dict:
     dashboard = collect_dashboard_snapshot(force_latency=force_latency)
     settings = metrics_store.get_settings()
     activities = metrics_store.get_activities(limit=25)
-    scan_result = latest_scan_result(activities)
+    scan_result = latest_scan_result()
 
-    result = generate_diagnosis(
+    result = _diagnosis_engine.diagnose(
         metrics={
             "cpu": dashboard["cpu"],
             "memory": dashboard["memory"],
@@ -83,20 +86,28 @@ def collect_doctor_snapshot(force_latency: bool = False) -> dict:
         activities=activities,
         scan_result=scan_result,
         settings=settings,
+        settings_version=metrics_store.get_settings_version(),
+        trends=_trends,
     )
     result["dashboard"] = dashboard
+    result["latency_targets"] = dashboard["latency"].get("targets", [])
     return result
 
 
-def latest_scan_result(activities: list[dict]) -> dict | None:
-    for activity in activities:
-        if activity.get("type") == "scan" and isinstance(activity.get("open_ports"), list):
-            return {
-                "host": activity.get("host"),
-                "ports": activity.get("ports"),
-                "open_ports": activity.get("open_ports", []),
-            }
-    return None
+def latest_scan_result() -> dict | None:
+    return metrics_store.get_scan_result()
+
+
+def record_scan_result(result: dict) -> dict:
+    """Stores a completed or partial TUI scan in the scan result store and returns its diff."""
+    states, services, default_state = states_from_rows(result.get("results", []))
+    return metrics_store.record_scan(
+        result.get("target", ""),
+        PortSet.from_spec(result.get("scanned_ports", result.get("ports"))),
+        states,
+        default_state=default_state,
+        services=services,
+    )
 
 
 def recent_activities(limit: int = 12) -> list[dict]:
@@ -111,7 +122,7 @@ def current_settings() -> dict:
 
 
 def save_tui_settings(values: dict) -> tuple[bool, str, dict]:
-    settings = current_settings()
+    settings = dict(current_settings())
     network = dict(settings.get("network", {}))
     thresholds = dict(settings.get("thresholds", {}))
 
@@ -1,94 +1,176 @@
 import logging
 import psutil
 import time
-from flask import Blueprint, request, current_app
-import threading 
+from flask import request
+from flask_socketio import join_room, leave_room
+import threading
 
-logger = logging.getLogger(__name__)
-
-bandwidth_bp = Blueprint('bandwidth_monitor', __name__)
+from core.latency import LatencyProber, latency_settings
+from metrics_store import metrics_store
 
-active_bandwidth_sessions = {}
-bandwidth_sessions_lock = threading.Lock() 
+logger = logging.getLogger(__name__)
 
-def _monitor_loop(sid, app_context, socketio_instance):
-    """
-    The actual bandwidth monitoring loop that runs in a background thread.
-    Emits 'bandwidth_update' events to the specific client using the provided socketio_instance.
-    """
-    _last_net_io_counters = psutil.net_io_counters()
-    _last_timestamp = time.time()
+BANDWIDTH_ROOM = "bandwidth"
+SAMPLE_INTERVAL_SECONDS = 2
 
-    with app_context:
-        logger.info(f"Bandwidth monitor loop started for SID: {sid}")
-        session_info = None
-        with bandwidth_sessions_lock:
-            session_info = active_bandwidth_sessions.get(sid)
 
-        if not session_info:
-            logger.warning(f"No session info found for SID {sid} at loop start. Exiting.")
-            return
+latency_prober = LatencyProber(settings_loader=metrics_store.get_settings)
 
-        stop_event = session_info['stop_event']
 
-        while not stop_event.is_set():
-            try:
-                socketio_instance.sleep(2) 
+def _pending_latency() -> dict:
+    target, port = latency_settings(metrics_store.get_settings())
+    return {
+        "latency_ms": None,
+        "target": target,
+        "port": port,
+        "status": "unavailable",
+        "error": "No latency sample yet",
+    }
 
-                now = time.time()
-                cur = psutil.net_io_counters()
-                elapsed = now - _last_timestamp or 1 
 
-                sent_bps = (cur.bytes_sent - _last_net_io_counters.bytes_sent) / elapsed
-                recv_bps = (cur.bytes_recv - _last_net_io_counters.bytes_recv) / elapsed
+def _mbps(byte_delta: float, elapsed: float) -> float:
+    return round(((byte_delta / elapsed) * 8) / (1024 * 1024), 2)
 
-                upload_mbps = round((sent_bps * 8) / (1024 * 1024), 2)
-                download_mbps = round((recv_bps * 8) / (1024 * 1024), 2)
 
-                ping_ms = 0.0
-                try:
-                    ping_ms = round(psutil.cpu_times_percent(interval=0.1).user, 2)
-                except Exception as ping_e:
-                    logger.warning(f"SID {sid}: Error calculating 'ping' (CPU usage): {ping_e}")
-                    ping_ms = -1
+class BandwidthSampler:
+    """
+    Single psutil sampler for the whole process. Every tick is stored in the
+    metrics store; it is emitted to the bandwidth Socket.IO room only while at
+    least one client is subscribed, so the sampling cost stays the same no
+    matter how many dashboards are open.
+    """
 
-                _last_net_io_counters = cur
-                _last_timestamp = now
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS) -> None:
+        self.interval = interval
+        self._socketio = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def start(self, socketio_instance) -> None:
+        with self._lock:
+            self._socketio = socketio_instance
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        latency_prober.start()
+        logger.info("Bandwidth sampler started.")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        latency_prober.stop()
+
+    def subscribe(self, sid: str) -> int:
+        """Adds one subscription for sid and returns the total subscriber count."""
+        with self._lock:
+            if sid not in self._subscribers:
+                join_room(BANDWIDTH_ROOM, sid=sid, namespace="/")
+            self._subscribers[sid] = self._subscribers.get(sid, 0) + 1
+            return sum(self._subscribers.values())
+
+    def unsubscribe(self, sid: str, everything: bool = False) -> int:
+        """Drops one (or every) subscription held by sid and returns the total."""
+        with self._lock:
+            count = self._subscribers.get(sid, 0)
+            if count:
+                count = 0 if everything else count - 1
+                if count:
+                    self._subscribers[sid] = count
+                else:
+                    del self._subscribers[sid]
+                    leave_room(BANDWIDTH_ROOM, sid=sid, namespace="/")
+            return sum(self._subscribers.values())
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(self._subscribers.values())
+
+    def is_subscribed(self, sid: str) -> bool:
+        with self._lock:
+            return sid in self._subscribers
+
+    def _run(self) -> None:
+        last, last_t = psutil.net_io_counters(), time.monotonic()
+        last_pernic = psutil.net_io_counters(pernic=True)
+        psutil.cpu_percent(interval=None)
+        next_tick = last_t + self.interval
+
+        while not self._stop_event.is_set():
+            try:
+                # Sleep to an absolute deadline so the work done in a tick
+                # does not stretch the sampling period.
+                self._socketio.sleep(max(0.0, next_tick - time.monotonic()))
+                next_tick += self.interval
+                if next_tick < time.monotonic():
+                    next_tick = time.monotonic() + self.interval
+
+                mono = time.monotonic()
+                now = time.time()
+                cur = psutil.net_io_counters()
+                elapsed = mono - last_t or 1
 
-                timestamp_str = time.strftime("%H:%M:%S", time.localtime(now))
+                # Latest result from the independent prober; never blocks.
+                latency = latency_prober.latest() or _pending_latency()
+                ping_ms = latency["latency_ms"] if latency["latency_ms"] is not None else -1
 
                 bandwidth_data = {
-                    "timestamp": timestamp_str,
-                    "upload": upload_mbps,
-                    "download": download_mbps,
-                    "ping": ping_ms
+                    "timestamp": time.strftime("%H:%M:%S", time.localtime(now)),
+                    "ts": int(now),
+                    "upload": _mbps(cur.bytes_sent - last.bytes_sent, elapsed),
+                    "download": _mbps(cur.bytes_recv - last.bytes_recv, elapsed),
+                    "ping": ping_ms,
+                    "cpu": psutil.cpu_percent(interval=None),
+                    "latency": latency,
                 }
-
-                socketio_instance.emit('bandwidth_update', bandwidth_data, room=sid)
-                logger.debug(f"SID {sid}: Emitted bandwidth_update: {bandwidth_data}")
+                last, last_t = cur, mono
+
+                if self.subscriber_count():
+                    self._socketio.emit("bandwidth_update", bandwidth_data, room=BANDWIDTH_ROOM)
+                metrics_store.add_bandwidth_point(bandwidth_data)
+
+                current_pernic = psutil.net_io_counters(pernic=True)
+                interface_usage = []
+                for name, cur_stats in current_pernic.items():
+                    prev_stats = last_pernic.get(name)
+                    if not prev_stats:
+                        continue
+                    upload_mbps = _mbps(cur_stats.bytes_sent - prev_stats.bytes_sent, elapsed)
+                    download_mbps = _mbps(cur_stats.bytes_recv - prev_stats.bytes_recv, elapsed)
+                    interface_usage.append({
+                        "name": name,
+                        "upload": upload_mbps,
+                        "download": download_mbps,
+                        "total": round(upload_mbps + download_mbps, 2),
+                    })
+                interface_usage.sort(key=lambda item: item["total"], reverse=True)
+                metrics_store.set_interface_snapshot(interface_usage)
+                metrics_store.flush()
+                last_pernic = current_pernic
 
             except Exception as e:
-                logger.error(f"SID {sid}: Error in bandwidth monitor loop: {e}", exc_info=True)
+                logger.error(f"Error in bandwidth sampler: {e}", exc_info=True)
+                self._socketio.sleep(1)
+        logger.info("Bandwidth sampler stopped.")
+
+
+bandwidth_sampler = BandwidthSampler()
 
-        logger.info(f"Bandwidth monitor loop stopped for SID: {sid}")
-        with bandwidth_sessions_lock:
-            if sid in active_bandwidth_sessions:
-                del active_bandwidth_sessions[sid]
 
 def clear_bandwidth_session(sid):
     """
-    Helper function to stop and clear a bandwidth monitoring session.
-    Called on client disconnect or explicit stop request.
+    Drops every bandwidth subscription held by sid.
+    Called on client disconnect.
     """
-    
-    with bandwidth_sessions_lock:
-        if sid in active_bandwidth_sessions:
-            logger.info(f"Clearing bandwidth session for SID: {sid}")
-            active_bandwidth_sessions[sid]['stop_event'].set() 
-            del active_bandwidth_sessions[sid]
-            return True
+    if bandwidth_sampler.is_subscribed(sid):
+        logger.info(f"Clearing bandwidth subscription for SID: {sid}")
+        bandwidth_sampler.unsubscribe(sid, everything=True)
+        return True
     return False
 
+
 def register_bandwidth_socket_events(socketio_instance):
     """
     Registers Socket.IO event handlers for the bandwidth monitor.
@@ -97,31 +179,18 @@ def register_bandwidth_socket_events(socketio_instance):
     @socketio_instance.on('start_bandwidth_monitor')
     def handle_start_bandwidth_monitor():
         sid = request.sid
-        logger.info(f"Received start_bandwidth_monitor from SID: {sid}")
-
-        with bandwidth_sessions_lock:
-            if sid in active_bandwidth_sessions and active_bandwidth_sessions[sid]['thread'].is_alive():
-                logger.info(f"Bandwidth monitor already active for SID: {sid}. Not starting new one.")
-                socketio_instance.emit('bandwidth_status', {'status': 'info', 'message': 'Bandwidth monitor already running.'}, room=sid)
-                return
-            clear_bandwidth_session(sid)
-
-            stop_event = threading.Event()
-            thread = threading.Thread(target=_monitor_loop, args=(sid, current_app.app_context(), socketio_instance))
-            thread.start()
-
-            active_bandwidth_sessions[sid] = {
-                'thread': thread,
-                'stop_event': stop_event
-            }
-            socketio_instance.emit('bandwidth_status', {'status': 'success', 'message': 'Bandwidth monitor started.'}, room=sid)
-            logger.info(f"Bandwidth monitor started for SID: {sid}")
+        bandwidth_sampler.start(socketio_instance)
+        if bandwidth_sampler.is_subscribed(sid):
+            socketio_instance.emit('bandwidth_status', {'status': 'info', 'message': 'Bandwidth monitor already running.'}, room=sid)
+            return
+        total = bandwidth_sampler.subscribe(sid)
+        logger.info(f"SID {sid} subscribed to bandwidth updates ({total} subscriber(s)).")
+        socketio_instance.emit('bandwidth_status', {'status': 'success', 'message': 'Bandwidth monitor started.'}, room=sid)
 
     @socketio_instance.on('stop_bandwidth_monitor')
     def handle_stop_bandwidth_monitor():
         sid = request.sid
-        logger.info(f"Received stop_bandwidth_monitor from SID: {sid}")
         if clear_bandwidth_session(sid):
             socketio_instance.emit('bandwidth_status', {'status': 'info', 'message': 'Bandwidth monitor stopped.'}, room=sid)
         else:
-            socketio_instance.emit('bandwidth_status', {'status': 'info', 'message': 'No active bandwidth monitor to stop.'}, room=sid)
\ No newline at end of file
+            socketio_instance.emit('bandwidth_status', {'status': 'info', 'message': 'No active bandwidth monitor to stop.'}, room=sid)
@@ -1,3 +1,5 @@
+import math
+
 from flask import Blueprint, jsonify, request
 from metrics_store import metrics_store
 
@@ -8,11 +10,22 @@ bandwidth_api_bp = Blueprint("bandwidth_api", __name__)
 def bandwidth_history():
     """
     Returns stored bandwidth history points.
+
+    With since/until (epoch seconds) or step (bucket width in seconds) the
+    range is served as min/avg/max buckets instead of raw points.
     """
-    history = metrics_store.get_bandwidth_history()
+    since = request.args.get("since", type=float)
+    until = request.args.get("until", type=float)
+    step = request.args.get("step", type=float)
+    if since is not None or until is not None or step is not None:
+        if any(value is not None and not math.isfinite(value) for value in (since, until, step)):
+            return jsonify({"error": "since, until and step must be finite numbers"}), 400
+        if step is not None and step <= 0:
+            return jsonify({"error": "step must be a positive number of seconds"}), 400
+        return jsonify(metrics_store.query_bandwidth(since, until, step))
+
     limit = request.args.get("limit", type=int)
-    if limit:
-        history = history[-limit:]
+    history = metrics_store.get_bandwidth_history(limit=limit if limit and limit > 0 else None)
     return jsonify(history)
 
 
@@ -4,48 +4,45 @@ import time
 import psutil
 from flask import Blueprint, jsonify
 
-from core.diagnosis_engine import generate_diagnosis
-from core.latency import latency_settings, measure_latency
+from core.diagnosis_engine import DiagnosisEngine, disabled_rules
+from core.diagnosis_rules import registered_rules
+from core.latency import measure_latency_targets
 from metrics_store import metrics_store
 
 
 doctor_bp = Blueprint("doctor", __name__)
 _last_doctor_status = None
+diagnosis_engine = DiagnosisEngine()
 
 
 def _latest_bandwidth_metrics() -> dict:
-    history = metrics_store.get_bandwidth_history()
-    latest = history[-1] if history else {}
+    latest = metrics_store.get_latest_bandwidth_point() or {}
     return {
         "upload": latest.get("upload", 0),
         "download": latest.get("download", 0),
         "network": latest.get("upload", 0) + latest.get("download", 0),
+        "cpu": latest.get("cpu"),
     }
 
 
 def _current_metrics() -> dict:
+    # CPU comes from the bandwidth sampler, never a blocking psutil
+    # interval; the diagnosis engine prefers its trend-window mean anyway.
     du = shutil.disk_usage("/")
     bandwidth = _latest_bandwidth_metrics()
+    cpu = bandwidth.pop("cpu")
     return {
-        "cpu": psutil.cpu_percent(interval=0.2),
+        "cpu": cpu if cpu is not None else psutil.cpu_percent(interval=None),
         "memory": psutil.virtual_memory().percent,
         "disk": round((du.used / du.total) * 100, 2),
         **bandwidth,
     }
 
 
-def _latest_scan_result(activities: list[dict]) -> dict | None:
-    # Full scan history can improve this later. For now the doctor uses the
-    # latest completed scan activity if it contains open_ports.
-    for activity in activities:
-        if activity.get("type") == "scan" and isinstance(activity.get("open_ports"), list):
-            return {
-                "host": activity.get("host"),
-                "ports": activity.get("ports"),
-                "open_ports": activity.get("open_ports", []),
-                "timestamp": activity.get("timestamp"),
-            }
-    return None
+def _latest_scan_result() -> dict | None:
+    # The scan result store keeps per-port state and the opened/closed diff
+    # for the most recently scanned target.
+    return metrics_store.get_scan_result()
 
 
 def _record_status_change(status: str) -> None:
@@ -69,17 +66,22 @@ def _record_status_change(status: str) -> None:
 @doctor_bp.route("/diagnosis", methods=["GET"])
 def doctor():
     settings = metrics_store.get_settings()
-    target, port = latency_settings(settings)
-    latency = measure_latency(target=target, port=port, timeout=1.0)
+    measured = measure_latency_targets(settings, timeout=1.0)
+    latency = measured["primary"]
     activities = metrics_store.get_activities(limit=25)
+    trends = metrics_store.get_trends()
 
-    result = generate_diagnosis(
+    result = diagnosis_engine.diagnose(
         metrics=_current_metrics(),
         latency=latency,
         activities=activities,
-        scan_result=_latest_scan_result(activities),
+        scan_result=_latest_scan_result(),
         settings=settings,
+        settings_version=metrics_store.get_settings_version(),
+        trends=trends,
     )
+    result["latency_targets"] = measured["targets"]
+    result["trends"] = trends.summary()
     result["source"] = {
         "metrics": "psutil",
         "latency": "tcp_connect",
@@ -89,3 +91,14 @@ def doctor():
 
     _record_status_change(result["overall_status"])
     return jsonify(result)
+
+
+@doctor_bp.route("/doctor/rules", methods=["GET"])
+def doctor_rules():
+    disabled = set(disabled_rules(metrics_store.get_settings()))
+    return jsonify({
+        "rules": [
+            {**rule.describe(), "enabled": rule.id not in disabled}
+            for rule in registered_rules()
+        ],
+    })
@@ -127,11 +127,8 @@ def register_mail_socket_events(socketio_instance):
     # def on_connect():
     #     logger.info(f"Client connected: {request.sid}")
 
-    @socketio_instance.on("disconnect")
-    def on_disconnect():
-        """Handles client disconnection to clean up IMAP sessions."""
-        clear_session_connection(request.sid)
-        logger.info(f"Client disconnected and IMAP session cleared: {request.sid}")
+    # IMAP sessions are cleared from app.handle_disconnect; registering a
+    # second "disconnect" handler here would replace that one.
 
     @socketio_instance.on("mail_connect")
     def handle_mail_connect(data):
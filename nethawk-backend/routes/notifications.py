@@ -1,7 +1,7 @@
 import time
 import psutil
 from flask import Blueprint, jsonify
-from core.latency import latency_settings, measure_latency
+from core.latency import cached_latency
 from metrics_store import metrics_store
 
 notifications_bp = Blueprint("notifications", __name__)
@@ -68,9 +68,8 @@ def get_notifications():
         notifications.append(item)
         _record_alert_once("disk", item["message"])
 
-    history = metrics_store.get_bandwidth_history()
-    if history:
-        latest = history[-1]
+    latest = metrics_store.get_latest_bandwidth_point()
+    if latest:
         bandwidth = latest.get("download", 0) + latest.get("upload", 0)
         if bandwidth >= bandwidth_threshold:
             item = {
@@ -83,8 +82,8 @@ def get_notifications():
             notifications.append(item)
             _record_alert_once("bandwidth", item["message"])
 
-    target, port = latency_settings(settings)
-    latency = measure_latency(target=target, port=port, timeout=1.0)
+    latency = cached_latency(settings, timeout=1.0)
+    target = latency["target"]
     latency_ms = latency.get("latency_ms")
     if latency["status"] != "ok" or (latency_ms is not None and latency_ms >= latency_threshold):
         message = (
@@ -102,4 +101,16 @@ def get_notifications():
         notifications.append(item)
         _record_alert_once("latency", item["message"])
 
+    # Changes found by scheduled scans in the last day.
+    for alert in metrics_store.find_activities(activity_type="alert", require="opened", limit=5):
+        if now - int(alert.get("timestamp", 0)) > 86400:
+            break
+        notifications.append({
+            "id": alert.get("id", f"scan-change-{now}"),
+            "type": "scan_change",
+            "level": "warning",
+            "message": alert.get("message", ""),
+            "timestamp": alert.get("timestamp", now),
+        })
+
     return jsonify({"count": len(notifications), "notifications": notifications})
@@ -1,81 +1,140 @@
-import nmap # type: ignore
 import re
 import time
-import eventlet
 from threading import Event
 import logging 
 import subprocess 
+import xml.etree.ElementTree as ET
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+from core.async_scan import iter_native_scan
+from core.fingerprint import describe
+from core.nmap_xml import iter_nmap_events
+from core.port_scan import iter_nmap_lines, nmap_command, parse_ports, ports_by_risk, resolve_engine, scan_settings
+from core.portset import PortSet
 from metrics_store import metrics_store
 
 ip_add_pattern = re.compile(r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$")
 
 
 def _get_scan_config():
-    settings = metrics_store.get_settings()
-    adv = settings.get("advanced", {})
-    try:
-        timeout = int(adv.get("scan_timeout", 30))
-    except ValueError:
-        timeout = 30
-    try:
-        threads = int(adv.get("scan_threads", 10))
-    except ValueError:
-        threads = 10
-    try:
-        retries = int(adv.get("scan_retries", 3))
-    except ValueError:
-        retries = 3
+    return scan_settings(metrics_store.get_settings())
 
-    timeout = max(5, min(timeout, 300))
-    threads = max(1, min(threads, 100))
-    retries = max(0, min(retries, 10))
+def _observed(results, host):
+    return results.setdefault(host, {"states": {}, "services": {}, "fingerprints": {}, "extraports": set()})
 
-    return {
-        "timeout": timeout,
-        "threads": threads,
-        "retries": retries
-    }
 
-def parse_ports_string(ports_input_string):
+def _record_results(scanned_ports, results):
     """
-    Parses a string of ports, which can include ranges (e.g., '20-30')
-    and comma-separated values (e.g., '80,443,22').
-    Returns a string suitable for nmap's -p option.
+    Stores each host's port states in the scan result store and yields a
+    scan_diff update per host: newly opened/closed ports, plus the open
+    ports on the critical/warning lists. A host's "scanned" set, when
+    present, narrows scanned_ports to the ports that were really probed;
+    hosts nmap gave up on are not recorded at all.
     """
-    ports_to_scan = []
-    
-    ports_input_string = ports_input_string.lower().replace(" ", "")
-
-    parts = ports_input_string.split(',')
-    for part in parts:
-        if '-' in part:
-            try:
-                start, end = map(int, part.split('-'))
-                if 0 <= start <= 65535 and 0 <= end <= 65535 and start <= end:
-                    ports_to_scan.append(f"{start}-{end}")
-            except ValueError:
-                pass
-        else:
-            try:
-                port = int(part)
-                if 0 <= port <= 65535:
-                    ports_to_scan.append(str(port))
-            except ValueError:
-                pass
-    
-    return ",".join(sorted(list(set(ports_to_scan)), key=lambda x: (int(x.split('-')[0]) if '-' in x else int(x.split('-')[0])) ))
+    for host, observed in results.items():
+        if observed.get("timed_out"):
+            continue
+        extraports = observed["extraports"]
+        default_state = next(iter(extraports)) if len(extraports) == 1 else None
+        diff = metrics_store.record_scan(
+            host,
+            observed.get("scanned", scanned_ports),
+            observed["states"],
+            default_state=default_state,
+            services=observed["services"],
+        )
+        risky = ports_by_risk(PortSet(diff["open_ports"]), observed["fingerprints"])
+        yield {"status": "scan_diff", "ip": host, **diff, "risky": {risk: ports.to_spec() for risk, ports in risky.items()}}
+
+
+def _run_native_scan(hosts, ports_arg, scan_cfg, stop_event, results):
+    """
+    Built-in asyncio connect scan. Yields the same updates as the nmap path,
+    streaming each open port as soon as it is found. Every port state is
+    collected into results. Returns the number of ports probed, which is
+    short of len(ports_arg) * len(hosts) when a host hit its deadline, or
+    None if the scan failed or was stopped.
+    """
+    rate = f", at most {scan_cfg['max_pps']} connects/s" if scan_cfg["max_pps"] else ""
+    banners = ", banner grabbing on" if scan_cfg["banner_grab"] else ""
+    yield {"status": "info", "message": f"Native scan engine: up to {scan_cfg['threads']} concurrent connects (adaptive){rate}, {scan_cfg['retries']} retries{banners}."}
+    rate_stats = {}
+    yield {"status": "progress", "message": "Scan started.", "progress": 0}
+    total = len(ports_arg) * len(hosts) or 1
+    scanned = 0
+    reported = 0
+    try:
+        for row in iter_native_scan(
+            hosts,
+            ports_arg,
+            threads=scan_cfg["threads"],
+            timeout=scan_cfg["timeout"],
+            retries=scan_cfg["retries"],
+            stop_event=stop_event,
+            banner_grab=scan_cfg["banner_grab"],
+            max_pps=scan_cfg["max_pps"],
+            rate_stats=rate_stats,
+        ):
+            scanned += 1
+            observed = _observed(results, row["target"])
+            # Only ports that returned a row count as scanned: the per-host
+            # deadline can end a host's scan before every port is probed.
+            observed.setdefault("scanned", PortSet()).bits |= 1 << row["port"]
+            observed["states"][row["port"]] = row["state"]
+            observed["services"][row["port"]] = row["service"]
+            if row.get("fingerprint"):
+                observed["fingerprints"][row["port"]] = row["fingerprint"]
+            percent = int(scanned * 100 / total)
+            if percent >= reported + 5:
+                reported = percent
+                yield {"status": "progress", "message": f"{scanned}/{total} ports checked", "progress": percent}
+            if row["state"] == "open":
+                yield {
+                    "status": "open_port",
+                    "port": row["port"],
+                    "service": row["service"],
+                    "state": row["state"],
+                    "ip": row["target"],
+                    "details": describe(row) if "fingerprint" in row else row["service"],
+                    "risk": row["risk"],
+                    "banner": row.get("banner", ""),
+                }
+    except OSError as e:
+        logging.error(f"Native scan could not resolve {', '.join(hosts)}: {e}")
+        yield {"status": "error", "message": f"Could not resolve target: {e}"}
+        return None
+
+    if stop_event.is_set():
+        logging.info("Native scan stopped by user request.")
+        yield {"status": "stopped", "message": "Scan stopped by user request."}
+        return None
+    if rate_stats.get("decreases"):
+        yield {
+            "status": "info",
+            "message": f"Rate control backed off {rate_stats['decreases']} time(s) after {rate_stats['drops']} dropped probe(s); finished at {rate_stats['window']} concurrent connects.",
+            "rate": rate_stats,
+        }
+    return scanned
+
+
+def _describe_hosts(hosts):
+    if len(hosts) <= 3:
+        return ", ".join(hosts)
+    return f"{', '.join(hosts[:3])} and {len(hosts) - 3} more host(s)"
 
 
 def run_port_scan(ip_address, ports_string, stop_event):
     """
     Performs the nmap scan and yields a dictionary of updates.
+    ip_address is one host or a list of hosts; with several hosts nmap
+    scans them in parallel and every port update carries its "ip".
     The stop_event allows the scan to be interrupted.
     """
-    nmap_ports_arg = parse_ports_string(ports_string)
-    if not nmap_ports_arg:
+    hosts = [ip_address] if isinstance(ip_address, str) else list(ip_address)
+    requested = PortSet.from_spec(ports_string)
+    nmap_ports_arg = requested.to_spec()
+    if not requested:
         logging.error("No valid ports to scan provided.")
         yield {"status": "error", "message": "No valid ports to scan."}
         return
@@ -85,122 +144,132 @@ def run_port_scan(ip_address, ports_string, stop_event):
         yield {"status": "stopped", "message": "Scan aborted before starting."}
         return
 
-    yield {"status": "info", "message": f"Starting scan on {ip_address} for ports: {nmap_ports_arg}", "ip": ip_address}
+    yield {"status": "info", "message": f"Starting scan on {_describe_hosts(hosts)} for ports: {nmap_ports_arg}", "ip": hosts[0] if len(hosts) == 1 else None}
     
+    process = None
     try:
         scan_cfg = _get_scan_config()
-        host_timeout = f"{scan_cfg['timeout']}s"
-
-        nmap_options_list = [
-            "-Pn",
-            "-sT",
-            "-T4",
-            "-p",
-            nmap_ports_arg,
-            "--host-timeout",
-            host_timeout,
-            "--max-retries",
-            str(scan_cfg["retries"]),
-            "--min-parallelism",
-            str(scan_cfg["threads"]),
-            "--max-parallelism",
-            str(scan_cfg["threads"]),
-            "-oX",
-            "-"
-        ]  # -sT = TCP connect scan
-
-        command = ['nmap'] + nmap_options_list + [ip_address] 
 
+        # Skip ports every host confirmed closed recently; anything that was
+        # ever open or filtered is always re-verified.
+        skipped = PortSet()
+        if scan_cfg["cache_minutes"]:
+            max_age = scan_cfg["cache_minutes"] * 60
+            for index, host in enumerate(hosts):
+                recent = metrics_store.scan_skip_ports(host, requested, max_age)
+                skipped = recent if index == 0 else skipped & recent
+                if not skipped:
+                    break
+        scanned_ports = requested - skipped
+        if skipped:
+            yield {"status": "info", "message": f"Skipping {len(skipped)} port(s) confirmed closed in the last {scan_cfg['cache_minutes']} minute(s).", "skipped": len(skipped)}
+        if not scanned_ports:
+            yield {"status": "complete", "message": "All requested ports were confirmed closed recently; nothing to re-scan.", "skipped": len(skipped)}
+            return
+        nmap_ports_arg = scanned_ports.to_spec()
+
+        results = {}
+        if resolve_engine(scan_cfg["engine"]) == "native":
+            probed = yield from _run_native_scan(hosts, scanned_ports, scan_cfg, stop_event, results)
+            if probed is not None:
+                yield from _record_results(scanned_ports, results)
+                total = len(scanned_ports) * len(hosts)
+                message = f"Scan completed ({probed} port(s) checked)."
+                if probed < total:
+                    message = f"Scan timed out after {scan_cfg['timeout']} seconds per host: {probed} of {total} port(s) checked, results are partial."
+                yield {"status": "complete", "message": message, "skipped": len(skipped), "checked": probed, "unchecked": total - probed, "partial": probed < total}
+            return
+
+        command = nmap_command(hosts, nmap_ports_arg, scan_cfg)  # -sT = TCP connect scan
 
         full_command_str = " ".join(command) # For logging purposes
         yield {"status": "info", "message": f"Nmap command: {full_command_str}"}
         logging.info(f"Executing Nmap command: {full_command_str}")
 
-        # Execute Nmap using subprocess.run
-        # Use a timeout to prevent indefinite hangs, and allow interrupt
-        process = None 
         try:
-            # We don't have real-time progress updates with this method unless we parse stderr
-            # on the fly, which is more complex. So, progress will be basic.
-            yield {"status": "progress", "message": "Scan started (no real-time progress).", "progress": 0}
+            yield {"status": "progress", "message": "Scan started.", "progress": 0}
 
-            # Start the process without waiting for it to finish immediately
+            # nmap writes --stats-every records into the XML stream as
+            # <taskprogress>, so stdout alone carries both progress and
+            # results. The periodic records also bound how long a stop
+            # request waits for the next line. Port rows come per host:
+            # nmap emits a host's <port> elements only when it finishes it.
             process = subprocess.Popen(
                 command,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True # Decode stdout/stderr automatically
             )
-            
-            while process.poll() is None: # While process is still running
-                if stop_event.is_set():
-                    logging.info("Scan stopped by user request during execution (subprocess).")
-                    process.terminate() # or process.kill() for more aggressive stop
-                    yield {"status": "stopped", "message": "Scan stopped by user request."}
-                    return
-                eventlet.sleep(1) # Yield control
 
-            stdout, stderr = process.communicate() # Get remaining output after process finishes
+            hosts_seen = 0
+            for kind, data in iter_nmap_events(iter_nmap_lines(process.stdout, stop_event)):
+                if kind == "progress":
+                    yield {
+                        "status": "progress",
+                        "message": f"{data['task']}: {data['percent']}%",
+                        "progress": data["percent"],
+                        "remaining_seconds": data["remaining"],
+                    }
+                elif kind == "extraports":
+                    _observed(results, data["host"])["extraports"].add(data["state"])
+                elif kind == "port":
+                    observed = _observed(results, data["host"])
+                    observed["states"][data["port"]] = data["state"]
+                    observed["services"][data["port"]] = data["service"]
+                    if data["state"] == "open":
+                        service = data["service"] or "unknown"
+                        extra = " ".join(part for part in (data["product"], data["version"]) if part)
+                        yield {
+                            "status": "open_port",
+                            "port": data["port"],
+                            "service": service,
+                            "state": data["state"],
+                            "ip": data["host"],
+                            "details": f"{service} ({extra})" if extra else service,
+                        }
+                    else:
+                        yield {
+                            "status": "port_status",
+                            "port": data["port"],
+                            "state": data["state"],
+                            "ip": data["host"]
+                        }
+                elif kind == "host":
+                    hosts_seen += 1
+                    if data["timed_out"]:
+                        _observed(results, data["host"])["timed_out"] = True
+                        yield {"status": "info", "ip": data["host"], "message": f"{data['host']} hit the {scan_cfg['timeout']}s host timeout; its results are partial and were not recorded."}
+                    if len(hosts) > 1:
+                        yield {"status": "host_complete", "ip": data["host"], "state": data["status"], "message": f"Finished {data['host']} ({hosts_seen}/{len(hosts)})."}
 
             if stop_event.is_set():
-                logging.info("Scan stopped before processing results (subprocess).")
+                logging.info("Scan stopped by user request during execution (subprocess).")
+                process.terminate()
+                yield {"status": "stopped", "message": "Scan stopped by user request."}
                 return
-            
+
+            stderr = process.stderr.read()
+            process.wait()
             logging.info(f"Nmap process finished. Return code: {process.returncode}")
 
-            if process.returncode == 0:
-                try:
-                    temp_scanner = nmap.PortScanner()
-                    # Parse the XML output directly from stdout
-                    temp_scanner.analyse_nmap_xml_scan(stdout)
-                    
-                    if ip_address in temp_scanner.all_hosts():
-                        host_info = temp_scanner[ip_address]
-                        if 'tcp' in host_info:
-                            for port in sorted(host_info['tcp'].keys()):
-                                if stop_event.is_set():
-                                    logging.info(f"Scan stopped during result processing for {port}.")
-                                    yield {"status": "stopped", "message": "Scan stopped by user request during result processing."}
-                                    return
-                                
-                                port_status = host_info['tcp'][port]['state']
-                                
-                                if port_status == 'open':
-                                    service = host_info['tcp'][port].get('name', 'unknown')
-                                    product = host_info['tcp'][port].get('product', '')
-                                    version = host_info['tcp'][port].get('version', '')
-                                    extra_info = f" ({product} {version})" if product or version else ""
-                                    yield {
-                                        "status": "open_port",
-                                        "port": port,
-                                        "service": service,
-                                        "state": port_status,
-                                        "ip": ip_address,
-                                        "details": f"{service}{extra_info}"
-                                    }
-                                else:
-                                    yield {
-                                        "status": "port_status",
-                                        "port": port,
-                                        "state": port_status,
-                                        "ip": ip_address
-                                    }
-                    else:
-                        logging.info(f"No detailed scan results found for {ip_address} in Nmap output.")
-                        yield {"status": "info", "message": f"No detailed scan results found for {ip_address}."}
-
-                except nmap.PortScannerError as e:
-                    logging.error(f"Error parsing Nmap XML output: {e}")
-                    yield {"status": "error", "message": f"Error parsing Nmap XML output: {e}"}
-                except Exception as e:
-                    logging.error(f"An unexpected error occurred during result parsing: {e}")
-                    yield {"status": "error", "message": f"An unexpected error occurred during result parsing: {e}"}
-            else:
+            if process.returncode != 0:
                 logging.error(f"Nmap scan failed with error code {process.returncode}. Stderr: {stderr}")
                 yield {"status": "error", "message": f"Nmap scan failed with error code {process.returncode}. Stderr: {stderr[:500]}..."}
-                
-            yield {"status": "complete", "message": "Scan completed."}
-            
+            elif not hosts_seen:
+                logging.info(f"No detailed scan results found for {_describe_hosts(hosts)} in Nmap output.")
+                yield {"status": "info", "message": f"No detailed scan results found for {_describe_hosts(hosts)}."}
+            else:
+                yield from _record_results(scanned_ports, results)
+
+            timed_out = [host for host, observed in results.items() if observed.get("timed_out")]
+            message = "Scan completed."
+            if timed_out:
+                message = f"Scan timed out after {scan_cfg['timeout']} seconds on {_describe_hosts(timed_out)}: results are partial."
+            yield {"status": "complete", "message": message, "skipped": len(skipped), "partial": bool(timed_out)}
+
+        except ET.ParseError as e:
+            logging.error(f"Error parsing Nmap XML output: {e}")
+            yield {"status": "error", "message": f"Error parsing Nmap XML output: {e}"}
         except FileNotFoundError:
             logging.error(f"Error: Nmap command not found. Ensure Nmap is installed on the server.")
             yield {"status": "error", "message": "Nmap command not found. Check server installation."}
@@ -210,7 +279,6 @@ def run_port_scan(ip_address, ports_string, stop_event):
     finally:
         if process and process.poll() is None: # Ensure process is terminated if still running
             process.terminate()
-        stop_event.clear()
 
 
 # Example usage if run directly (for testing the scanner part)
@@ -229,7 +297,7 @@ if __name__ == "__main__":
         print("Please enter the ports to scan (e.g., '80,443,22', '1-100', or '20-30,80,443'):")
         port_input = input("Enter ports: ")
         
-        test_ports_string = parse_ports_string(port_input)
+        test_ports_string = parse_ports(port_input)
         if test_ports_string:
             print(f"Scanning with Nmap ports argument: {test_ports_string}")
             break
@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify, request
+
+from core.scheduler import ScanScheduler
+from metrics_store import metrics_store
+
+
+schedules_bp = Blueprint("schedules", __name__)
+scan_scheduler = ScanScheduler(settings_source=metrics_store.get_settings)
+
+
+@schedules_bp.route("/", methods=["GET"])
+def list_schedules():
+    scans = metrics_store.get_settings().get("scans", {})
+    return jsonify({
+        "enabled": bool(scans.get("scheduler_enabled", True)),
+        "schedules": scan_scheduler.status(),
+    })
+
+
+@schedules_bp.route("/<schedule_id>/run", methods=["POST"])
+def run_schedule(schedule_id):
+    if not scan_scheduler.run_now(schedule_id):
+        return jsonify({"success": False, "message": "Unknown, invalid or already running schedule."}), 409
+    return jsonify({"success": True})
+
+
+@schedules_bp.route("/history", methods=["GET"])
+def scan_history():
+    target = request.args.get("target", "").strip()
+    if not target:
+        return jsonify({"success": False, "message": "target is required."}), 400
+    return jsonify({"target": target, "history": metrics_store.get_scan_history(target)})
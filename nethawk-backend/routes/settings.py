@@ -15,7 +15,11 @@ DEFAULT_SETTINGS = {
         "default_interface": "eth0",
         "default_range": "192.168.1.0/24",
         "latency_target": "8.8.8.8",
-        "latency_port": 53
+        "latency_port": 53,
+        "probe_targets": "",
+        "probe_gateway": True,
+        "probe_dns": True,
+        "probe_samples": 3
     },
     "appearance": {
         "theme": "dark",
@@ -30,6 +34,14 @@ DEFAULT_SETTINGS = {
         "sound": False,
         "security": True
     },
+    "scans": {
+        "scheduler_enabled": True,
+        "max_running": 1,
+        "schedules": []
+    },
+    "doctor": {
+        "disabled_rules": []
+    },
     "thresholds": {
         "cpu": 80,
         "memory": 85,
@@ -48,6 +60,10 @@ DEFAULT_SETTINGS = {
         "scan_timeout": 30,
         "scan_threads": 10,
         "scan_retries": 3,
+        "scan_engine": "auto",
+        "scan_cache_minutes": 10,
+        "banner_grab": True,
+        "scan_max_pps": 0,
         "auto_save": True,
         "retention_days": "30",
         "export_format": "json",
@@ -5,7 +5,8 @@ import sys
 BACKEND_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BACKEND_DIR))
 
-from core.diagnosis_engine import generate_diagnosis
+from core.diagnosis_engine import DiagnosisEngine, generate_diagnosis
+from core.timeseries import TrendWindows
 
 
 def titles(result: dict) -> set[str]:
@@ -49,6 +50,43 @@ def main() -> int:
     )
     assert_has(unavailable, "Latency target unavailable")
 
+    engine = DiagnosisEngine()
+    metrics = {"cpu": 20, "memory": 40, "upload": 1, "download": 1, "network": 2}
+    latency = {"latency_ms": 20, "target": "8.8.8.8", "status": "ok", "error": None}
+    activities = [{"id": f"a{index}", "status": "warning" if index % 2 else "info"} for index in range(6)]
+    first = engine.diagnose(metrics, latency, activities)
+    assert_has(first, "Frequent recent alerts")
+    runs = engine.rule_runs
+    again = engine.diagnose(metrics, latency, activities)
+    assert engine.rule_runs == runs, "Unchanged inputs should not re-run rules"
+    assert again["cards"] == first["cards"]
+    activities = [{"id": "a6", "status": "info"}, {"id": "a7", "status": "info"}, *activities[:4]]
+    calmer = engine.diagnose(metrics, latency, activities)
+    assert calmer["cards"] == generate_diagnosis(metrics, latency, activities)["cards"]
+
+    disabled = generate_diagnosis(
+        metrics={"cpu": 92, "memory": 45, "upload": 1, "download": 1, "network": 2},
+        latency={"latency_ms": 25, "target": "8.8.8.8", "status": "ok", "error": None},
+        settings={"doctor": {"disabled_rules": ["cpu_bottleneck"]}},
+    )
+    assert "Local system bottleneck" not in titles(disabled)
+
+    trends = TrendWindows()
+    for index in range(200):
+        spike = 400 if index == 190 else 0
+        trends.add({"ts": 1000 + index * 2, "cpu": 95, "upload": 1, "download": 1, "ping": 20 + spike})
+    trending = generate_diagnosis(metrics, latency, trends=trends)
+    assert_has(trending, "Sustained high CPU")
+    assert "Latency high across the last few minutes" not in titles(trending), "One slow probe is not a trend"
+
+    calm = TrendWindows()
+    for index in range(60):
+        calm.add({"ts": 1000 + index * 2, "cpu": 20, "upload": 1, "download": 1, "ping": 25})
+    spiking = {"cpu": 97, "memory": 45, "upload": 1, "download": 1, "network": 2}
+    assert_has(generate_diagnosis(spiking, latency), "Local system bottleneck")
+    smoothed = generate_diagnosis(spiking, latency, trends=calm)
+    assert "Local system bottleneck" not in titles(smoothed), "A single CPU spike should be averaged out by the trend window"
+
     print("Diagnosis verification passed")
     print("Sample warning output:")
     print(congestion)
@@ -1,16 +1,384 @@
+import copy
+from datetime import datetime
+import json
+import os
 from pathlib import Path
+import socket
 import sys
 import tempfile
+import threading
+import time
 
 
 BACKEND_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BACKEND_DIR))
 
-from core.latency import measure_latency
-from metrics_store import MetricsStore
+# The shared sampler stores its ticks in the module-level store; keep it
+# out of the checkout's .nethawk/ directory.
+STORE_DIR = tempfile.TemporaryDirectory()
+os.environ["NETHAWK_LOCAL_STORE"] = str(Path(STORE_DIR.name) / "store.json")
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from core import latency as latency_module
+from core.latency import (
+    LATENCY_CACHE_TTL_SECONDS,
+    PROBE_INTERVAL_SECONDS,
+    PROBE_JITTER,
+    PROBE_TIMEOUT_SECONDS,
+    LatencyCache,
+    LatencyProber,
+    latency_targets,
+    measure_latency,
+    probe_samples,
+    probe_targets,
+)
+from core.scheduler import ScanScheduler, ScheduledScan, parse_schedule
+from core.timeseries import BANDWIDTH_FIELDS, ColumnRing, Rollups, downsample
+from metrics_store import JOURNAL_COMPACT_LINES, MetricsStore, metrics_store
+from routes.bandwidth import SAMPLE_INTERVAL_SECONDS, bandwidth_sampler, register_bandwidth_socket_events
+from routes.bandwidth_api import bandwidth_api_bp
+
+
+def verify_column_ring() -> None:
+    ring = ColumnRing(BANDWIDTH_FIELDS, 4)
+    for ts in range(1, 7):
+        ring.append({"ts": ts, "upload": ts * 10, "download": "bad"})
+    assert len(ring) == 4 and ring.row(0)["ts"] == 3, "The oldest rows are overwritten"
+    assert ring.latest() == {"ts": 6.0, "upload": 60.0, "download": 0.0, "ping": 0.0}
+    window = ring.window(4, 5.5)
+    assert [row["ts"] for row in window] == [4.0, 5.0]
+    assert len(window.segments("ts")) == 2, "A wrapped range is two views, not a copy"
+    assert list(ring.tail(2).values("upload")) == [50.0, 60.0]
+    assert ring.drop_before(5) == 2 and ring.row(0)["ts"] == 5
+    ring.resize(8)
+    assert [row["ts"] for row in ring.window()] == [5.0, 6.0] and ring.capacity == 8
+
+
+def verify_history_queries() -> None:
+    buckets = downsample([
+        {"ts": 100, "upload": 1, "download": 4, "ping": 10},
+        {"ts": 105, "upload": 3, "download": 2, "ping": -1},
+        {"ts": 110, "upload": 5, "download": 0, "ping": 30},
+    ], 10)
+    assert [(bucket["ts"], bucket["count"]) for bucket in buckets] == [(100, 2), (110, 1)]
+    assert buckets[0]["upload"] == 2 and buckets[0]["upload_max"] == 3 and buckets[0]["ping"] == 10
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MetricsStore(local_file=Path(tmp_dir) / "store.json")
+        now = int(time.time())
+        for offset in range(7200, 0, -2):
+            store.add_bandwidth_point({"ts": now - offset, "upload": 1.0, "download": 2.0, "ping": 20})
+        ranged = store.query_bandwidth(now - 600, now, 10)
+        assert sum(bucket["count"] for bucket in ranged) == 300 and ranged[0]["ts"] % 10 == 0
+        minutes = store.query_bandwidth(now - 600, now, 60)
+        assert minutes and all(bucket["count"] == 30 for bucket in minutes), "Minute steps come from closed 1m rollups"
+        default = store.query_bandwidth()
+        assert default[0]["ts"] >= now - 3600 - 8, "Open-ended queries cover a bounded window"
+        assert len(default) <= 500 and "timestamp" in default[0]
+
+    api = Flask(__name__)
+    api.register_blueprint(bandwidth_api_bp, url_prefix="/api/bandwidth")
+    client = api.test_client()
+    assert client.get("/api/bandwidth/history?step=0").status_code == 400
+    assert client.get("/api/bandwidth/history?since=nan").status_code == 400
+
+
+def verify_rollups() -> None:
+    rollups = Rollups(retention_days=1)
+    closed = []
+    for index in range(90):
+        closed.extend(rollups.add({"ts": 60_000 + index * 2, "upload": index % 60, "download": 1.0, "ping": -1 if index % 30 == 0 else 20}))
+    minute_buckets = [bucket for tier, bucket in closed if tier.name == "1m"]
+    assert [bucket["ts"] for bucket in minute_buckets] == [60_000, 60_060]
+    assert all(bucket["count"] == 30 for bucket in minute_buckets)
+    assert minute_buckets[0]["upload_min"] == 0 and minute_buckets[0]["upload_max"] == 29
+    assert minute_buckets[0]["ping_min"] == 20, "Failed probes are left out of ping buckets"
+    assert rollups.tier_for(120).name == "1m" and rollups.tier_for(600).name == "5m" and rollups.tier_for(30) is None
+
+    # retention_days caps every tier; a bucket past it is pruned on the next close.
+    assert rollups.tier("1h").retention_seconds == 86400
+    later = 60_000 + 2 * 86400
+    rollups.add({"ts": later, "upload": 1})
+    rollups.add({"ts": later + 60, "upload": 1})
+    assert [row["ts"] for row in rollups.tier("1m").ring.window()] == [later]
+    rollups.configure(400, cleanup=False)
+    assert rollups.tier("1h").retention_seconds == 365 * 86400, "Without cleanup tiers keep their cap"
+
+
+def verify_redis_pipeline() -> None:
+    try:
+        import fakeredis
+        import redis
+    except ImportError:
+        print("Redis pipeline checks skipped: fakeredis is not installed")
+        return
+
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    pipelines = []
+    failing = False
+
+    class CountingClient(fakeredis.FakeRedis):
+        def pipeline(self, *args, **kwargs):
+            pipe = super().pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def counted_execute(*args, **kwargs):
+                if failing:
+                    raise redis.ConnectionError("Redis went away")
+                pipelines.append(len(pipe.command_stack))
+                return execute(*args, **kwargs)
+
+            pipe.execute = counted_execute
+            return pipe
+
+    from_url = redis.Redis.from_url
+    redis.Redis.from_url = lambda *args, **kwargs: CountingClient(server=server, decode_responses=True)
+    os.environ.update({"REDIS_URL": "redis://verify", "NETHAWK_REDIS_FLUSH_TICKS": "3", "NETHAWK_REDIS_FLUSH_SECONDS": "3600"})
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = MetricsStore(local_file=Path(tmp_dir) / "store.json")
+            assert store.get_persistence_mode() == "redis"
+            now = int(time.time())
+            del pipelines[:]
+            for tick in range(3):
+                store.add_bandwidth_point({"ts": now - 10 + tick, "upload": 1.0, "download": 2.0, "ping": 20})
+                store.flush()
+                if tick < 2:
+                    assert client.zcard("nethawk:bandwidth_series") == 0, "Samples are buffered between flushes"
+            assert client.zcard("nethawk:bandwidth_series") == 3
+            assert len(pipelines) == 1, "Three sampler ticks are one MULTI round trip"
+
+            store.add_bandwidth_point({"ts": now - 5, "upload": 1.0, "download": 2.0, "ping": 20})
+            failing = True
+            assert len(store.get_bandwidth_history()) == 3, "A failed flush must not fail the read"
+            failing = False
+            store.flush(force=True)
+            assert len(store.get_bandwidth_history()) == 4, "Writes from a failed flush stay queued"
+    finally:
+        redis.Redis.from_url = from_url
+        for name in ("REDIS_URL", "NETHAWK_REDIS_FLUSH_TICKS", "NETHAWK_REDIS_FLUSH_SECONDS"):
+            os.environ.pop(name, None)
+
+
+def verify_settings_snapshot() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MetricsStore(local_file=Path(tmp_dir) / "store.json")
+        store.set_settings({"network": {"latency_port": 53}})
+        seen = []
+        store.on_settings_change(seen.append)
+        version = int(store.get_settings_version())
+        settings = store.get_settings()
+        assert store.get_settings() is settings, "Reads share one cached snapshot"
+        for mutate in (lambda: settings.update(x=1), lambda: settings["network"].__setitem__("latency_port", 1)):
+            try:
+                mutate()
+            except TypeError:
+                continue
+            raise AssertionError("The settings snapshot must be read-only")
+
+        edited = copy.deepcopy(settings)
+        edited["network"]["latency_port"] = 443
+        saved = store.set_settings(edited)
+        assert int(store.get_settings_version()) == version + 1
+        assert seen == [saved] and store.get_settings()["network"]["latency_port"] == 443
+
+
+def verify_activity_journal() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_path = Path(tmp_dir) / "store.json"
+        store_path.write_text(json.dumps({"settings": {}, "activities": [{"id": "legacy", "message": "old"}]}))
+        store = MetricsStore(local_file=store_path)
+        journal = store_path.with_suffix(".activities.jsonl")
+        assert journal.exists() and store.get_activities()[0]["id"] == "legacy", "store.json activities migrate to the journal"
+
+        snapshot = store_path.read_text()
+        store.add_activity("system", "appended", "success")
+        assert store_path.read_text() == snapshot, "Activities never rewrite store.json"
+        assert json.loads(journal.read_text().splitlines()[-1])["message"] == "appended"
+
+        with journal.open("a", encoding="utf-8") as fh:
+            fh.write('{"id": "torn", "mess')
+        reloaded = MetricsStore(local_file=store_path)
+        assert [activity["message"] for activity in reloaded.get_activities()] == ["appended", "old"]
+
+        for index in range(JOURNAL_COMPACT_LINES):
+            reloaded.add_activity("system", f"event {index}")
+        assert len(journal.read_text().splitlines()) < JOURNAL_COMPACT_LINES, "A long journal is compacted"
+        assert reloaded.get_activities()[0]["message"] == f"event {JOURNAL_COMPACT_LINES - 1}"
+
+
+def verify_shared_sampler() -> None:
+    api = Flask(__name__)
+    socketio = SocketIO(api, async_mode="threading")
+    register_bandwidth_socket_events(socketio)
+    bandwidth_sampler.interval = 0.2
+    first, second = socketio.test_client(api), socketio.test_client(api)
+    try:
+        first.emit("start_bandwidth_monitor")
+        thread = bandwidth_sampler._thread
+        second.emit("start_bandwidth_monitor")
+        second.emit("start_bandwidth_monitor")
+        assert bandwidth_sampler._thread is thread, "Every client shares one sampler thread"
+        assert bandwidth_sampler.subscriber_count() == 2, "A repeated start does not subscribe twice"
+        time.sleep(0.7)
+        for client in (first, second):
+            assert any(message["name"] == "bandwidth_update" for message in client.get_received())
+
+        second.emit("stop_bandwidth_monitor")
+        second.get_received()
+        time.sleep(0.5)
+        assert not any(message["name"] == "bandwidth_update" for message in second.get_received())
+        assert any(message["name"] == "bandwidth_update" for message in first.get_received())
+        assert metrics_store.get_bandwidth_history(limit=1), "Every tick is stored"
+    finally:
+        bandwidth_sampler.stop()
+        bandwidth_sampler.interval = SAMPLE_INTERVAL_SECONDS
+
+
+def verify_latency_prober() -> None:
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        port = server.getsockname()[1]
+        settings = {"network": {"latency_target": "127.0.0.1", "latency_port": port, "probe_gateway": False, "probe_dns": False}}
+        prober = LatencyProber(lambda: settings, interval=0.1, jitter=0.2, timeout=0.5)
+        assert prober.latest() is None
+        prober.start()
+        try:
+            deadline = time.monotonic() + 3
+            while prober.latest() is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+            first = prober.latest()
+            assert first is not None and first["status"] == "ok" and first["port"] == port
+            while prober.latest() is first and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert prober.latest() is not first, "The prober keeps probing on its own schedule"
+        finally:
+            prober.stop()
+
+
+def verify_probe_targets() -> None:
+    settings = {"network": {
+        "latency_target": "10.0.0.1",
+        "probe_gateway": False,
+        "probe_dns": False,
+        "probe_targets": "1.1.1.1:443, ::1, 10.0.0.1",
+        "probe_samples": 50,
+    }}
+    assert [(target["name"], target["target"], target["port"]) for target in latency_targets(settings)] == [
+        ("primary", "10.0.0.1", 53), ("custom", "1.1.1.1", 443), ("custom", "::1", 53),
+    ]
+    assert probe_samples(settings) == 10
+
+    with socket.create_server(("127.0.0.1", 0)) as server, socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        listening, closed = server.getsockname()[1], unused.getsockname()[1]
+        started = time.perf_counter()
+        results = probe_targets([
+            {"name": "open", "target": "127.0.0.1", "port": listening},
+            {"name": "refused", "target": "127.0.0.1", "port": closed},
+            {"name": "unknown", "target": "no-such-host.invalid", "port": 80},
+        ], samples=3, timeout=1.0)
+    assert time.perf_counter() - started < 1.5, "All targets share one timeout window"
+    by_name = {result["name"]: result for result in results}
+    for name in ("open", "refused"):
+        assert by_name[name]["received"] == 3 and by_name[name]["loss_pct"] == 0, "A RST still answers the probe"
+        assert by_name[name]["min_ms"] <= by_name[name]["median_ms"] <= by_name[name]["p95_ms"]
+    assert by_name["unknown"]["loss_pct"] == 100 and by_name["unknown"]["error"]
+
+
+def verify_latency_cache() -> None:
+    worst_gap = PROBE_INTERVAL_SECONDS * (1 + PROBE_JITTER) + PROBE_TIMEOUT_SECONDS
+    assert LATENCY_CACHE_TTL_SECONDS > worst_gap, "Cached results must outlive the prober's longest gap"
+
+    probes = []
+
+    def slow_probe(targets, samples, timeout):
+        probes.append([target["target"] for target in targets])
+        time.sleep(0.2)
+        return [{**target, "latency_ms": 1.0, "status": "ok"} for target in targets]
+
+    target = {"name": "primary", "target": "192.0.2.1", "port": 53}
+    cache = LatencyCache(ttl=60)
+    original = latency_module.probe_targets
+    latency_module.probe_targets = slow_probe
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda: results.extend(cache.measure([target]))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert probes == [["192.0.2.1"]], "Concurrent callers share one probe"
+        assert len(results) == 4 and all(result["latency_ms"] == 1.0 for result in results)
+        assert cache.measure([target])[0]["cached"] is True
+        assert cache.measure([target], force=True)[0]["cached"] is False and len(probes) == 2
+    finally:
+        latency_module.probe_targets = original
+
+
+class FakeJob:
+    def __init__(self, job_id: str) -> None:
+        self.id = job_id
+        self.status = "queued"
+        self.finished = False
+
+
+def verify_scheduler() -> None:
+    assert parse_schedule("every 6h").seconds == 6 * 3600
+    assert parse_schedule("30m").seconds == 1800
+    for bad in ("30s", "1m 2", "* * *", "61 * * * *", "*/0 * * * *", "0 0 32 * *"):
+        try:
+            parse_schedule(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad!r} should be rejected")
+
+    start = datetime(2026, 1, 31, 23, 59, 30).timestamp()
+    assert datetime.fromtimestamp(parse_schedule("@hourly").next_after(start)) == datetime(2026, 2, 1, 0, 0)
+    assert datetime.fromtimestamp(parse_schedule("0 0 29 2 *").next_after(start)) == datetime(2028, 2, 29, 0, 0)
+    # Day-of-month and weekday both restricted: either one matches.
+    assert datetime.fromtimestamp(parse_schedule("0 9 15 * 1").next_after(start)) == datetime(2026, 2, 2, 9, 0)
+    never = ScheduledScan(0, {"target": "10.0.0.1", "ports": "22", "schedule": "0 0 31 2 *"})
+    assert never.spec is None and "never fires" in never.error
+
+    settings = {"scans": {"max_running": 1, "schedules": [
+        {"id": "late", "target": "10.0.0.2", "ports": "22", "schedule": "10m"},
+        {"id": "early", "target": "10.0.0.3", "ports": "22", "schedule": "5m"},
+        {"id": "never", "target": "10.0.0.4", "ports": "22", "schedule": "0 0 31 2 *"},
+    ]}}
+    jobs = {}
+
+    def submit(scan: ScheduledScan) -> FakeJob:
+        jobs[scan.id] = FakeJob(scan.id)
+        return jobs[scan.id]
+
+    scheduler = ScanScheduler(lambda: settings)
+    scheduler.submit = submit
+    assert scheduler.run_pending(1000.0) == ["late"], "Capacity is one scan at a time"
+    assert scheduler.run_pending(1400.0) == [], "Nothing may start while the slot is taken"
+    jobs["late"].finished = True
+    assert scheduler.run_pending(1400.0) == ["early"], "The longest-overdue schedule gets the free slot"
+    assert scheduler.run_pending(1700.0) == []
+    status = {item["id"]: item for item in scheduler.status()}
+    assert status["early"]["skipped_runs"] == 1, "A run due while the previous one is active is skipped"
+    assert status["never"]["error"] and status["never"]["next_run"] is None
 
 
 def main() -> int:
+    verify_column_ring()
+    verify_history_queries()
+    verify_rollups()
+    verify_redis_pipeline()
+    verify_settings_snapshot()
+    verify_activity_journal()
+    verify_shared_sampler()
+    verify_latency_prober()
+    verify_probe_targets()
+    verify_latency_cache()
+    verify_scheduler()
+
     with tempfile.TemporaryDirectory() as tmp_dir:
         store_path = Path(tmp_dir) / "store.json"
 
@@ -32,6 +400,22 @@ def main() -> int:
         assert reloaded.get_settings()["network"]["latency_target"] == "8.8.8.8"
         assert reloaded.get_activities()[0]["message"] == "verification event"
 
+        sqlite_store = MetricsStore(local_file=store_path, persistence="sqlite")
+        # Recent enough to survive the history retention window on reload.
+        point_ts = int(time.time()) - 60
+        sqlite_store.add_bandwidth_point({"ts": point_ts, "upload": 1.5, "download": 3.0, "ping": 20})
+        sqlite_store.add_activity("scan", "scan event", "success", open_ports=[22])
+        sqlite_store.close()
+
+        sqlite_reloaded = MetricsStore(local_file=store_path, persistence="sqlite")
+        assert sqlite_reloaded.get_persistence_mode() == "sqlite"
+        assert sqlite_reloaded.find_activities("scan", require="open_ports")[0]["open_ports"] == [22]
+        history = sqlite_reloaded.get_bandwidth_history()
+        assert [(point["ts"], point["upload"]) for point in history] == [(point_ts, 1.5)]
+        queried = sqlite_reloaded.query_bandwidth(point_ts - 1, point_ts + 1)
+        assert [point["download"] for point in queried] == [3.0]
+        sqlite_reloaded.close()
+
     latency = measure_latency(timeout=0.75)
     assert set(["latency_ms", "target", "status", "error"]).issubset(latency.keys())
     assert latency["status"] in {"ok", "degraded", "unavailable"}
@@ -0,0 +1,402 @@
+import asyncio
+from contextlib import closing
+import io
+import json
+import os
+from pathlib import Path
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Scans record their results in the shared store; keep them out of the
+# checkout's .nethawk/ directory.
+STORE_DIR = tempfile.TemporaryDirectory()
+os.environ["NETHAWK_LOCAL_STORE"] = str(Path(STORE_DIR.name) / "store.json")
+
+from core import async_scan
+from core.async_scan import RttEstimator, iter_native_scan
+from core.fingerprint import describe, grab_banner, identify
+from core.nmap_xml import iter_nmap_events
+from core.port_scan import iter_local_port_scan, iter_nmap_lines, nmap_command, nmap_rate_args, parse_ports, scan_settings
+from core.portset import PortSet
+from core.rate_control import RateController
+from core.scan_jobs import ScanJob, ScanJobManager
+from core.scan_results import MAX_TARGETS, TARGET_RETENTION_SECONDS, ScanResults
+from core.targets import discover_hosts, parse_targets
+from metrics_store import MetricsStore
+
+NATIVE = {"advanced": {"scan_engine": "native", "banner_grab": False, "scan_retries": 0}}
+# Trimmed `nmap -sT -oX - --stats-every 2s` output: one finished host and
+# one nmap gave up on at --host-timeout.
+NMAP_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<nmaprun scanner="nmap" args="nmap -sT -oX -" start="1" version="7.94">
+<scaninfo type="connect" protocol="tcp" numservices="1000" services="1-1000"/>
+<taskbegin task="Connect Scan" time="1"/>
+<taskprogress task="Connect Scan" time="3" percent="42.50" remaining="3" etc="6"/>
+<taskend task="Connect Scan" time="5"/>
+<host starttime="1" endtime="5"><status state="up" reason="user-set"/>
+<address addr="10.0.0.1" addrtype="ipv4"/>
+<address addr="00:11:22:33:44:55" addrtype="mac"/>
+<ports><extraports state="filtered" count="997">
+<extrareasons reason="no-response" count="997"/>
+</extraports>
+<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/><service name="ssh" product="OpenSSH" version="9.6" method="probed"/></port>
+<port protocol="tcp" portid="80"><state state="closed" reason="conn-refused"/><service name="http" method="table"/></port>
+<port protocol="tcp" portid="6379"><state state="open" reason="syn-ack"/><service name="redis" method="table"/></port>
+</ports>
+</host>
+<host starttime="2" endtime="9" timedout="true"><status state="up" reason="user-set"/>
+<address addr="10.0.0.2" addrtype="ipv4"/>
+</host>
+<runstats><finished time="9" elapsed="8.00" summary="2 IP addresses (2 hosts up) scanned" exit="success"/>
+<hosts up="2" down="0" total="2"/>
+</runstats>
+</nmaprun>
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(greeting: bytes = b"", reply: bytes = b"") -> socket.socket:
+    """Local service that sends ``greeting`` on connect and ``reply`` to any request."""
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def handle(conn: socket.socket) -> None:
+        with conn:
+            if greeting:
+                conn.sendall(greeting)
+            conn.settimeout(2)
+            try:
+                if conn.recv(1024) and reply:
+                    conn.sendall(reply)
+            except OSError:
+                pass
+
+    def accept() -> None:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server
+
+
+def final_result(events) -> dict:
+    result = None
+    for kind, data in events:
+        if kind == "result":
+            result = data
+    assert result is not None, "Every scan ends with a result"
+    return result
+
+
+def verify_native_scan() -> None:
+    estimator = RttEstimator(initial=1.0, minimum=0.1)
+    assert estimator.timeout() == 1.0
+    for _ in range(20):
+        estimator.update(0.01)
+    assert 0.1 <= estimator.timeout() < 0.2, "Answered connects shrink the connect timeout"
+
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        listening, closed = server.getsockname()[1], free_port()
+        rows = list(iter_native_scan("127.0.0.1", f"{listening},{closed}", retries=0))
+        assert {row["port"]: row["state"] for row in rows} == {listening: "open", closed: "closed"}
+
+        events = list(iter_local_port_scan("127.0.0.1", f"{listening},{closed}", NATIVE))
+        assert [data["port"] for kind, data in events if kind == "row"] == [listening], "Open ports stream as rows"
+        result = final_result(events)
+        assert result["status"] == "completed" and result["engine"] == "native"
+        assert result["open_ports"] == [listening] and result["scanned_ports"] == ",".join(map(str, sorted((listening, closed))))
+
+        stop = threading.Event()
+        stop.set()
+        assert final_result(iter_local_port_scan("127.0.0.1", "1-2000", NATIVE, stop_event=stop))["status"] == "stopped"
+
+    # Slow every connect down so the 5 s host deadline cuts the scan short.
+    open_connection = async_scan.asyncio.open_connection
+
+    async def slow_connection(*args, **kwargs):
+        await asyncio.sleep(0.3)
+        return await open_connection(*args, **kwargs)
+
+    async_scan.asyncio.open_connection = slow_connection
+    try:
+        settings = {"advanced": {**NATIVE["advanced"], "scan_timeout": 5, "scan_threads": 4}}
+        result = final_result(iter_local_port_scan("127.0.0.1", "1-200", settings))
+    finally:
+        async_scan.asyncio.open_connection = open_connection
+    assert result["status"] == "partial", "A deadline-cut scan is not reported as completed"
+    assert result["scanned_ports"] and result["scanned_ports"] != "1-200", "Only ports that returned a state are listed"
+
+
+def verify_nmap_streaming() -> None:
+    command = nmap_command(["10.0.0.1"], "22,80", scan_settings({}))
+    assert command[command.index("-oX") + 1] == "-" and "--stats-every" in command
+
+    consumed = []
+
+    def lines():
+        for line in NMAP_XML.splitlines(keepends=True):
+            consumed.append(line)
+            yield line
+
+    seen = []
+    for kind, data in iter_nmap_events(lines()):
+        seen.append((kind, len(consumed)))
+    total = len(NMAP_XML.splitlines())
+    first_progress = next(count for kind, count in seen if kind == "progress")
+    first_host = next(count for kind, count in seen if kind == "host")
+    assert first_progress < first_host < total, "Events are yielded while the document is still being read"
+    first_port = next(count for kind, count in seen if kind == "port")
+    assert first_port < first_host, "Ports are yielded as parsed, not when their host closes"
+
+    # A killed nmap leaves the document unterminated.
+    truncated = NMAP_XML[:NMAP_XML.index("<host starttime=\"2\"")]
+    assert [kind for kind, _ in iter_nmap_events([truncated])].count("host") == 1
+
+    stop = threading.Event()
+    stream = io.StringIO(NMAP_XML)
+    read = []
+    for line in iter_nmap_lines(stream, stop):
+        read.append(line)
+        stop.set()
+    assert len(read) == 1, "A stop request ends the read at the next line"
+
+
+def verify_scan_jobs() -> None:
+    release = threading.Event()
+    started = []
+
+    def runner(job: ScanJob) -> str:
+        started.append(job.host)
+        if job.host == "partial":
+            return "partial"
+        while not release.is_set() and not job.stop_event.is_set():
+            time.sleep(0.01)
+        return "stopped" if job.stop_event.is_set() else "completed"
+
+    manager = ScanJobManager(runner, max_workers=1)
+    running = manager.submit("alice", "first", "22")
+    low = manager.submit("bob", "low", "22", priority=-5)
+    high = manager.submit("bob", "high", "22")
+    mine = manager.submit("alice", "mine", "22")
+    assert manager.counts() == {"running": 1, "queued": 3, "max_workers": 1}
+    assert [manager.queue_position(job.id) for job in (high, mine, low)] == [1, 2, 3], "Higher priority first, FIFO within one"
+
+    assert not manager.cancel(mine.id, owner="bob"), "Clients cannot stop each other's jobs"
+    assert manager.cancel(mine.id, owner="alice") and mine.status == "stopped"
+    assert manager.cancel_owner("alice") == 1 and running.stop_event.is_set()
+
+    partial = manager.submit("carol", "partial", "22", priority=-9)
+    release.set()
+    deadline = time.monotonic() + 5
+    while not all(job.finished for job in (running, high, low, partial)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert started == ["first", "high", "low", "partial"]
+    assert (running.status, high.status, partial.status, low.status) == ("stopped", "completed", "partial", "completed")
+
+
+def verify_targets() -> None:
+    assert parse_targets("192.168.1.0/30") == ["192.168.1.1", "192.168.1.2"]
+    assert parse_targets("10.0.0.254-10.0.1.1, 10.0.0.255 host.lan") == ["10.0.0.254", "10.0.0.255", "10.0.1.0", "10.0.1.1", "host.lan"]
+    assert parse_targets("10.0.0.5-7") == ["10.0.0.5", "10.0.0.6", "10.0.0.7"]
+    assert len(parse_targets("10.0.0.0/22")) == 1022
+    for bad in ("", "192.168.1.300", "10.0.0.9-3", "10.0.0.0/21", "bad_host!"):
+        try:
+            parse_targets(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad!r} should be rejected")
+
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        listening = server.getsockname()[1]
+        found = list(discover_hosts(["127.0.0.1", "no-such-host.invalid"], ports=(listening, free_port()), timeout=1.0))
+    assert [(item["host"], item["up"]) for item in found] == [("127.0.0.1", True), ("no-such-host.invalid", False)]
+    assert found[0]["latency_ms"] is not None and found[1]["latency_ms"] is None
+
+
+def verify_scan_results() -> None:
+    results = ScanResults()
+    first = results.record("host", PortSet.from_spec("1-1000"), {22: "open", 80: "open"}, default_state="closed", now=1000)
+    assert first["opened"] == [22, 80] and first["closed"] == []
+
+    # A scan cut short reported states for ports 1-10 only; the rest of the
+    # requested range was never observed and must not be diffed as closed.
+    partial = results.record("host", PortSet.from_spec("1-1000"), {port: "closed" for port in range(1, 11)}, now=1100)
+    assert partial["opened"] == [] and partial["closed"] == []
+    assert results.open_ports("host") == [22, 80]
+
+    narrowed = results.record("host", PortSet(range(1, 11)), {}, default_state="closed", now=1200)
+    assert narrowed["closed"] == [] and results.open_ports("host") == [22, 80]
+
+    full = results.record("host", PortSet.from_spec("1-1000"), {22: "open"}, default_state="closed", now=1300)
+    assert full["opened"] == [] and full["closed"] == [80]
+    assert results.open_ports("host") == [22]
+    assert results.recently_closed("host", PortSet.from_spec("1-100"), max_age=600, now=1300) == PortSet.from_spec("1-21,23-100")
+
+    # Filtered ports are kept as ranges, not one entry per port.
+    results.record("filtered", PortSet.from_spec("1-65535"), {443: "open"}, default_state="filtered", now=1300)
+    record = results.get("filtered")
+    assert list(record["ports"]) == ["443"] and record["ranges"] == {"filtered": "1-442,444-65535"}
+    assert len(json.dumps(record)) < 2000
+    results.record("filtered", PortSet([80]), {80: "open"}, now=1400)
+    assert results.get("filtered")["ranges"]["filtered"] == "1-79,81-442,444-65535"
+
+    for index in range(MAX_TARGETS + 5):
+        results.record(f"10.1.{index // 256}.{index % 256}", PortSet([22]), {22: "open"}, now=2000 + index)
+    dropped = results.prune(now=3000)
+    assert len(results.records) == MAX_TARGETS and {"host", "filtered"} <= set(dropped)
+    assert results.prune(now=2000 + TARGET_RETENTION_SECONDS + MAX_TARGETS + 10) and not results.records
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MetricsStore(local_file=Path(tmp_dir) / "store.json", persistence="sqlite")
+        store.record_scan("10.0.0.1", PortSet.from_spec("1-1024"), {22: "open"}, default_state="closed")
+        store.record_scan("10.0.0.2", PortSet.from_spec("1-1024"), {}, default_state="filtered")
+        store.close()
+        reopened = MetricsStore(local_file=Path(tmp_dir) / "store.json", persistence="sqlite")
+        assert reopened.get_scan_result("10.0.0.1")["open_ports"] == [22]
+        reopened.close()
+        with closing(sqlite3.connect(Path(tmp_dir) / "nethawk.db")) as db:
+            assert db.execute("SELECT COUNT(*) FROM scan_results").fetchone()[0] == 2, "One SQLite row per target"
+
+
+def verify_port_sets() -> None:
+    ports = PortSet.from_spec("80, 22,1000-1002,bad,70000,5-3")
+    assert ports.to_spec() == "22,80,1000-1002"
+    assert len(ports) == 5 and 1001 in ports and 23 not in ports
+    assert (ports - PortSet([80, 1001])).to_spec() == "22,1000,1002"
+    assert (ports & PortSet.from_spec("1-100")) == PortSet([22, 80])
+    assert (ports | PortSet([23])).ranges() == [(22, 23), (80, 80), (1000, 1002)]
+    assert PortSet.from_spec("1-65535").to_spec() == "1-65535" and not PortSet.from_spec("0-70000")
+    assert not PortSet.from_spec("") and PortSet.coerce([22]) == PortSet.coerce("22")
+    assert parse_ports("443,80,80,22-23") == "22-23,80,443"
+
+
+def verify_fingerprints() -> None:
+    assert identify(b"SSH-2.0-OpenSSH_9.6\r\n")["product"] == "OpenSSH_9.6"
+    assert identify(b"HTTP/1.1 200 OK\r\nDate: x\r\nServer: nginx/1.25\r\n\r\n") == {"service": "http", "product": "nginx/1.25", "banner": "HTTP/1.1 200 OK"}
+    assert identify(b"220 mail.example ESMTP Postfix\r\n")["service"] == "smtp"
+    assert identify(b"220 (vsFTPd 3.0.5)\r\n")["service"] == "ftp"
+    assert identify(b"\x00\x01garbage")["service"] == "" and identify(b"") == {}
+
+    ssh = serve(greeting=b"SSH-2.0-OpenSSH_9.6\r\n")
+    redis_like = serve(reply=b"-ERR unknown command 'HEAD'\r\n")
+    try:
+        ssh_port, redis_port = ssh.getsockname()[1], redis_like.getsockname()[1]
+        assert asyncio.run(grab_banner("127.0.0.1", ssh_port))["service"] == "ssh", "Services that speak first are read passively"
+        assert asyncio.run(grab_banner("127.0.0.1", redis_port))["service"] == "redis", "Silent services are probed"
+
+        rows = {row["port"]: row for row in iter_native_scan("127.0.0.1", PortSet([ssh_port, redis_port]), retries=0, banner_grab=True)}
+        assert rows[redis_port]["fingerprint"] == "redis" and rows[redis_port]["risk"] == "critical", "Risk follows the identified service"
+        assert rows[ssh_port]["product"] == "OpenSSH_9.6"
+    finally:
+        ssh.close()
+        redis_like.close()
+    assert describe({"service": "ssh", "product": "OpenSSH_9.6"}) == "ssh (OpenSSH_9.6)"
+
+
+def verify_rate_controller() -> None:
+    async def run() -> RateController:
+        control = RateController(max_window=16)
+        for _ in range(8):
+            await control.release(await control.acquire(), answered=True)
+        grown = control.window
+        assert grown > 4, "Answered probes should grow the window"
+        tickets = [await control.acquire() for _ in range(3)]
+        for ticket in tickets:
+            await control.release(ticket, answered=True, dropped=True)
+        assert control.decreases == 1, "Drops from one round are one congestion event"
+        assert control.window == grown / 2
+        for _ in range(50):
+            await control.release(await control.acquire(), answered=True)
+        assert control.window <= control.max_window
+        return control
+
+    assert asyncio.run(run()).stats()["drops"] == 3
+
+    async def paced() -> float:
+        control = RateController(max_window=16, max_pps=50)
+        started = time.monotonic()
+        for _ in range(11):
+            await control.release(await control.acquire(), answered=True)
+        return time.monotonic() - started
+
+    assert asyncio.run(paced()) >= 0.19, "max_pps spaces out connect attempts"
+    assert nmap_rate_args({"threads": 20, "max_pps": 0}) == ["--max-parallelism", "20"]
+    assert nmap_rate_args({"threads": 20, "max_pps": 500}) == ["--max-parallelism", "20", "--max-rate", "500"]
+
+
+def verify_nmap_parser() -> None:
+    events = list(iter_nmap_events([NMAP_XML]))
+    ports = {data["port"]: data for kind, data in events if kind == "port"}
+    assert ports[22] == {"host": "10.0.0.1", "port": 22, "protocol": "tcp", "state": "open", "service": "ssh", "product": "OpenSSH", "version": "9.6"}
+    assert ports[80]["state"] == "closed" and ports[6379]["service"] == "redis"
+    assert [data for kind, data in events if kind == "extraports"] == [{"host": "10.0.0.1", "state": "filtered", "count": 997}]
+    hosts = [data for kind, data in events if kind == "host"]
+    assert hosts == [
+        {"host": "10.0.0.1", "status": "up", "timed_out": False},
+        {"host": "10.0.0.2", "status": "up", "timed_out": True},
+    ], "The MAC address does not replace the host's IP"
+    assert events[-1] == ("finished", {"time": "9", "elapsed": "8.00", "summary": "2 IP addresses (2 hosts up) scanned", "exit": "success"})
+
+    # End to end through a stand-in nmap that prints a recorded document.
+    with tempfile.TemporaryDirectory() as bin_dir:
+        finished = Path(bin_dir) / "finished.xml"
+        finished.write_text(NMAP_XML.replace('timedout="true"', ""))
+        partial = Path(bin_dir) / "partial.xml"
+        partial.write_text(NMAP_XML)
+        fake = Path(bin_dir) / "nmap"
+        fake.write_text('#!/bin/sh\ncat "$NMAP_VERIFY_XML"\n')
+        fake.chmod(0o755)
+        path = os.environ["PATH"]
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{path}"
+        try:
+            settings = {"advanced": {"scan_engine": "nmap"}}
+            os.environ["NMAP_VERIFY_XML"] = str(finished)
+            events = list(iter_local_port_scan("10.0.0.1", "1-1000", settings))
+            os.environ["NMAP_VERIFY_XML"] = str(partial)
+            cut_short = final_result(iter_local_port_scan("10.0.0.1", "1-1000", settings))
+        finally:
+            os.environ["PATH"] = path
+            os.environ.pop("NMAP_VERIFY_XML", None)
+    rows = [data for kind, data in events if kind == "row"]
+    assert [(row["port"], row["state"]) for row in rows] == [(22, "open"), (80, "closed"), (6379, "open")]
+    assert rows[2]["risk"] == "critical"
+    result = final_result(events)
+    assert result["status"] == "completed" and result["engine"] == "nmap"
+    assert result["open_ports"] == [22, 6379] and result["scanned_ports"] == "1-1000"
+    assert cut_short["status"] == "partial" and cut_short["scanned_ports"] == "", "Ports of a host nmap gave up on are not recorded"
+    assert "nmap" not in sys.modules, "python-nmap stays out of the scan path"
+
+
+def main() -> int:
+    verify_native_scan()
+    verify_nmap_streaming()
+    verify_scan_jobs()
+    verify_targets()
+    verify_scan_results()
+    verify_port_sets()
+    verify_fingerprints()
+    verify_rate_controller()
+    verify_nmap_parser()
+
+    print("Scanning verification passed")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
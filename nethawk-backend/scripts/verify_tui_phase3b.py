@@ -1,14 +1,23 @@
 import asyncio
+import os
 from pathlib import Path
+import socket
 import sys
+import tempfile
 
 
 BACKEND_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BACKEND_DIR))
 
+# The TUI saves settings through the shared store; keep them out of the
+# checkout's .nethawk/ directory.
+STORE_DIR = tempfile.TemporaryDirectory()
+os.environ["NETHAWK_LOCAL_STORE"] = str(Path(STORE_DIR.name) / "store.json")
+
 from textual.widgets import Input
 
 from core.port_scan import parse_ports, risk_for_port
+from metrics_store import metrics_store
 from nethawk_tui.app import NetHawkTUI
 
 
@@ -46,11 +55,51 @@ async def verify_tui() -> None:
         assert "saved" in app.last_message.lower()
 
 
+async def wait_for_scan(app: NetHawkTUI, pilot, seconds: float = 15) -> None:
+    for _ in range(int(seconds / 0.05)):
+        if not app.scan_running:
+            return
+        await pilot.pause(0.05)
+    raise AssertionError("TUI scan did not finish")
+
+
+async def verify_tui_scan() -> None:
+    metrics_store.set_settings({"advanced": {"scan_engine": "native", "banner_grab": False, "scan_retries": 0}})
+    app = NetHawkTUI()
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        listening = server.getsockname()[1]
+        async with app.run_test() as pilot:
+            await pilot.press("s")
+            await pilot.pause(0.1)
+            app.query_one("#scan_target", Input).value = "127.0.0.1"
+            app.query_one("#scan_ports", Input).value = f"{listening},{listening + 1}"
+            app.start_scan()
+            await wait_for_scan(app, pilot)
+            assert app.scan_state["status"] == "completed", app.scan_state
+            assert app.scan_state["open_ports"] == [listening]
+            assert metrics_store.get_scan_result("127.0.0.1")["open_ports"] == [listening], "Finished TUI scans are recorded"
+
+            # A long scan runs in a worker: the UI keeps responding and Esc stops it.
+            app.query_one("#scan_ports", Input).value = "1-65535"
+            app.start_scan()
+            await pilot.pause(0.3)
+            assert app.scan_running
+            await pilot.press("d")
+            await pilot.pause(0.1)
+            assert app.active_screen == "dashboard"
+            await pilot.press("s")
+            await pilot.pause(0.1)
+            await pilot.press("escape")
+            await wait_for_scan(app, pilot)
+            assert app.scan_state["status"] == "stopped", app.scan_state
+
+
 def main() -> int:
     assert parse_ports("22,80,1-3,bad") == "1-3,22,80"
     assert risk_for_port(3389) == "critical"
     assert risk_for_port(22) == "warning"
     asyncio.run(verify_tui())
+    asyncio.run(verify_tui_scan())
     print("Phase 3B TUI verification passed")
     return 0
 
@@ -0,0 +1,179 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bandwidth (
+    ts REAL NOT NULL,
+    upload REAL NOT NULL,
+    download REAL NOT NULL,
+    ping REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bandwidth_ts ON bandwidth (ts);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    tier TEXT NOT NULL,
+    ts REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (tier, ts)
+);
+
+CREATE TABLE IF NOT EXISTS activities (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_activities_type_status_ts ON activities (type, status, timestamp);
+CREATE INDEX IF NOT EXISTS idx_activities_ts ON activities (timestamp);
+
+CREATE TABLE IF NOT EXISTS scan_results (
+    target TEXT PRIMARY KEY,
+    updated_at INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SQLiteBackend:
+    """
+    SQLite persistence for MetricsStore. The store keeps serving hot reads
+    from memory; this class only writes through and answers the queries that
+    benefit from indexes (history reload, filtered activity lookups).
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def insert_bandwidth(self, points: list[dict]) -> None:
+        rows = [
+            (point.get("ts", 0), point.get("upload", 0), point.get("download", 0), point.get("ping", -1))
+            for point in points
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO bandwidth (ts, upload, download, ping) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def insert_rollups(self, buckets: list[tuple[str, dict]]) -> None:
+        rows = [(tier, bucket["ts"], json.dumps(bucket)) for tier, bucket in buckets]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rollups (tier, ts, payload) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def load_bandwidth(self, since: float) -> list[dict]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT ts, upload, download, ping FROM bandwidth WHERE ts >= ? ORDER BY ts",
+                (since,),
+            )
+            return [dict(row) for row in cursor]
+
+    def load_rollups(self, tier: str, since: float) -> list[dict]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT payload FROM rollups WHERE tier = ? AND ts >= ? ORDER BY ts",
+                (tier, since),
+            )
+            return [json.loads(row["payload"]) for row in cursor]
+
+    def prune(self, bandwidth_before: float, rollup_before: dict[str, float], activities_before: float | None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bandwidth WHERE ts < ?", (bandwidth_before,))
+            for tier, before in rollup_before.items():
+                self._conn.execute("DELETE FROM rollups WHERE tier = ? AND ts < ?", (tier, before))
+            if activities_before is not None:
+                self._conn.execute("DELETE FROM activities WHERE timestamp < ?", (activities_before,))
+
+    def insert_activity(self, activity: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO activities (id, type, status, timestamp, payload) VALUES (?, ?, ?, ?, ?)",
+                (
+                    activity["id"],
+                    activity["type"],
+                    activity["status"],
+                    activity["timestamp"],
+                    json.dumps(activity),
+                ),
+            )
+
+    def find_activities(
+        self,
+        activity_type: str | None = None,
+        status: str | None = None,
+        require: str | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        clauses = []
+        params: list[object] = []
+        if activity_type is not None:
+            clauses.append("type = ?")
+            params.append(activity_type)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if require is not None:
+            clauses.append("json_extract(payload, ?) IS NOT NULL")
+            params.append(f"$.{require}")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT payload FROM activities {where} ORDER BY timestamp DESC, seq DESC LIMIT ?",
+                params,
+            )
+            return [json.loads(row["payload"]) for row in cursor]
+
+    def load_scan_records(self) -> dict[str, dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT target, payload FROM scan_results")
+            return {row["target"]: json.loads(row["payload"]) for row in cursor}
+
+    def save_scan_record(self, target: str, record: dict, dropped: list[str] = ()) -> None:
+        """Writes one target's record, and removes dropped targets, in one transaction."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scan_results (target, updated_at, payload) VALUES (?, ?, ?)",
+                (target, record.get("updated_at", 0), json.dumps(record)),
+            )
+            self._conn.executemany("DELETE FROM scan_results WHERE target = ?", [(name,) for name in dropped])
+
+    def get_value(self, key: str) -> object | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def delete_value(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def set_value(self, key: str, value: object) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                (key, json.dumps(value)),
+            )